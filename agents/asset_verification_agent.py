@@ -6,11 +6,9 @@ from agno.tools.baidusearch import BaiduSearchTools
 from agno.tools.website import WebsiteTools
 from agno.tools.reasoning import ReasoningTools
 from agno.media import Image
-from agno.memory.v2.db.sqlite import SqliteMemoryDb
-from agno.memory.v2.memory import Memory
-from agno.storage.sqlite import SqliteStorage
 from textwrap import dedent
 from config import get_ai_model
+from agents.storage_provider import get_memory, get_storage
 import os
 
 
@@ -18,9 +16,8 @@ def get_asset_verification_agent() -> Agent:
     """Create and return the asset verification agent."""
     
     # Initialize shared memory and storage (consistent with RWA team)
-    memory_db = SqliteMemoryDb(table_name="rwa_memory", db_file="storage/rwa_memory.db")
-    memory = Memory(db=memory_db)
-    storage = SqliteStorage(table_name="rwa_sessions", db_file="storage/rwa_storage.db")
+    memory = get_memory("rwa_memory")
+    storage = get_storage("rwa_sessions")
     
     agent = Agent(
         name="Asset Verification Agent",
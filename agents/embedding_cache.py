@@ -0,0 +1,176 @@
+"""Persistent embedding cache for the knowledge embedders
+
+按 (模型ID:维度, 文本SHA-256) 在SQLite中缓存嵌入向量（float32二进制），未变化的法规页面和重复的合规问题
+不再调用嵌入接口；条目数超过上限时按最近使用时间淘汰最旧的条目。
+条目数由触发器维护在 embedding_stats 表中，构建脚本和各Agent进程看到的是同一个计数。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from agno.embedder.base import Embedder
+
+EMBEDDING_CACHE_DB_FILE = "storage/knowledge/embedding_cache.db"
+# 缓存条目上限（0表示不使用缓存）
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# 超过上限时一次淘汰到上限的90%，避免之后每次写入都触发淘汰
+EMBEDDING_CACHE_EVICT_FRACTION = 0.1
+# 命中时只在 last_used 早于该秒数时才回写，避免每次命中都产生一次写事务（淘汰只需要粗粒度的使用时间）
+EMBEDDING_CACHE_TOUCH_INTERVAL = float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", "3600"))
+
+_caches: Dict[str, "EmbeddingCache"] = {}
+_lock = threading.Lock()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite嵌入缓存，带命中率统计和按最近使用时间的容量淘汰"""
+
+    def __init__(self, db_file: str = EMBEDDING_CACHE_DB_FILE, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            );
+            CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+            CREATE TABLE IF NOT EXISTS embedding_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                entries INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO embedding_stats (id, entries) SELECT 1, COUNT(*) FROM embeddings;
+            CREATE TRIGGER IF NOT EXISTS embeddings_count_insert AFTER INSERT ON embeddings
+            BEGIN UPDATE embedding_stats SET entries = entries + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS embeddings_count_delete AFTER DELETE ON embeddings
+            BEGIN UPDATE embedding_stats SET entries = entries - 1 WHERE id = 1; END;
+            COMMIT;
+        """)
+        self.metrics = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = (model, text_hash(text))
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT vector, last_used FROM embeddings WHERE model = ? AND text_hash = ?", key
+            ).fetchone()
+            if row is None:
+                self.metrics["misses"] += 1
+                return None
+            self.metrics["hits"] += 1
+            now = time.time()
+            if now - row[1] > EMBEDDING_CACHE_TOUCH_INTERVAL:
+                with self.conn:
+                    self.conn.execute(
+                        "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?", (now, *key)
+                    )
+        vector = array("f")
+        vector.frombytes(row[0])
+        return vector.tolist()
+
+    def put(self, model: str, text: str, embedding: List[float]) -> None:
+        with self.lock, self.conn:
+            # Another thread may have cached the same text meanwhile; keep its entry
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                (model, text_hash(text), array("f", embedding).tobytes(), time.time()),
+            )
+            if cursor.rowcount:
+                self.metrics["writes"] += 1
+                entries = self._count_entries()
+                if entries > self.max_entries:
+                    self._evict(entries)
+
+    def _count_entries(self) -> int:
+        """所有进程共享的条目数（调用方持有锁）"""
+        return self.conn.execute("SELECT entries FROM embedding_stats WHERE id = 1").fetchone()[0]
+
+    def _evict(self, entries: int) -> None:
+        """删除最久未使用的条目（调用方持有锁，并在写事务中）"""
+        target = int(self.max_entries * (1 - EMBEDDING_CACHE_EVICT_FRACTION))
+        cursor = self.conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (entries - target,),
+        )
+        self.metrics["evictions"] += cursor.rowcount
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            metrics = dict(self.metrics)
+            metrics["entries"] = self._count_entries()
+        metrics["max_entries"] = self.max_entries
+        lookups = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = metrics["hits"] / lookups if lookups else 0.0
+        return metrics
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def get_embedding_cache(db_file: str = EMBEDDING_CACHE_DB_FILE) -> EmbeddingCache:
+    """获取数据库文件对应的共享缓存，同一文件（按绝对路径）只打开一次"""
+    db_path = str(Path(db_file).resolve())
+    with _lock:
+        if db_path not in _caches:
+            _caches[db_path] = EmbeddingCache(db_path)
+        return _caches[db_path]
+
+
+def get_embedding_cache_metrics() -> Dict[str, Dict[str, Any]]:
+    """获取各嵌入缓存的命中率和容量指标"""
+    with _lock:
+        caches = dict(_caches)
+    return {db_path: cache.get_metrics() for db_path, cache in caches.items()}
+
+
+@dataclass
+class CachedEmbedder(Embedder):
+    """Embedder wrapper that serves repeated texts from the persistent embedding cache"""
+
+    embedder: Optional[Embedder] = None
+    cache: Optional[EmbeddingCache] = None
+    id: str = ""
+
+    def __post_init__(self):
+        if self.embedder is None:
+            raise ValueError("CachedEmbedder needs an embedder to wrap")
+        self.dimensions = self.embedder.dimensions
+        self.id = getattr(self.embedder, "id", type(self.embedder).__name__)
+        if self.cache is None:
+            self.cache = get_embedding_cache()
+
+    @property
+    def model_key(self) -> str:
+        # Same model with different output dimensions gives different vectors
+        return f"{self.id}:{self.dimensions}"
+
+    def get_embedding(self, text: str) -> List[float]:
+        return self.get_embedding_and_usage(text)[0]
+
+    def get_embedding_and_usage(self, text: str) -> Tuple[List[float], Optional[Dict]]:
+        cached = self.cache.get(self.model_key, text)
+        if cached is not None:
+            return cached, None
+        embedding, usage = self.embedder.get_embedding_and_usage(text)
+        # Failed requests return an empty embedding, which must not be cached
+        if embedding:
+            self.cache.put(self.model_key, text, embedding)
+        return embedding, usage
@@ -0,0 +1,200 @@
+"""Batched, concurrent embedding pipeline for knowledge ingestion
+
+分块按批（一次请求多条文本）调用嵌入接口，多个批次在线程池中并发执行，受每分钟请求数限流，
+遇到限流/超时/服务端错误时指数退避重试；结果按批次流式返回，由调用方批量写入LanceDB。
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional
+
+from agno.document import Document
+from agno.embedder.base import Embedder
+
+from agents.embedding_cache import CachedEmbedder
+
+# 每次请求的文本条数（OpenAI单次最多2048条，较小的批次更不容易触发单请求token上限）
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# 同时进行的嵌入请求数
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+# 每分钟最多发出的嵌入请求数（按所用部署的配额调整）
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "300"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_MAX_BACKOFF_SECONDS = 60.0
+# 进度输出的最小间隔（秒）
+PROGRESS_INTERVAL_SECONDS = 5.0
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """线程安全的请求限流器，相邻两次请求至少间隔 60/每分钟请求数 秒"""
+
+    def __init__(self, requests_per_minute: int = EMBEDDING_REQUESTS_PER_MINUTE):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# 进程内共享的默认限流器（同一次构建的所有来源共用配额）
+_default_rate_limiter = RateLimiter()
+
+
+def is_retryable(error: Exception) -> bool:
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    # openai.APIConnectionError / APITimeoutError and plain network errors carry no status code
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Retry-After响应头优先，否则指数退避加随机抖动"""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), EMBEDDING_MAX_BACKOFF_SECONDS)
+    except ValueError:
+        pass
+    return min(2 ** attempt, EMBEDDING_MAX_BACKOFF_SECONDS) * (0.5 + random.random() / 2)
+
+
+def embed_texts(embedder: Embedder, texts: List[str]) -> List[List[float]]:
+    """一次请求嵌入一批文本；没有批量接口的嵌入器逐条嵌入"""
+    if hasattr(embedder, "response"):
+        # OpenAIEmbedder(及兼容接口)的input可以是文本列表
+        response = embedder.response(texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    return [embedder.get_embedding(text) for text in texts]
+
+
+def embed_texts_with_retry(embedder: Embedder, texts: List[str], rate_limiter: RateLimiter,
+                           max_retries: int = EMBEDDING_MAX_RETRIES) -> List[List[float]]:
+    for attempt in range(max_retries + 1):
+        rate_limiter.acquire()
+        try:
+            embeddings = embed_texts(embedder, texts)
+            if len(embeddings) != len(texts) or not all(embeddings):
+                raise ValueError(f"Embedding response has {len(embeddings)} vectors for {len(texts)} texts")
+            return embeddings
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            print(f"   ⏳ Embedding request failed ({type(e).__name__}), retrying in {delay:.1f}s "
+                  f"({attempt + 1}/{max_retries})")
+            time.sleep(delay)
+
+
+def embed_document_batch(documents: List[Document], embedder: Embedder, rate_limiter: RateLimiter) -> List[Document]:
+    """嵌入一批分块（已缓存的文本不再请求），结果写入document.embedding"""
+    pending = documents
+    cache_embedder = embedder if isinstance(embedder, CachedEmbedder) else None
+    if cache_embedder is not None:
+        embedder = cache_embedder.embedder
+        pending = []
+        for document in documents:
+            cached = cache_embedder.cache.get(cache_embedder.model_key, document.content)
+            if cached is None:
+                pending.append(document)
+            else:
+                document.embedding = cached
+    if pending:
+        embeddings = embed_texts_with_retry(embedder, [document.content for document in pending], rate_limiter)
+        for document, embedding in zip(pending, embeddings):
+            document.embedding = embedding
+            if cache_embedder is not None:
+                cache_embedder.cache.put(cache_embedder.model_key, document.content, embedding)
+    return documents
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class EmbeddingProgress:
+    """嵌入进度与吞吐量统计"""
+
+    def __init__(self, label: str, total: Optional[int] = None, interval: float = PROGRESS_INTERVAL_SECONDS):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+        self.last_report = self.started
+
+    @property
+    def throughput(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def update(self, count: int) -> None:
+        self.done += count
+        self.batches += 1
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            total = f"/{self.total}" if self.total is not None else ""
+            print(f"   📈 {self.label}: {self.done}{total} chunks embedded, {self.throughput:.1f} chunks/s")
+
+
+def embed_documents(
+    batches: Iterable[List[Document]],
+    embedder: Embedder,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+    rate_limiter: Optional[RateLimiter] = None,
+    progress: Optional[EmbeddingProgress] = None,
+) -> Iterator[List[Document]]:
+    """并发嵌入流式输入的分块批次，按完成顺序返回已嵌入的批次
+
+    同时最多读取 2 * concurrency 个批次，输入可以是生成器（不必先读完整个文档）。
+    """
+    rate_limiter = rate_limiter or _default_rate_limiter
+    batches = iter(batches)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed") as executor:
+        in_flight = set()
+
+        def submit_next() -> bool:
+            batch = next(batches, None)
+            if batch is None:
+                return False
+            in_flight.add(executor.submit(embed_document_batch, batch, embedder, rate_limiter))
+            return True
+
+        while len(in_flight) < 2 * concurrency and submit_next():
+            pass
+        try:
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.remove(future)
+                    documents = future.result()
+                    if progress is not None:
+                        progress.update(len(documents))
+                    yield documents
+                    submit_next()
+        finally:
+            # Stop queued batches if a batch failed or the consumer stopped early
+            for future in in_flight:
+                future.cancel()
@@ -0,0 +1,933 @@
+"""Incremental, content-addressed ingestion for the RWA knowledge bases
+
+The ingestion manifest (SQLite) records a content hash for every source document and every chunk.
+A refresh re-reads each source and only embeds and inserts chunks whose content is new; rows for
+chunks that disappeared from a source are deleted. Unchanged PDFs are skipped before parsing; changed ones are
+parsed page by page in a process pool (agents/pdf_stream.py) and streamed into the embedding pipeline.
+
+All compliance sources share one table with source, jurisdiction, doc_type and date metadata columns;
+a query naming a jurisdiction is pre-filtered on that column before the vector search.
+
+The same chunks are also kept in a local BM25 index (agents/lexical_index.py), so knowledge search works
+without an embedder; with one, vector and BM25 results are fused (hybrid retrieval).
+Large tables get an ANN index during the build (agents/vector_index.py).
+
+Agents never ingest at runtime: tools/build_knowledge_base.py runs the refresh offline and writes a build
+manifest pinning the LanceDB version of every table, which agents open read-only (no crawling or embedding at boot).
+
+Usage:
+python -m agents.knowledge_ingestion
+python -m agents.knowledge_ingestion --source "EU MiCA Regulation" --force
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import md5
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import pyarrow as pa
+from agno.document import Document
+from agno.document.reader.website_reader import WebsiteReader
+from agno.embedder.base import Embedder
+from agno.embedder.openai import OpenAIEmbedder
+from agno.knowledge.agent import AgentKnowledge
+from agno.vectordb.lancedb import LanceDb
+
+from config import Config
+from agents.embedding_cache import EMBEDDING_CACHE_MAX_ENTRIES, CachedEmbedder
+from agents.embedding_pipeline import EMBEDDING_BATCH_SIZE, EmbeddingProgress, batched, embed_documents
+from agents.lexical_index import (
+    LEXICAL_SNAPSHOT_DIR,
+    LexicalIndex,
+    open_lexical_snapshot,
+    reciprocal_rank_fusion,
+    remove_old_snapshots,
+)
+from agents.pdf_stream import read_pdf_documents, shutdown_pdf_pool
+from agents.vector_index import apply_search_params, describe_vector_index, ensure_vector_index
+
+LANCEDB_URI = "./storage/knowledge/lancedb"
+MANIFEST_DB_FILE = "storage/knowledge/ingestion_manifest.db"
+# Table versions of the last offline build, read by the agents on start
+BUILD_MANIFEST_FILE = "storage/knowledge/lancedb/knowledge_build.json"
+COMPLIANCE_PDF_DIR = "./knowledge/compliance"
+
+# Website crawl settings (same as the compliance agent's WebsiteKnowledgeBase)
+WEB_MAX_DEPTH = 2
+WEB_MAX_LINKS = 5
+# Number of row ids per LanceDB delete predicate
+DELETE_BATCH_SIZE = 500
+# Rows per LanceDB add (every add creates a table version and a data fragment)
+WRITE_BATCH_SIZE = 1000
+# Candidates taken from each retriever per requested result in hybrid search
+HYBRID_CANDIDATE_FACTOR = 3
+
+# Single table holding every compliance source
+COMPLIANCE_TABLE = "rwa_compliance_knowledge"
+# Metadata columns stored next to the vector (filterable before the vector scan)
+METADATA_COLUMNS = ("source", "jurisdiction", "doc_type", "date")
+# Jurisdiction of sources that apply everywhere; always kept by jurisdiction filters
+GLOBAL_JURISDICTION = "INTL"
+
+# Web-based knowledge sources (regulatory websites)
+COMPLIANCE_WEB_SOURCES = [
+    {
+        "name": "US SEC - Tokenization Regulation",
+        "url": "https://www.sec.gov/newsroom/speeches-statements/uyeda-remarks-crypto-roundtable-tokenization-051225",
+        "description": "US Securities and Exchange Commission on crypto and tokenization",
+        "jurisdiction": "US",
+        "doc_type": "speech",
+        "date": "2025-05-12",
+    },
+    {
+        "name": "China Crypto Regulation",
+        "url": "https://cms.law/en/int/expert-guides/cms-expert-guide-to-crypto-regulation/china",
+        "description": "Expert guide to crypto regulation in China",
+        "jurisdiction": "CN",
+        "doc_type": "guide",
+        "date": "",
+    },
+    {
+        "name": "UAE ADGM Digital Assets Rulebook",
+        "url": "https://en.adgm.thomsonreuters.com/rulebook/digital-assets",
+        "description": "Abu Dhabi Global Market digital assets regulatory framework",
+        "jurisdiction": "UAE",
+        "doc_type": "rulebook",
+        "date": "",
+    },
+    {
+        "name": "EU MiCA Regulation",
+        "url": "https://www.esma.europa.eu/esmas-activities/digital-finance-and-innovation/markets-crypto-assets-regulation-mica",
+        "description": "European Union Markets in Crypto-Assets Regulation",
+        "jurisdiction": "EU",
+        "doc_type": "regulation",
+        "date": "",
+    },
+    {
+        "name": "Switzerland FINMA FinTech",
+        "url": "https://www.finma.ch/en/documentation/dossier/dossier-fintech/entwicklungen-im-bereich-fintech",
+        "description": "Swiss Financial Market Supervisory Authority FinTech developments",
+        "jurisdiction": "CH",
+        "doc_type": "guidance",
+        "date": "",
+    },
+]
+
+# PDF knowledge sources
+COMPLIANCE_PDF_SOURCES = [
+    {
+        "name": "Hong Kong SFC Tokenisation Seminar",
+        "path": "./knowledge/compliance/hk_sfc_tokenisation.pdf",
+        "url": "https://www.sfc.hk/-/media/files/PCIP/FAQ-PDFS/HKIFA-tokenisation-seminar-10-Jan-2024.pdf",
+        "description": "Hong Kong Securities and Futures Commission tokenisation guidance",
+        "jurisdiction": "HK",
+        "doc_type": "seminar",
+        "date": "2024-01-10",
+    },
+    {
+        "name": "UK FCA Crypto Regulation",
+        "path": "./knowledge/compliance/uk_fca_crypto.pdf",
+        "url": "https://www.fca.org.uk/publication/consultation/cp25-28.pdf",
+        "description": "UK Financial Conduct Authority crypto asset regulation",
+        "jurisdiction": "UK",
+        "doc_type": "consultation",
+        "date": "2025",
+    },
+    {
+        "name": "OECD Tokenisation Report",
+        "path": "./knowledge/compliance/oecd_tokenisation.pdf",
+        "url": "https://www.oecd.org/content/dam/oecd/en/publications/reports/2021/11/understanding-the-tokenisation-of-assets-in-financial-markets_2e657111/c033401a-en.pdf",
+        "description": "OECD report on understanding tokenisation of assets in financial markets",
+        "jurisdiction": "INTL",
+        "doc_type": "report",
+        "date": "2021-11",
+    },
+]
+
+COMPLIANCE_SOURCES = COMPLIANCE_WEB_SOURCES + COMPLIANCE_PDF_SOURCES
+
+EDUCATION_TABLE = "rwa_education"
+EDUCATION_SOURCES = [
+    {
+        "name": "RWA Tokenization Key Trends 2025",
+        "path": "./agents/Rwa Tokenization Key Trends 2025 Market Outlook Report Brickken V2.pdf",
+        "url": "",
+        "description": "Brickken RWA tokenization market outlook report 2025",
+        "jurisdiction": "INTL",
+        "doc_type": "report",
+        "date": "2025",
+    },
+]
+
+
+# Jurisdiction code -> (case-sensitive acronym pattern, case-insensitive name pattern)
+JURISDICTION_PATTERNS = {
+    "US": (r"\bU\.?S\.?A?\b|\bSEC\b|\bCFTC\b|\bFinCEN\b|\bReg (?:D|S|A\+?)\b", r"united states|america|howey|美国"),
+    "HK": (r"\bHK\b|\bSFC\b|\bHKMA\b", r"hong kong|香港"),
+    "EU": (r"\bEU\b|\bMiCA\b|\bESMA\b|\bMiFID", r"european union|europe|欧盟|欧洲"),
+    "UAE": (r"\bUAE\b|\bADGM\b|\bVARA\b|\bDFSA\b", r"emirates|abu dhabi|dubai|阿联酋|迪拜|阿布扎比"),
+    "UK": (r"\bUK\b|\bFCA\b", r"united kingdom|britain|british|england|英国"),
+    "CH": (r"\bFINMA\b", r"switzerland|swiss|瑞士"),
+    "CN": (r"\bPRC\b|\bPBOC\b|\bCSRC\b", r"china|chinese|mainland|中国|内地"),
+}
+_JURISDICTION_REGEXES = {
+    code: (re.compile(acronyms), re.compile(names, re.IGNORECASE))
+    for code, (acronyms, names) in JURISDICTION_PATTERNS.items()
+}
+
+
+def detect_jurisdictions(query: str) -> List[str]:
+    """Jurisdiction codes mentioned in a query (empty if none)"""
+    return [code for code, (acronyms, names) in _JURISDICTION_REGEXES.items()
+            if acronyms.search(query) or names.search(query)]
+
+
+def source_metadata(source: Dict[str, Any]) -> Dict[str, str]:
+    """Metadata column values of a source"""
+    return {
+        "source": source["name"],
+        "jurisdiction": source.get("jurisdiction", GLOBAL_JURISDICTION),
+        "doc_type": source.get("doc_type", ""),
+        "date": source.get("date", ""),
+    }
+
+
+def discover_compliance_pdf_sources() -> List[Dict[str, Any]]:
+    """Configured PDF sources plus any other PDF placed in knowledge/compliance
+
+    A PDF saved under its download name (e.g. cp25-28.pdf) is matched to the configured source by URL.
+    """
+    sources = [dict(source) for source in COMPLIANCE_PDF_SOURCES]
+    known_paths = {Path(source["path"]).resolve() for source in sources}
+    by_download_name = {source["url"].rsplit("/", 1)[-1]: source for source in sources}
+    for pdf_path in sorted(Path(COMPLIANCE_PDF_DIR).glob("*.pdf")):
+        if pdf_path.resolve() in known_paths:
+            continue
+        configured = by_download_name.get(pdf_path.name)
+        if configured is not None and not Path(configured["path"]).exists():
+            configured["path"] = str(pdf_path)
+            continue
+        sources.append({"name": pdf_path.stem, "path": str(pdf_path), "url": "", "description": pdf_path.name,
+                        "jurisdiction": GLOBAL_JURISDICTION, "doc_type": "document", "date": ""})
+    return sources
+
+
+def knowledge_build_plan() -> List[Tuple[str, Dict[str, Any]]]:
+    """(table name, source) pairs for every knowledge table the agents use"""
+    plan = [(COMPLIANCE_TABLE, source) for source in COMPLIANCE_WEB_SOURCES]
+    plan += [(COMPLIANCE_TABLE, source) for source in discover_compliance_pdf_sources()]
+    plan += [(EDUCATION_TABLE, source) for source in EDUCATION_SOURCES]
+    return plan
+
+
+def get_knowledge_embedder() -> Optional[Embedder]:
+    """Create the embedder used for the knowledge bases (Azure first, then OpenAI as fallback)
+
+    The embedder is wrapped in the persistent embedding cache unless EMBEDDING_CACHE_MAX_ENTRIES is 0.
+    """
+    embedder = None
+    if Config.AZURE_EMBEDDER_OPENAI_API_KEY:
+        try:
+            embedder_config = Config.get_azure_embedder_config()
+            embedder = OpenAIEmbedder(
+                id=embedder_config["id"],
+                api_key=embedder_config["api_key"],
+            )
+            print("✅ Successfully initialized Azure OpenAI embedder configuration")
+        except Exception as e:
+            print(f"⚠️ Warning: Could not initialize Azure embedder: {str(e)}")
+            print("   Will use default OpenAI embedder if OPENAI_API_KEY is set")
+            embedder = None
+
+    # Fallback to standard OpenAI embedder if Azure fails
+    if embedder is None and os.getenv("OPENAI_API_KEY"):
+        try:
+            embedder = OpenAIEmbedder(
+                id="text-embedding-ada-002",
+                api_key=os.getenv("OPENAI_API_KEY"),
+            )
+            print("✅ Using OpenAI embedder as fallback")
+        except Exception as e:
+            print(f"⚠️ Warning: Could not initialize OpenAI embedder: {str(e)}")
+            embedder = None
+    if embedder is not None and EMBEDDING_CACHE_MAX_ENTRIES > 0:
+        embedder = CachedEmbedder(embedder=embedder)
+    return embedder
+
+
+def chunk_row_id(content: str) -> str:
+    """Row id of a chunk in LanceDB (same content-derived md5 that LanceDb.insert uses)"""
+    return md5(content.replace("\x00", "\ufffd").encode()).hexdigest()
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class IngestionManifest:
+    """Record of what has been embedded: a hash per source document and per chunk"""
+
+    def __init__(self, db_file: str = MANIFEST_DB_FILE):
+        Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS sources (
+                source_key TEXT PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                source_hash TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                source_key TEXT NOT NULL,
+                row_id TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                PRIMARY KEY (source_key, row_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_table_row ON chunks (table_name, row_id);
+        """)
+
+    def get_source(self, source_key: str) -> Optional[sqlite3.Row]:
+        with self.lock:
+            return self.conn.execute("SELECT * FROM sources WHERE source_key = ?", (source_key,)).fetchone()
+
+    def get_chunk_ids(self, source_key: str, table_name: str) -> Set[str]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT row_id FROM chunks WHERE source_key = ? AND table_name = ?", (source_key, table_name)
+            ).fetchall()
+        return {row["row_id"] for row in rows}
+
+    def referenced_elsewhere(self, table_name: str, row_ids: Iterable[str], source_key: str) -> Set[str]:
+        """Row ids that another source still references in the same table (identical chunk content)"""
+        row_ids = list(row_ids)
+        referenced: Set[str] = set()
+        with self.lock:
+            for start in range(0, len(row_ids), DELETE_BATCH_SIZE):
+                batch = row_ids[start:start + DELETE_BATCH_SIZE]
+                rows = self.conn.execute(
+                    f"SELECT DISTINCT row_id FROM chunks WHERE table_name = ? AND source_key != ? "
+                    f"AND row_id IN ({','.join('?' * len(batch))})",
+                    (table_name, source_key, *batch),
+                ).fetchall()
+                referenced.update(row["row_id"] for row in rows)
+        return referenced
+
+    def record(self, source_key: str, table_name: str, source_hash: str, chunk_hashes: Dict[str, str]) -> None:
+        """Replace the chunk list of a source in one transaction"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM chunks WHERE source_key = ?", (source_key,))
+            self.conn.executemany(
+                "INSERT INTO chunks (source_key, row_id, chunk_hash, table_name) VALUES (?, ?, ?, ?)",
+                [(source_key, row_id, chunk_hash, table_name) for row_id, chunk_hash in chunk_hashes.items()],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources (source_key, table_name, source_hash, chunk_count, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (source_key, table_name, source_hash, len(chunk_hashes), time.time()),
+            )
+
+    def add_chunks(self, source_key: str, table_name: str, chunk_hashes: Dict[str, str]) -> None:
+        """Record rows written by an interrupted ingestion without marking the source as current
+
+        The next run sees them as previous rows of the source: they are not embedded again, and deleted if they vanished.
+        """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks (source_key, row_id, chunk_hash, table_name) VALUES (?, ?, ?, ?)",
+                [(source_key, row_id, chunk_hash, table_name) for row_id, chunk_hash in chunk_hashes.items()],
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+@dataclass
+class IngestionResult:
+    source: str
+    status: str  # unchanged / updated / missing / error
+    chunks: int = 0
+    added: int = 0
+    deleted: int = 0
+    indexed: int = 0  # chunks (re)written to the BM25 index
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def read_source_documents(source: Dict[str, Any]) -> Iterator[Document]:
+    """Read and chunk a source, tagging every chunk with its source
+
+    PDF chunks are generated page by page while the pages are extracted, so a large PDF is never held in memory.
+    """
+    if "path" in source:
+        documents = read_pdf_documents(source["path"])
+    else:
+        documents = WebsiteReader(max_depth=WEB_MAX_DEPTH, max_links=WEB_MAX_LINKS).read(url=source["url"])
+    metadata = source_metadata(source)
+    for document in documents:
+        document.meta_data = {**(document.meta_data or {}), **metadata, "source_url": source["url"]}
+        yield document
+
+
+def unique_chunks(documents: Iterable[Document], chunk_hashes: Dict[str, str]) -> Iterator[Tuple[str, Document]]:
+    """(row id, chunk) pairs without duplicate content; records the hash of every chunk in chunk_hashes"""
+    for document in documents:
+        row_id = chunk_row_id(document.content)
+        if row_id not in chunk_hashes:
+            chunk_hashes[row_id] = content_hash(document.content.encode())
+            yield row_id, document
+
+
+def open_knowledge_table(table_name: str, embedder: Embedder) -> LanceDb:
+    """Open a knowledge table for writing, creating it with the metadata columns if it does not exist"""
+    import lancedb
+
+    connection = lancedb.connect(LANCEDB_URI)
+    if table_name not in connection.table_names():
+        # Same leading columns as LanceDb's own schema (vector, id, payload), then the metadata columns
+        schema = pa.schema(
+            [
+                pa.field("vector", pa.list_(pa.float32(), embedder.dimensions)),
+                pa.field("id", pa.string()),
+                pa.field("payload", pa.string()),
+            ]
+            + [pa.field(column, pa.string()) for column in METADATA_COLUMNS]
+        )
+        connection.create_table(table_name, schema=schema)
+    return LanceDb(connection=connection, table_name=table_name, uri=LANCEDB_URI, embedder=embedder)
+
+
+def existing_row_ids(vector_db: LanceDb, row_ids: List[str]) -> Set[str]:
+    existing: Set[str] = set()
+    for start in range(0, len(row_ids), DELETE_BATCH_SIZE):
+        batch = row_ids[start:start + DELETE_BATCH_SIZE]
+        rows = (vector_db.table.search()
+                .where(f"{vector_db._id} IN ({', '.join(repr(row_id) for row_id in batch)})")
+                .select([vector_db._id]).limit(len(batch)).to_arrow())
+        existing.update(rows[vector_db._id].to_pylist())
+    return existing
+
+
+def insert_documents(vector_db: LanceDb, documents: Iterable[Document], metadata: Dict[str, str],
+                     progress: Optional[EmbeddingProgress] = None, written_ids: Optional[Set[str]] = None) -> int:
+    """Embed and add chunks with their metadata columns; chunks whose id is already in the table are skipped
+
+    Chunks are embedded in concurrent batches by the embedding pipeline and written in bulk. The ids of the rows
+    written so far are added to written_ids, which stays valid when a later batch fails.
+    """
+    written_ids = written_ids if written_ids is not None else set()
+    # Tables built before the metadata columns existed only get the payload
+    columns = {key: value for key, value in metadata.items() if key in vector_db.table.schema.names}
+
+    def new_batches() -> Iterable[List[Document]]:
+        for batch in batched(documents, EMBEDDING_BATCH_SIZE):
+            rows = {chunk_row_id(document.content): document for document in batch}
+            for row_id in existing_row_ids(vector_db, list(rows)):
+                del rows[row_id]
+            if rows:
+                yield list(rows.values())
+
+    data: List[Dict[str, Any]] = []
+    written = 0
+    for batch in embed_documents(new_batches(), vector_db.embedder, progress=progress):
+        for document in batch:
+            payload = {
+                "name": document.name,
+                "meta_data": document.meta_data,
+                "content": document.content.replace("\x00", "\ufffd"),
+                "usage": document.usage,
+            }
+            data.append({"id": chunk_row_id(document.content), "vector": document.embedding,
+                         "payload": json.dumps(payload), **columns})
+        if len(data) >= WRITE_BATCH_SIZE:
+            vector_db.table.add(data)
+            written += len(data)
+            written_ids.update(row["id"] for row in data)
+            data = []
+    if data:
+        vector_db.table.add(data)
+        written += len(data)
+        written_ids.update(row["id"] for row in data)
+    return written
+
+
+def delete_rows(vector_db: LanceDb, row_ids: Iterable[str]) -> int:
+    """Delete rows from a LanceDB table by id"""
+    row_ids = sorted(row_ids)
+    for start in range(0, len(row_ids), DELETE_BATCH_SIZE):
+        batch = row_ids[start:start + DELETE_BATCH_SIZE]
+        # ids are hex digests, safe to inline in the predicate
+        vector_db.table.delete(f"{vector_db._id} IN ({', '.join(repr(row_id) for row_id in batch)})")
+    return len(row_ids)
+
+
+def missing_result(source: Dict[str, Any]) -> IngestionResult:
+    error = f"PDF not found at {source['path']}"
+    if source.get("url"):
+        error += f", download from: {source['url']}"
+    return IngestionResult(source["name"], "missing", error=error)
+
+
+def ingest_source(source: Dict[str, Any], vector_db: Optional[LanceDb], manifest: IngestionManifest,
+                  table_name: str, force: bool = False, lexical: Optional[LexicalIndex] = None) -> IngestionResult:
+    """Bring one source up to date: embed new chunks, delete vanished ones, update the manifest
+
+    Without a vector_db only the BM25 index is updated; the BM25 rows of a changed source are replaced as a whole.
+    PDF chunks are indexed and embedded in one pass while the PDF is parsed.
+    """
+    started = time.perf_counter()
+    key = source["name"]
+    previous = manifest.get_source(key)
+    lexical_previous = lexical.get_source(key) if lexical is not None else None
+
+    def vector_current(source_hash: str) -> bool:
+        return vector_db is None or (not force and previous is not None and previous["source_hash"] == source_hash
+                                     and previous["table_name"] == table_name)
+
+    def lexical_current(source_hash: str) -> bool:
+        return lexical is None or (not force and lexical_previous is not None
+                                   and lexical_previous["source_hash"] == source_hash
+                                   and lexical_previous["table_name"] == table_name)
+
+    chunk_hashes: Dict[str, str] = {}
+    if "path" in source:
+        path = Path(source["path"])
+        if not path.exists():
+            return missing_result(source)
+        # Unchanged files are skipped before parsing
+        source_hash = content_hash(path.read_bytes())
+        if vector_current(source_hash) and lexical_current(source_hash):
+            chunk_count = (previous or lexical_previous)["chunk_count"]
+            return IngestionResult(key, "unchanged", chunks=chunk_count, seconds=time.perf_counter() - started)
+        chunks: Iterable[Tuple[str, Document]] = unique_chunks(read_source_documents(source), chunk_hashes)
+    else:
+        # Websites have to be crawled to detect changes; the source hash covers the chunk hashes
+        chunks = list(unique_chunks(read_source_documents(source), chunk_hashes))
+        source_hash = content_hash("\n".join(sorted(chunk_hashes.values())).encode())
+        if chunks and vector_current(source_hash) and lexical_current(source_hash):
+            return IngestionResult(key, "unchanged", chunks=len(chunks), seconds=time.perf_counter() - started)
+
+    update_lexical = not lexical_current(source_hash)
+    update_vectors = not vector_current(source_hash)
+    # Rows of a source that moved to another table stay behind in the old one
+    previous_ids = manifest.get_chunk_ids(key, table_name) if update_vectors else set()
+
+    added = deleted = 0
+    with ExitStack() as stack:
+        # A failed parse or embedding rolls the BM25 rows of the source back
+        add_lexical = (stack.enter_context(lexical.source_writer(key, table_name, source_hash, source_metadata(source)))
+                       if update_lexical else None)
+
+        def new_documents() -> Iterator[Document]:
+            for row_id, document in chunks:
+                if add_lexical is not None:
+                    add_lexical(row_id, document)
+                if update_vectors and row_id not in previous_ids:
+                    yield document
+
+        if update_vectors:
+            written_ids: Set[str] = set()
+            try:
+                added = insert_documents(vector_db, new_documents(), source_metadata(source),
+                                         progress=EmbeddingProgress(key), written_ids=written_ids)
+            except Exception:
+                # Batches already committed to the table must not become rows no source owns
+                manifest.add_chunks(key, table_name, {row_id: chunk_hashes[row_id] for row_id in written_ids})
+                raise
+        else:
+            for _ in new_documents():
+                pass
+    if not chunk_hashes:
+        # An unreachable site or unreadable PDF must not wipe the existing rows
+        return IngestionResult(key, "error", error="No content extracted", seconds=time.perf_counter() - started)
+
+    if update_vectors:
+        vanished = previous_ids - chunk_hashes.keys()
+        # Chunks with identical content in another source of the same table keep their row
+        vanished -= manifest.referenced_elsewhere(table_name, vanished, key)
+        deleted = delete_rows(vector_db, vanished) if vanished else 0
+        manifest.record(key, table_name, source_hash, chunk_hashes)
+    return IngestionResult(key, "updated", chunks=len(chunk_hashes), added=added, deleted=deleted,
+                           indexed=len(chunk_hashes) if update_lexical else 0, seconds=time.perf_counter() - started)
+
+
+def refresh_sources(plan: List[Tuple[str, Dict[str, Any]]], force: bool = False,
+                    embedder: Optional[Embedder] = None) -> List[IngestionResult]:
+    """Incrementally refresh the given (table name, source) pairs in the vector tables and the BM25 index"""
+    embedder = embedder or get_knowledge_embedder()
+    if embedder is None:
+        print("⚠️ No embedder available (AZURE_EMBEDDER_OPENAI_API_KEY / OPENAI_API_KEY), updating the BM25 index only")
+
+    manifest = IngestionManifest()
+    lexical = LexicalIndex()
+    vector_dbs: Dict[str, LanceDb] = {}
+    results = []
+    try:
+        for table_name, source in plan:
+            try:
+                if "path" in source and not Path(source["path"]).exists():
+                    # Do not create an empty table for a missing file
+                    result = missing_result(source)
+                    results.append(result)
+                    print(format_result(result))
+                    continue
+                if embedder is not None and table_name not in vector_dbs:
+                    vector_dbs[table_name] = open_knowledge_table(table_name, embedder)
+                result = ingest_source(source, vector_dbs.get(table_name), manifest, table_name, force=force,
+                                       lexical=lexical)
+            except Exception as e:
+                result = IngestionResult(source["name"], "error", error=str(e))
+            results.append(result)
+            print(format_result(result))
+    finally:
+        manifest.close()
+        lexical.close()
+        shutdown_pdf_pool()
+    return results
+
+
+def refresh_compliance_knowledge(source_names: Optional[List[str]] = None, force: bool = False,
+                                 embedder: Optional[Embedder] = None) -> List[IngestionResult]:
+    """Incrementally refresh the compliance knowledge tables"""
+    plan = [(table_name, source) for table_name, source in knowledge_build_plan()
+            if table_name != EDUCATION_TABLE and (not source_names or source["name"] in source_names)]
+    return refresh_sources(plan, force=force, embedder=embedder)
+
+
+def write_build_manifest(plan: List[Tuple[str, Dict[str, Any]]], results: List[IngestionResult],
+                         embedder: Optional[Embedder]) -> Dict[str, Any]:
+    """Pin the current LanceDB version of every built table and snapshot the BM25 index in the build manifest
+
+    A build without embedder only contains the BM25 snapshot.
+    """
+    import lancedb
+
+    build_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    connection = lancedb.connect(LANCEDB_URI)
+    existing = set(connection.table_names())
+    status = {result.source: result.status for result in results}
+    tables: Dict[str, Dict[str, Any]] = {}
+    for table_name, source in plan:
+        if embedder is None or table_name not in existing:
+            continue
+        entry = tables.get(table_name)
+        if entry is None:
+            table = connection.open_table(table_name)
+            entry = tables[table_name] = {"version": table.version, "rows": table.count_rows(),
+                                          "index": describe_vector_index(table), "sources": []}
+        entry["sources"].append({"name": source["name"], "status": status.get(source["name"])})
+
+    lexical = LexicalIndex()
+    try:
+        previous_snapshot = ((load_build_manifest() or {}).get("lexical_index") or {}).get("snapshot")
+        if previous_snapshot and Path(previous_snapshot).exists() and not any(result.indexed for result in results):
+            # Nothing was re-indexed, the previous snapshot is still current
+            lexical_snapshot = previous_snapshot
+        else:
+            # Agents read an immutable copy, later builds keep updating the working index
+            lexical_snapshot = lexical.snapshot(f"{LEXICAL_SNAPSHOT_DIR}/lexical_{build_id}.db")
+        lexical_rows = {table_name: lexical.count([table_name]) for table_name in dict.fromkeys(name for name, _ in plan)}
+    finally:
+        lexical.close()
+
+    build = {
+        "build_id": build_id,
+        "built_at": datetime.now().isoformat(),
+        "embedder": {"id": embedder.id, "dimensions": embedder.dimensions} if embedder is not None else None,
+        "tables": tables,
+        "lexical_index": {"snapshot": lexical_snapshot, "rows": lexical_rows},
+        # e.g. the per-source compliance tables replaced by COMPLIANCE_TABLE
+        "obsolete_tables": sorted(existing - {table_name for table_name, _ in plan}) if embedder is not None else [],
+    }
+    Path(BUILD_MANIFEST_FILE).parent.mkdir(parents=True, exist_ok=True)
+    temp_file = f"{BUILD_MANIFEST_FILE}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(build, f, ensure_ascii=False, indent=2)
+    # Atomic replace so running agents never read a half-written manifest
+    os.replace(temp_file, BUILD_MANIFEST_FILE)
+    return build
+
+
+def maintain_vector_indexes(table_names: Iterable[str], reindex: bool = False) -> Dict[str, str]:
+    """Create, extend or rebuild the ANN index of each table after ingestion; returns the action per table"""
+    import lancedb
+
+    connection = lancedb.connect(LANCEDB_URI)
+    existing = set(connection.table_names())
+    actions = {}
+    for table_name in dict.fromkeys(table_names):
+        if table_name not in existing:
+            continue
+        try:
+            actions[table_name] = ensure_vector_index(connection.open_table(table_name), rebuild=reindex)
+        except Exception as e:
+            actions[table_name] = f"error: {e}"
+            print(f"⚠️ Warning: Could not update the vector index of {table_name}: {str(e)}")
+    return actions
+
+
+def build_knowledge_base(force: bool = False, embedder: Optional[Embedder] = None,
+                         reindex: bool = False) -> Dict[str, Any]:
+    """Offline build: refresh every knowledge table, maintain its ANN index and pin the resulting versions"""
+    embedder = embedder or get_knowledge_embedder()
+    plan = knowledge_build_plan()
+    results = refresh_sources(plan, force=force, embedder=embedder)
+    # Indexing creates a new table version, so it runs before the versions are pinned
+    index_actions = maintain_vector_indexes([table_name for table_name, _ in plan], reindex) if embedder is not None else {}
+    build = write_build_manifest(plan, results, embedder)
+    build["results"] = results
+    build["index_actions"] = index_actions
+    return build
+
+
+def drop_obsolete_tables(build: Dict[str, Any]) -> List[str]:
+    """Drop tables and BM25 snapshots that are no longer part of the build (agents must be restarted on the new build first)"""
+    import lancedb
+
+    connection = lancedb.connect(LANCEDB_URI)
+    for table_name in build["obsolete_tables"]:
+        connection.drop_table(table_name)
+    return build["obsolete_tables"] + remove_old_snapshots(build["lexical_index"]["snapshot"])
+
+
+def load_build_manifest() -> Optional[Dict[str, Any]]:
+    try:
+        with open(BUILD_MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class _PinnedConnection:
+    """LanceDB connection proxy that always returns the tables checked out at their built version"""
+
+    def __init__(self, connection, tables: Dict[str, Any]):
+        self._connection = connection
+        self._tables = tables
+
+    def table_names(self, *args, **kwargs) -> List[str]:
+        return list(self._tables)
+
+    def open_table(self, name: str, *args, **kwargs):
+        if name not in self._tables:
+            raise ValueError(f"Knowledge table {name} is not part of the prebuilt knowledge base")
+        return self._tables[name]
+
+    def __getattr__(self, name: str):
+        return getattr(self._connection, name)
+
+
+def open_prebuilt_tables(table_names: List[str], embedder: Embedder,
+                         build: Optional[Dict[str, Any]] = None) -> List[LanceDb]:
+    """Open prebuilt knowledge tables read-only at the versions pinned by the last build
+
+    No table is created and nothing is embedded; tables missing from the build are skipped.
+    """
+    import lancedb
+
+    build = build or load_build_manifest()
+    if build is None:
+        print(f"⚠️ Prebuilt knowledge base not found at {BUILD_MANIFEST_FILE}")
+        print("   Build it with: python tools/build_knowledge_base.py")
+        return []
+    if build["embedder"] is None:
+        print("⚠️ Knowledge base was built without an embedder, only BM25 keyword search is available")
+        return []
+    if build["embedder"]["dimensions"] != embedder.dimensions:
+        print(f"⚠️ Knowledge base was built with {build['embedder']['id']} ({build['embedder']['dimensions']} dims), "
+              f"current embedder has {embedder.dimensions} dims; rebuild it to enable knowledge search")
+        return []
+
+    connection = lancedb.connect(LANCEDB_URI)
+    pinned = {}
+    for table_name in table_names:
+        entry = build["tables"].get(table_name)
+        if entry is None:
+            continue
+        table = connection.open_table(table_name)
+        # A checked-out version is read-only
+        table.checkout(entry["version"])
+        pinned[table_name] = table
+    proxy = _PinnedConnection(connection, pinned)
+    return [LanceDb(connection=proxy, table_name=table_name, uri=LANCEDB_URI, embedder=embedder) for table_name in pinned]
+
+
+def _sql_value(value: Any) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class PrebuiltKnowledge(AgentKnowledge):
+    """Read-only knowledge over prebuilt LanceDB tables and/or the BM25 snapshot of the same chunks
+
+    Vector results of several tables are merged by distance; with both retrievers the two rankings are
+    combined by reciprocal rank fusion. Filters on metadata columns, and with detect_jurisdiction the
+    jurisdictions named in the query, are applied as a pre-filter so only matching rows are scanned.
+
+    agno's Agent only searches knowledge that has a vector_db or retriever of its own, so agents pass
+    retrieve as their retriever.
+    """
+
+    vector_dbs: List[LanceDb] = []
+    lexical_index: Optional[LexicalIndex] = None
+    lexical_tables: List[str] = []
+    detect_jurisdiction: bool = False
+    # The metadata columns are the only filter keys; without them agno drops every filter before searching
+    valid_metadata_filters: Set[str] = set(METADATA_COLUMNS)
+
+    @property
+    def retrieval_mode(self) -> str:
+        if self.vector_dbs and self.lexical_index is not None:
+            return "hybrid vector + BM25"
+        return "vector" if self.vector_dbs else "BM25"
+
+    def _where_clauses(self, columns: Iterable[str], query: str,
+                       filters: Optional[Dict[str, Any]]) -> Tuple[List[str], Optional[str]]:
+        """(clauses from explicit filters, clause from the jurisdictions detected in the query)"""
+        columns = set(columns)
+        filters = filters or {}
+        clauses = [f"{key} = {_sql_value(value)}" for key, value in filters.items() if key in METADATA_COLUMNS and key in columns]
+        jurisdiction_clause = None
+        if self.detect_jurisdiction and "jurisdiction" in columns and "jurisdiction" not in filters:
+            jurisdictions = detect_jurisdictions(query)
+            if jurisdictions:
+                values = ", ".join(_sql_value(code) for code in jurisdictions + [GLOBAL_JURISDICTION])
+                jurisdiction_clause = f"jurisdiction IN ({values})"
+        return clauses, jurisdiction_clause
+
+    @staticmethod
+    def _search_table(vector_db: LanceDb, query_embedding: List[float], limit: int, clauses: List[str]):
+        search = apply_search_params(
+            vector_db.table.search(query=query_embedding, vector_column_name=vector_db._vector_col)
+        ).limit(limit)
+        if clauses:
+            search = search.where(" AND ".join(clauses), prefilter=True)
+        return search.to_pandas()
+
+    def _vector_search(self, query: str, limit: int, filters: Optional[Dict[str, Any]]) -> List[Tuple[str, Document]]:
+        import pandas as pd
+
+        # Embed the query once and search every table with the same vector
+        query_embedding = self.vector_dbs[0].embedder.get_embedding(query)
+        frames = []
+        for vector_db in self.vector_dbs:
+            clauses, jurisdiction_clause = self._where_clauses(vector_db.table.schema.names, query, filters)
+            frame = self._search_table(vector_db, query_embedding, limit, clauses + [jurisdiction_clause] if jurisdiction_clause else clauses)
+            if frame.empty and jurisdiction_clause:
+                # No documents for the detected jurisdictions: fall back to all jurisdictions
+                frame = self._search_table(vector_db, query_embedding, limit, clauses)
+            frames.append(frame)
+        merged = pd.concat(frames, ignore_index=True).sort_values("_distance")
+        return [(chunk_row_id(document.content), document) for document in self.vector_dbs[0]._build_search_results(merged)]
+
+    def _lexical_search(self, query: str, limit: int, filters: Optional[Dict[str, Any]]) -> List[Tuple[str, Document]]:
+        clauses, jurisdiction_clause = self._where_clauses(METADATA_COLUMNS, query, filters)
+        results = []
+        if jurisdiction_clause:
+            results = self.lexical_index.search(query, self.lexical_tables, limit, clauses + [jurisdiction_clause])
+        if not results:
+            results = self.lexical_index.search(query, self.lexical_tables, limit, clauses)
+        return [(row_id, document) for row_id, document, _ in results]
+
+    def search(
+        self, query: str, num_documents: Optional[int] = None, filters: Optional[Dict[str, Any]] = None
+    ) -> List[Document]:
+        limit = num_documents or self.num_documents
+        hybrid = bool(self.vector_dbs) and self.lexical_index is not None
+        depth = limit * HYBRID_CANDIDATE_FACTOR if hybrid else limit
+        rankings = []
+        # Each retriever can fail on its own (e.g. the embedding endpoint is down); the other one still answers
+        for name, retriever in (("vector", self._vector_search if self.vector_dbs else None),
+                                ("BM25", self._lexical_search if self.lexical_index is not None else None)):
+            if retriever is None:
+                continue
+            try:
+                rankings.append(retriever(query, depth, filters))
+            except Exception as e:
+                print(f"⚠️ Warning: Knowledge {name} search failed: {str(e)}")
+        if not rankings:
+            return []
+        documents = reciprocal_rank_fusion(rankings) if len(rankings) > 1 else [document for _, document in rankings[0]]
+        if filters:
+            documents = [document for document in documents
+                         if all(document.meta_data.get(key) == value for key, value in filters.items())]
+        return documents[:limit]
+
+    async def async_search(
+        self, query: str, num_documents: Optional[int] = None, filters: Optional[Dict[str, Any]] = None
+    ) -> List[Document]:
+        return self.search(query=query, num_documents=num_documents, filters=filters)
+
+    def retrieve(self, query: str, num_documents: Optional[int] = None,
+                 filters: Optional[Dict[str, Any]] = None, **kwargs) -> Optional[List[Dict[str, Any]]]:
+        """Agent retriever: the search results as document dicts, None if nothing matched"""
+        documents = self.search(query=query, num_documents=num_documents, filters=filters)
+        return [document.to_dict() for document in documents] or None
+
+
+def open_prebuilt_knowledge(table_names: List[str], embedder: Optional[Embedder],
+                            **kwargs) -> Optional[PrebuiltKnowledge]:
+    """Open the prebuilt knowledge of the given tables: vector tables if an embedder is available, plus the BM25 snapshot
+
+    Returns None if the last build contains neither.
+    """
+    build = load_build_manifest()
+    if build is None:
+        print(f"⚠️ Prebuilt knowledge base not found at {BUILD_MANIFEST_FILE}")
+        print("   Build it with: python tools/build_knowledge_base.py")
+        return None
+    vector_dbs = open_prebuilt_tables(table_names, embedder, build) if embedder is not None else []
+    lexical_index = open_lexical_snapshot((build.get("lexical_index") or {}).get("snapshot"))
+    lexical_tables = [table_name for table_name in table_names
+                      if (build.get("lexical_index") or {}).get("rows", {}).get(table_name)]
+    if lexical_index is not None and not lexical_tables:
+        lexical_index.close()
+        lexical_index = None
+    if not vector_dbs and lexical_index is None:
+        return None
+    return PrebuiltKnowledge(vector_dbs=vector_dbs, lexical_index=lexical_index, lexical_tables=lexical_tables, **kwargs)
+
+
+def format_result(result: IngestionResult) -> str:
+    icons = {"unchanged": "⏭️", "updated": "✅", "missing": "⚠️", "error": "❌"}
+    line = f"{icons.get(result.status, '•')} {result.source}: {result.status}"
+    if result.status in ("unchanged", "updated"):
+        line += f" ({result.chunks} chunks, +{result.added} / -{result.deleted}, {result.seconds:.1f}s"
+        if result.added and result.seconds:
+            line += f", {result.added / result.seconds:.1f} chunks/s"
+        if result.indexed:
+            line += f", {result.indexed} indexed for BM25"
+        line += ")"
+    if result.error:
+        line += f" - {result.error}"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally refresh the RWA compliance knowledge base")
+    parser.add_argument("--source", action="append", help="Only refresh the named source (repeatable)")
+    parser.add_argument("--force", action="store_true", help="Re-check every chunk even if the source hash is unchanged")
+    args = parser.parse_args()
+
+    print("📚 Refreshing compliance knowledge base...")
+    results = refresh_compliance_knowledge(args.source, force=args.force)
+    added = sum(result.added for result in results)
+    deleted = sum(result.deleted for result in results)
+    print(f"\n✅ Done: {len(results)} sources, {added} chunks embedded, {deleted} chunks deleted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Local BM25 keyword index over the knowledge chunks (SQLite FTS5)
+
+与向量表使用同一批分块构建，不需要嵌入模型和网络：没有配置嵌入接口时作为知识库的检索方式，
+配置了嵌入接口时与向量检索做RRF混合排序。离线构建结束时生成只读快照，Agent只打开快照，
+与LanceDB表的版本固定方式一致。
+unicode61分词器把连续的中文当作一个词，因此中文按单字写入索引，查询时用相邻两字的短语匹配。
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from agno.document import Document
+
+LEXICAL_INDEX_DB_FILE = "storage/knowledge/lexical_index.db"
+# 每次构建生成的只读快照目录
+LEXICAL_SNAPSHOT_DIR = "storage/knowledge/lexical_snapshots"
+# RRF融合常数（Cormack et al. 推荐值）
+RRF_K = 60
+# 索引内容的分词方式变化时递增，旧索引在打开时清空并重建
+LEXICAL_INDEX_VERSION = 2
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_CJK_CHAR = re.compile(f"([{_CJK}])")
+# 中文和其他文字的边界也是词的边界（"MiCA对稳定币的要求" -> "MiCA", "对稳定币的要求"）
+_QUERY_TERM = re.compile(f"[{_CJK}]+|[^\\W{_CJK}]+")
+
+
+def segment_cjk(text: str) -> str:
+    """中文字符两侧加空格，使unicode61把每个汉字作为一个词写入索引"""
+    return _CJK_CHAR.sub(r" \1 ", text)
+
+
+def fts_query(query: str) -> Optional[str]:
+    """把自然语言查询转换为FTS5的OR查询（每个词加引号，避免标点触发FTS5语法错误）
+
+    连续的中文拆成相邻两字的短语（"稳定币" -> "稳 定" OR "定 币"），不依赖中文分词词典。
+    """
+    terms = []
+    for term in _QUERY_TERM.findall(query):
+        if not _CJK_CHAR.match(term):
+            terms.append(term.lower())
+        elif len(term) == 1:
+            terms.append(term)
+        else:
+            terms.extend(f"{first} {second}" for first, second in zip(term, term[1:]))
+    terms = list(dict.fromkeys(terms))
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+class LexicalIndex:
+    """按来源整体替换分块的FTS5全文索引，bm25()排序"""
+
+    def __init__(self, db_file: str = LEXICAL_INDEX_DB_FILE, read_only: bool = False):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        if read_only:
+            self.conn = sqlite3.connect(f"{Path(db_file).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(db_file, check_same_thread=False)
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < LEXICAL_INDEX_VERSION:
+                # Chunks indexed with an older segmentation would not match the current queries
+                self.conn.executescript("DROP TABLE IF EXISTS chunks; DROP TABLE IF EXISTS sources;")
+            self.conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS sources (
+                    source_key TEXT PRIMARY KEY,
+                    table_name TEXT NOT NULL,
+                    source_hash TEXT NOT NULL,
+                    chunk_count INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                    content,
+                    source_key UNINDEXED,
+                    table_name UNINDEXED,
+                    row_id UNINDEXED,
+                    source UNINDEXED,
+                    jurisdiction UNINDEXED,
+                    doc_type UNINDEXED,
+                    date UNINDEXED,
+                    payload UNINDEXED,
+                    tokenize = 'porter unicode61'
+                );
+            """)
+            self.conn.execute(f"PRAGMA user_version = {LEXICAL_INDEX_VERSION}")
+        self.conn.row_factory = sqlite3.Row
+
+    def get_source(self, source_key: str) -> Optional[sqlite3.Row]:
+        with self.lock:
+            return self.conn.execute("SELECT * FROM sources WHERE source_key = ?", (source_key,)).fetchone()
+
+    @contextmanager
+    def source_writer(self, source_key: str, table_name: str, source_hash: str,
+                      metadata: Dict[str, str]) -> Iterator[Callable[[str, Document], None]]:
+        """用一个事务替换某个来源的全部分块（不需要嵌入，整体重建比增量比对更简单）
+
+        返回的函数在读取来源的同时逐个写入分块；出错或没有写入任何分块时回滚，旧分块保持不变。
+        """
+        count = 0
+
+        def add(row_id: str, document: Document) -> None:
+            nonlocal count
+            payload = {"name": document.name, "meta_data": document.meta_data, "content": document.content}
+            self.conn.execute("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                segment_cjk(document.content), source_key, table_name, row_id, metadata.get("source"), metadata.get("jurisdiction"),
+                metadata.get("doc_type"), metadata.get("date"), json.dumps(payload),
+            ))
+            count += 1
+
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM chunks WHERE source_key = ?", (source_key,))
+            yield add
+            if not count:
+                # Nothing was read (unreachable site, unreadable PDF): keep the previous chunks
+                self.conn.rollback()
+                return
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources (source_key, table_name, source_hash, chunk_count, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (source_key, table_name, source_hash, count, time.time()),
+            )
+
+    def snapshot(self, snapshot_file: str) -> str:
+        """把当前索引复制为一个新的快照文件（SQLite在线备份，构建期间的写入不会出现在快照中）"""
+        Path(snapshot_file).parent.mkdir(parents=True, exist_ok=True)
+        target = sqlite3.connect(snapshot_file)
+        try:
+            with self.lock:
+                self.conn.backup(target)
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+        return snapshot_file
+
+    def count(self, table_names: List[str]) -> int:
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT COUNT(*) FROM chunks WHERE table_name IN ({','.join('?' * len(table_names))})", table_names
+            ).fetchone()[0]
+
+    def search(self, query: str, table_names: List[str], limit: int,
+               clauses: Optional[List[str]] = None) -> List[Tuple[str, Document, float]]:
+        """BM25检索，返回 (row_id, 文档, 分数)，分数越小越相关
+
+        clauses 是针对元数据列的SQL条件（与LanceDB预过滤使用同一套条件）。
+        """
+        match = fts_query(query)
+        if match is None or not table_names:
+            return []
+        conditions = ["chunks MATCH ?", f"table_name IN ({','.join('?' * len(table_names))})"] + list(clauses or [])
+        sql = (f"SELECT row_id, payload, bm25(chunks) AS score FROM chunks WHERE {' AND '.join(conditions)} "
+               f"ORDER BY score LIMIT ?")
+        with self.lock:
+            rows = self.conn.execute(sql, (match, *table_names, limit)).fetchall()
+        results = []
+        for row_id, payload, score in rows:
+            payload = json.loads(payload)
+            results.append((row_id, Document(name=payload["name"], meta_data=payload["meta_data"], content=payload["content"]), score))
+        return results
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[str, Document]]], k: int = RRF_K) -> List[Document]:
+    """RRF融合多个排序结果：score = Σ 1 / (k + rank)，同一分块按row_id合并"""
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, (row_id, document) in enumerate(ranking, start=1):
+            scores[row_id] = scores.get(row_id, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(row_id, document)
+    return [documents[row_id] for row_id in sorted(scores, key=scores.get, reverse=True)]
+
+
+def open_lexical_snapshot(snapshot_file: Optional[str]) -> Optional[LexicalIndex]:
+    if not snapshot_file or not Path(snapshot_file).exists():
+        return None
+    return LexicalIndex(snapshot_file, read_only=True)
+
+
+def remove_old_snapshots(current_snapshot: Optional[str]) -> List[str]:
+    """删除当前构建以外的快照（运行中的Agent需先切换到新构建）"""
+    removed = []
+    current = Path(current_snapshot).resolve() if current_snapshot else None
+    for snapshot in Path(LEXICAL_SNAPSHOT_DIR).glob("*.db"):
+        if snapshot.resolve() != current:
+            snapshot.unlink()
+            removed.append(str(snapshot))
+    return removed
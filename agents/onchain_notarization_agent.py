@@ -14,14 +14,12 @@ project_root = Path(__file__).parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-from agno.memory.v2.db.sqlite import SqliteMemoryDb
-from agno.memory.v2.memory import Memory
-from agno.storage.sqlite import SqliteStorage
 
 from agno.agent import Agent
 from agno.tools.mcp import MCPTools
 
 from config import get_ai_model
+from agents.storage_provider import get_memory, get_storage
 
 # Suppress RuntimeWarning and specific async cleanup warnings
 warnings.filterwarnings('ignore', category=RuntimeWarning)
@@ -86,9 +84,8 @@ async def run_agent(message: str) -> None:
 def get_onchain_notarization_agent() -> Agent:
     """Create on-chain notarization Agent instance"""
     # Initialize shared memory and storage (consistent with RWA team)
-    memory_db = SqliteMemoryDb(table_name="rwa_memory", db_file="storage/rwa_memory.db")
-    memory = Memory(db=memory_db)
-    storage = SqliteStorage(table_name="rwa_sessions", db_file="storage/rwa_storage.db")
+    memory = get_memory("rwa_memory")
+    storage = get_storage("rwa_sessions")
     
     # Use passed MCP tools or create new ones
     ethereum_mcp_tool = MCPTools(
@@ -111,7 +108,7 @@ Notarization Process:
 * Total supply
             
 3. Blockchain Deployment:
-- Use web3 MCP tools(deploy_erc20_contract) to deploy smart contracts
+- Use web3 MCP tools(deploy_erc20_contract) to deploy smart contracts, passing uploaded file SHA-256 hashes as `document_hashes`
 - Execute deployment transactions
 - Monitor transaction status and confirm successful deployment
 - Verify contract addresses and deployment details
@@ -119,8 +116,19 @@ Notarization Process:
             
 Available Tools:
 - ReasoningTools: For logical analysis and decision making
-- `deploy_erc20_contract`: Deploy new ERC20 contract
+- `deploy_erc20_contract`: Deploy new ERC20 contract (`standard` template by default, `template="optimized"` adds batchTransfer; `network="auto"` picks the cheapest healthy testnet)
+- `deploy_erc20_batch`: Deploy one ERC20 contract per asset for portfolio tokenizations in a single call
+- `mint_asset_tokens`: Issue a new asset as shares in the per-network ERC-1155 multi-asset registry (one cheap mint instead of a full contract deployment)
+- `check_asset_token_balances`: Read balances of several wallets across several registry assets in one `balanceOfBatch` call
+- `snapshot_token_holders`: Build a holder snapshot of a token at a given block from its Transfer logs
+- `plan_income_distribution`: Compute exact pro-rata income payouts (e.g. rent) for all holders at a snapshot block and save the plan
+- `execute_income_distribution`: Pay out a saved plan with batched or pipelined transfers (safe to re-run for unpaid holders)
 - `transfer_erc20_tokens`: Transfer tokens using ERC20 contract
+- `notarize_documents`: Queue document SHA-256 hashes (from `[Uploaded Files: ...]`) for Merkle-batched on-chain notarization
+- `anchor_notarization_batch`: Anchor all queued document hashes immediately in a single transaction
+- `get_notarization_proof`: Get the Merkle proof and anchoring transaction for a document hash
+- `lookup_document_fingerprints`: Resolve many document SHA-256 hashes to their tokenized assets (contract address, tx hash) in one call
+- `link_document_fingerprints`: Link document SHA-256 hashes to an already deployed token contract
 - `check_erc20_balance`: Query ERC20 token balance
 - `get_network_status`: Get network status and wallet information
 - `get_eth_balance`: Query address ETH/native token balance
@@ -129,6 +137,11 @@ Available Tools:
 - `get_block_number`: Query latest block number
 - `get_transaction`: Query transaction details
 - `get_network_info`: Get network configuration and status information
+- `rank_deployment_networks`: Rank deployable testnets (Sepolia, Arbitrum/Optimism/Base Sepolia) by current fee, block time and endpoint health
+- `get_gas_history`: Sampled gas price history of a network (percentiles and hourly buckets)
+- `get_scheduled_jobs` / `cancel_scheduled_job`: Inspect or cancel deferred deployments and distributions
+- For non-urgent deployments and distributions, pass `max_fee_gwei` and/or `deadline_minutes` so they execute when gas is cheap
+- Stuck transactions are re-broadcast with a higher fee automatically; a "waiting for confirmation" result is not a failure, report all listed transaction hashes to the user
 ﻿
 Important Guidelines:
 - Use web3 MCP tools for blockchain interactions
@@ -0,0 +1,112 @@
+"""Streaming, process-parallel PDF reader for knowledge ingestion
+
+agno的PDFReader在一个线程里提取全部页面，整份文档保留在内存中之后才分块。这里把页面按范围分给进程池提取文本，
+按页码顺序逐页分块，以生成器形式交给嵌入流水线：解析时间随CPU核数缩短，内存占用取决于同时处理的页数而不是文档大小。
+"""
+
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+from agno.document import Document
+from agno.document.chunking.fixed import FixedSizeChunking
+
+# 提取页面文本的进程数（1表示在当前进程中逐页提取）
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(os.cpu_count() or 1)))
+# 每个任务提取的页数（太少时进程间通信的开销占比变大）
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+# 与agno Reader默认的分块大小一致
+PDF_CHUNK_SIZE = 5000
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# 工作进程中正在解析的文档 (路径, reader)，同一文档的后续任务不再重新读取文件和交叉引用表
+_worker_reader: Optional[Tuple[str, Any]] = None
+
+
+def open_pdf(path: str):
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    # Published reports are often encrypted with an owner password only, which opens with an empty user password
+    if reader.is_encrypted and not reader.decrypt(""):
+        raise ValueError(f"PDF {path} is password protected")
+    return reader
+
+
+def extract_pages(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """提取第 start 到 end-1 页（从0开始）的文本，返回 (页码, 文本)，页码从1开始；在工作进程中执行"""
+    global _worker_reader
+    if _worker_reader is None or _worker_reader[0] != path:
+        _worker_reader = (path, open_pdf(path))
+    reader = _worker_reader[1]
+    return [(number + 1, reader.pages[number].extract_text() or "") for number in range(start, end)]
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """进程内共享的解析进程池
+
+    使用spawn启动工作进程：构建进程中已有嵌入线程和LanceDB的运行时线程，fork这样的进程不安全。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pdf_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def iter_pdf_pages(path: Union[str, Path], pages_per_task: int = PDF_PAGES_PER_TASK) -> Iterator[Tuple[int, str]]:
+    """按页码顺序逐页返回 (页码, 文本)
+
+    同时最多有 2 * PDF_PARSE_WORKERS 个页面范围在提取或等待读取，读取方处理得慢时不会继续提前解析。
+    """
+    path = str(path)
+    reader = open_pdf(path)
+    # Reading the page tree does not parse the page contents
+    page_count = len(reader.pages)
+    if PDF_PARSE_WORKERS <= 1 or page_count <= pages_per_task:
+        for number in range(page_count):
+            yield number + 1, reader.pages[number].extract_text() or ""
+        return
+    del reader
+
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    pool = get_pdf_pool()
+    pending = deque()
+    try:
+        for start, end in ranges:
+            pending.append(pool.submit(extract_pages, path, start, end))
+            if len(pending) >= 2 * PDF_PARSE_WORKERS:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # The consumer stopped early or a page failed: drop the ranges that have not started
+        for future in pending:
+            future.cancel()
+
+
+def read_pdf_documents(path: Union[str, Path], chunk_size: int = PDF_CHUNK_SIZE) -> Iterator[Document]:
+    """逐页分块的PDF文档生成器，分块元数据带页码
+
+    与 PDFReader(chunk=True) 一样按页拆分后再分块；页眉页脚中的页码识别需要先读完整份文档，这里不做。
+    """
+    path = Path(path)
+    doc_name = path.name.split(".")[0]
+    chunking = FixedSizeChunking(chunk_size=chunk_size)
+    for page_number, text in iter_pdf_pages(path):
+        if text.strip():
+            page = Document(name=doc_name, id=f"{doc_name}_{page_number}", meta_data={"page": page_number}, content=text)
+            yield from chunking.chunk(page)
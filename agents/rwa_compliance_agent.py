@@ -5,182 +5,33 @@ from agno.models.openai import OpenAIChat
 from agno.tools.baidusearch import BaiduSearchTools
 from agno.tools.website import WebsiteTools
 from agno.tools.reasoning import ReasoningTools
-from agno.memory.v2.db.sqlite import SqliteMemoryDb
-from agno.memory.v2.memory import Memory
-from agno.storage.sqlite import SqliteStorage
-from agno.knowledge.website import WebsiteKnowledgeBase
-from agno.knowledge.pdf import PDFKnowledgeBase
-from agno.knowledge.combined import CombinedKnowledgeBase
-from agno.vectordb.lancedb import LanceDb
-from agno.embedder.openai import OpenAIEmbedder
 from textwrap import dedent
-from config import get_ai_model, Config
-import os
+from config import get_ai_model
+from agents.storage_provider import get_memory, get_storage
+from agents.knowledge_ingestion import COMPLIANCE_TABLE, get_knowledge_embedder, open_prebuilt_knowledge
 
 
 def get_rwa_compliance_agent() -> Agent:
     """Create and return the RWA compliance and regulation agent."""
     
     # Initialize shared memory and storage
-    memory_db = SqliteMemoryDb(table_name="rwa_compliance_memory", db_file="storage/rwa_memory.db")
-    memory = Memory(db=memory_db)
-    storage = SqliteStorage(table_name="rwa_compliance_sessions", db_file="storage/rwa_storage.db")
+    memory = get_memory("rwa_compliance_memory")
+    storage = get_storage("rwa_compliance_sessions")
     
 
     # Initialize embedder for knowledge base
-    embedder = None
-    if Config.AZURE_EMBEDDER_OPENAI_API_KEY:
-        try:
-            embedder_config = Config.get_azure_embedder_config()
-            embedder = OpenAIEmbedder(
-                id=embedder_config["id"],
-                api_key=embedder_config["api_key"],
-            )
-            print(f"✅ Successfully initialized Azure OpenAI embedder configuration")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not initialize Azure embedder: {str(e)}")
-            print(f"   Will use default OpenAI embedder if OPENAI_API_KEY is set")
-            embedder = None
+    embedder = get_knowledge_embedder()
 
-    # Fallback to standard OpenAI embedder if Azure fails
-    if embedder is None and os.getenv("OPENAI_API_KEY"):
-        try:
-            embedder = OpenAIEmbedder(
-                id="text-embedding-ada-002",
-                api_key=os.getenv("OPENAI_API_KEY"),
-            )
-            print(f"✅ Using OpenAI embedder as fallback")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not initialize OpenAI embedder: {str(e)}")
-            embedder = None
+    if embedder is None:
+        print("⚠️ No embedder available. Knowledge search will use the local BM25 keyword index only")
+        print("   To enable vector search, set AZURE_EMBEDDER_OPENAI_API_KEY or OPENAI_API_KEY")
 
-    # Initialize vector database with error handling
-    vector_db = None
-    if embedder is not None:
-        try:
-            print(f"\n🔧 Initializing vector database (this may take a moment)...")
-            vector_db = LanceDb(
-                table_name="rwa_compliance_knowledge",
-                uri="./storage/knowledge/lancedb",
-                embedder=embedder
-            )
-            print(f"✅ Vector database initialized successfully")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not initialize vector database: {str(e)}")
-            print(f"   Agent will run without vector-based knowledge base")
-            vector_db = None
-    else:
-        print(f"⚠️ No embedder available. Agent will run without vector-based knowledge base")
-        print(f"   To enable knowledge base, set AZURE_EMBEDDER_OPENAI_API_KEY or OPENAI_API_KEY")
-    
-    # Initialize knowledge bases
-    knowledge_bases = []
-    
-    # Web-based knowledge sources (regulatory websites)
-    web_sources = [
-        {
-            "name": "US SEC - Tokenization Regulation",
-            "url": "https://www.sec.gov/newsroom/speeches-statements/uyeda-remarks-crypto-roundtable-tokenization-051225",
-            "description": "US Securities and Exchange Commission on crypto and tokenization"
-        },
-        {
-            "name": "China Crypto Regulation",
-            "url": "https://cms.law/en/int/expert-guides/cms-expert-guide-to-crypto-regulation/china",
-            "description": "Expert guide to crypto regulation in China"
-        },
-        {
-            "name": "UAE ADGM Digital Assets Rulebook",
-            "url": "https://en.adgm.thomsonreuters.com/rulebook/digital-assets",
-            "description": "Abu Dhabi Global Market digital assets regulatory framework"
-        },
-        {
-            "name": "EU MiCA Regulation",
-            "url": "https://www.esma.europa.eu/esmas-activities/digital-finance-and-innovation/markets-crypto-assets-regulation-mica",
-            "description": "European Union Markets in Crypto-Assets Regulation"
-        },
-        {
-            "name": "Switzerland FINMA FinTech",
-            "url": "https://www.finma.ch/en/documentation/dossier/dossier-fintech/entwicklungen-im-bereich-fintech",
-            "description": "Swiss Financial Market Supervisory Authority FinTech developments"
-        },
-    ]
-    
-    # PDF knowledge sources
-    pdf_sources = [
-        {
-            "name": "Hong Kong SFC Tokenisation Seminar",
-            "path": "./knowledge/compliance/hk_sfc_tokenisation.pdf",
-            "url": "https://www.sfc.hk/-/media/files/PCIP/FAQ-PDFS/HKIFA-tokenisation-seminar-10-Jan-2024.pdf",
-            "description": "Hong Kong Securities and Futures Commission tokenisation guidance"
-        },
-        {
-            "name": "UK FCA Crypto Regulation",
-            "path": "./knowledge/compliance/uk_fca_crypto.pdf",
-            "url": "https://www.fca.org.uk/publication/consultation/cp25-28.pdf",
-            "description": "UK Financial Conduct Authority crypto asset regulation"
-        },
-        {
-            "name": "OECD Tokenisation Report",
-            "path": "./knowledge/compliance/oecd_tokenisation.pdf",
-            "url": "https://www.oecd.org/content/dam/oecd/en/publications/reports/2021/11/understanding-the-tokenisation-of-assets-in-financial-markets_2e657111/c033401a-en.pdf",
-            "description": "OECD report on understanding tokenisation of assets in financial markets"
-        },
-    ]
-    
-    # Load web knowledge bases
-    print("\n📚 Loading regulatory knowledge bases...")
-    
-    # Only load knowledge bases if embedder and vector_db are available
-    if embedder is not None and vector_db is not None:
-        for web_source in web_sources:
-            try:
-                web_kb = WebsiteKnowledgeBase(
-                    urls=[web_source["url"]],
-                    vector_db=LanceDb(
-                        table_name=f"rwa_compliance_{web_source['name'].lower().replace(' ', '_').replace('-', '_')}",
-                        uri="./storage/knowledge/lancedb",
-                        embedder=embedder,
-                    ),
-                    max_links=5,
-                    max_depth=2,
-                )
-                knowledge_bases.append(web_kb)
-                print(f"✅ Loaded: {web_source['name']}")
-            except Exception as e:
-                print(f"⚠️ Warning: Could not load {web_source['name']}: {str(e)}")
-        
-        # Load PDF knowledge bases (if files exist)
-        for pdf_source in pdf_sources:
-            pdf_path = pdf_source["path"]
-            if os.path.exists(pdf_path):
-                try:
-                    pdf_kb = PDFKnowledgeBase(
-                        path=pdf_path,
-                        vector_db=LanceDb(
-                            table_name=f"rwa_compliance_{pdf_source['name'].lower().replace(' ', '_').replace('-', '_')}",
-                            uri="./storage/knowledge/lancedb",
-                            embedder=embedder,
-                        ),
-                    )
-                    knowledge_bases.append(pdf_kb)
-                    print(f"✅ Loaded: {pdf_source['name']} from {pdf_path}")
-                except Exception as e:
-                    print(f"⚠️ Warning: Could not load {pdf_source['name']}: {str(e)}")
-            else:
-                print(f"⚠️ Warning: PDF not found at {pdf_path}")
-                print(f"   Download from: {pdf_source['url']}")
-    else:
-        print(f"⚠️ Skipping knowledge base loading (embedder not available)")
-        print(f"   Agent will rely on web search tools for information retrieval")
-    
-    # Combine knowledge bases
-    knowledge = None
-    if knowledge_bases:
-        try:
-            knowledge = CombinedKnowledgeBase(sources=knowledge_bases)
-            print(f"✅ Successfully combined {len(knowledge_bases)} knowledge bases")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not combine knowledge bases: {str(e)}")
+    # Open the prebuilt knowledge read-only (built offline by tools/build_knowledge_base.py)
+    print("\n📚 Opening prebuilt regulatory knowledge base...")
+    # Queries naming a jurisdiction only scan that jurisdiction's (and international) documents
+    knowledge = open_prebuilt_knowledge([COMPLIANCE_TABLE], embedder, detect_jurisdiction=True)
+    if knowledge is not None:
+        print(f"✅ Opened prebuilt regulatory knowledge base ({knowledge.retrieval_mode} retrieval)")
     else:
         print("⚠️ Warning: No knowledge bases loaded. Agent will rely on web search only.")
     
@@ -196,6 +47,7 @@ def get_rwa_compliance_agent() -> Agent:
         
         # Knowledge base configuration
         knowledge=knowledge,
+        retriever=knowledge.retrieve if knowledge else None,
         search_knowledge=True if knowledge else False,
         
         instructions=dedent("""
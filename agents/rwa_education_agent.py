@@ -5,44 +5,27 @@ from agno.models.openai import OpenAIChat
 from agno.tools.baidusearch import BaiduSearchTools
 from agno.tools.website import WebsiteTools
 from agno.tools.reasoning import ReasoningTools
-from agno.memory.v2.db.sqlite import SqliteMemoryDb
-from agno.memory.v2.memory import Memory
-from agno.storage.sqlite import SqliteStorage
-from agno.knowledge.pdf import PDFKnowledgeBase
-from agno.vectordb.lancedb import LanceDb
 from textwrap import dedent
 from config import get_ai_model
-import os
+from agents.storage_provider import get_memory, get_storage
+from agents.knowledge_ingestion import EDUCATION_TABLE, get_knowledge_embedder, open_prebuilt_knowledge
 
 
 def get_rwa_education_agent() -> Agent:
     """Create and return the RWA education agent."""
     
     # Initialize shared memory and storage (consistent with RWA team)
-    memory_db = SqliteMemoryDb(table_name="rwa_memory", db_file="storage/rwa_memory.db")
-    memory = Memory(db=memory_db)
-    storage = SqliteStorage(table_name="rwa_sessions", db_file="storage/rwa_storage.db")
+    memory = get_memory("rwa_memory")
+    storage = get_storage("rwa_sessions")
     
-    # Initialize knowledge base with RWA documentation
-    pdf_path = "./agents/Rwa Tokenization Key Trends 2025 Market Outlook Report Brickken V2.pdf"
-    knowledge = None
-    
-    if os.path.exists(pdf_path):
-        try:
-            knowledge = PDFKnowledgeBase(
-                path=pdf_path,
-                vector_db=LanceDb(
-                    table_name="rwa_education",
-                    uri="./storage/knowledge/lancedb",
-                ),
-            )
-            print(f"✅ Successfully loaded RWA knowledge from {pdf_path}")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not load RWA knowledge PDF: {str(e)}")
-            print(f"   Knowledge base will rely on web search instead.")
+    # Open the prebuilt RWA documentation read-only (built offline by tools/build_knowledge_base.py);
+    # without an embedder only the local BM25 keyword index is used
+    embedder = get_knowledge_embedder()
+    knowledge = open_prebuilt_knowledge([EDUCATION_TABLE], embedder)
+    if knowledge is not None:
+        print(f"✅ Successfully opened prebuilt RWA knowledge {EDUCATION_TABLE} ({knowledge.retrieval_mode} retrieval)")
     else:
-        print(f"⚠️ Warning: RWA knowledge PDF not found at {pdf_path}")
-        print(f"   Knowledge base will rely on web search instead.")
+        print("   Knowledge base will rely on web search instead.")
     
     agent = Agent(
         name="RWA Education Agent",
@@ -56,6 +39,7 @@ def get_rwa_education_agent() -> Agent:
         
         # Knowledge base configuration (optional)
         knowledge=knowledge,
+        retriever=knowledge.retrieve if knowledge else None,
         search_knowledge=True if knowledge else False,  # Enable Agentic RAG if knowledge available
         
         instructions=dedent("""
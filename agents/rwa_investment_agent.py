@@ -5,26 +5,38 @@ from agno.models.openai import OpenAIChat
 from agno.tools.baidusearch import BaiduSearchTools
 from agno.tools.website import WebsiteTools
 from agno.tools.reasoning import ReasoningTools
-from agno.memory.v2.db.sqlite import SqliteMemoryDb
-from agno.memory.v2.memory import Memory
-from agno.storage.sqlite import SqliteStorage
+from agno.tools.mcp import MCPTools
 from textwrap import dedent
 from config import get_ai_model
+from agents.storage_provider import get_memory, get_storage
 import os
 
+# Ethereum MCP server (on-chain oracle price feeds), started read-only: no wallet key, no background tasks
+ETHEREUM_MCP_COMMAND = "python tools/web3_mcp_server.py"
+ETHEREUM_MCP_ENV = {"WEB3_MCP_READ_ONLY": "1"}
+# Market data tools the investment agent may call; signing tools are never exposed to it
+ETHEREUM_MCP_TOOLS = ["get_price_feeds", "get_price_feed_history", "get_dex_liquidity"]
+
 
 def get_rwa_investment_agent() -> Agent:
     """Create and return the RWA investment agent."""
     
     # Initialize shared memory and storage (consistent with RWA team)
-    memory_db = SqliteMemoryDb(table_name="rwa_investment_memory", db_file="storage/rwa_memory.db")
-    memory = Memory(db=memory_db)
-    storage = SqliteStorage(table_name="rwa_investment_sessions", db_file="storage/rwa_storage.db")
+    memory = get_memory("rwa_investment_memory")
+    storage = get_storage("rwa_investment_sessions")
+    
+    # On-chain reference prices (Chainlink feeds via Multicall3)
+    ethereum_mcp_tool = MCPTools(
+        command=ETHEREUM_MCP_COMMAND,
+        env=ETHEREUM_MCP_ENV,
+        include_tools=ETHEREUM_MCP_TOOLS,
+        timeout_seconds=60  # Increase timeout for server startup
+    )
     
     agent = Agent(
         name="RWA Investment Agent",
         model=get_ai_model(model_type="azure"),
-        tools=[BaiduSearchTools(), WebsiteTools(), ReasoningTools()],
+        tools=[BaiduSearchTools(), WebsiteTools(), ReasoningTools(), ethereum_mcp_tool],
         description="You are an expert RWA (Real World Asset) investment advisor that provides comprehensive investment analysis, portfolio recommendations, and risk assessments for tokenized real-world assets.",
         
         # Memory and storage configuration
@@ -60,6 +72,9 @@ def get_rwa_investment_agent() -> Agent:
             Tools to Use:
             - Use WebsiteTools to scrape data from https://app.rwa.xyz/
             - Use BaiduSearchTools to find additional project information
+            - Use `get_price_feeds` to get on-chain reference prices (commodities such as XAU/USD, FX such as EUR/USD, crypto) for many feeds in one call instead of scraping price pages
+            - Use `get_price_feed_history` for a feed's recent rounds as a price time series
+            - Use `get_dex_liquidity` with the token's DEX pool addresses to measure on-chain liquidity depth and slippage curves for several RWA tokens in one call
             - Cross-reference data from multiple sources for accuracy
             
             ### 2. RWA Asset Classification
@@ -174,7 +189,7 @@ def get_rwa_investment_agent() -> Agent:
             Analyze historical performance of RWA assets:
             
             **Backtesting Methodology:**
-            - Collect historical price and yield data
+            - Collect historical price and yield data (use `get_price_feed_history` for assets with Chainlink feeds)
             - Calculate time-weighted returns (TWR) and money-weighted returns (MWR)
             - Analyze return distribution and statistical properties
             - Identify return drivers and correlation factors
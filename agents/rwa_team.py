@@ -1,32 +1,66 @@
 """Main Agno Agent for the Streamlit Application"""
 
+import threading
+from typing import Callable, List, Tuple
+
 from agno.agent import Agent
 from agno.team import Team
 from config import get_ai_model
+from agents.storage_provider import get_memory, get_storage
 from agents.asset_verification_agent import get_asset_verification_agent
 from agents.asset_valuation_agent import get_asset_valuation_agent
 from agents.onchain_notarization_agent import get_onchain_notarization_agent
 from agents.rwa_compliance_agent import get_rwa_compliance_agent
 from agents.rwa_investment_agent import get_rwa_investment_agent
-from agno.memory.v2.db.sqlite import SqliteMemoryDb
-from agno.memory.v2.memory import Memory
-from agno.storage.sqlite import SqliteStorage
 from agno.tools.reasoning import ReasoningTools
 
 # Initialize memory and storage
-memory_db = SqliteMemoryDb(table_name="rwa_team_memory", db_file="storage/rwa_memory.db")
-memory = Memory(db=memory_db)
-sessions = SqliteStorage(table_name="rwa_team_sessions", db_file="storage/rwa_sessions.db")
+memory = get_memory("rwa_team_memory")
+sessions = get_storage("rwa_team_sessions", db_file="storage/rwa_sessions.db")
+
+
+class LazyMemberTeam(Team):
+    """按需构建成员的团队：成员先以只有名称和职责的轻量Agent注册，路由首次选中时才调用工厂函数构建，之后复用已构建的实例
+
+    依赖agno Team的 _find_member_by_id（route模式转发任务时查找成员）和 _initialize_member，
+    requirements.txt 固定了经过验证的agno版本，升级时需重新确认这两个方法的行为。
+    """
+
+    def __init__(self, member_factories: List[Tuple[str, str, Callable[[], Agent]]], **kwargs):
+        super().__init__(members=[Agent(name=name, role=role) for name, role, _ in member_factories], **kwargs)
+        # 成员索引 -> 工厂函数，构建完成后移除
+        self._member_factories = {index: factory for index, (_, _, factory) in enumerate(member_factories)}
+        # 每个成员一把锁：构建一个成员时不阻塞其他成员的构建和查找
+        self._member_build_locks = {index: threading.Lock() for index in self._member_factories}
+
+    def _find_member_by_id(self, member_id: str):
+        result = super()._find_member_by_id(member_id)
+        if result is None:
+            return None
+        index, _ = result
+        if index in self._member_factories:
+            with self._member_build_locks[index]:
+                factory = self._member_factories.get(index)
+                if factory is not None:
+                    # 构建失败时保留工厂函数，下次选中时重试
+                    member = factory()
+                    # 与Team初始化成员时相同的设置（调试、会话状态、team_id等），占位Agent上的初始化不会带到新实例
+                    self._initialize_member(member, session_id=self.session_id)
+                    self.members[index] = member
+                    del self._member_factories[index]
+        return index, self.members[index]
 
-asset_valuation_agent = get_asset_valuation_agent()
-asset_verification_agent = get_asset_verification_agent()
-onchain_notarization_agent = get_onchain_notarization_agent()
-compliance_agent = get_rwa_compliance_agent()
-investment_agent = get_rwa_investment_agent()
 
-rwa_team = Team(
+# 名称需与各工厂函数创建的Agent名称一致
+rwa_team = LazyMemberTeam(
     name="RWA Team",
-    members=[asset_valuation_agent, asset_verification_agent, onchain_notarization_agent, compliance_agent,investment_agent],
+    member_factories=[
+        ("Asset Valuation Agent", "Value assets from verification results and market data", get_asset_valuation_agent),
+        ("Asset Verification Agent", "Verify uploaded asset documents and certificates", get_asset_verification_agent),
+        ("Onchain Notarization Agent", "Generate token parameters and deploy token contracts on testnets", get_onchain_notarization_agent),
+        ("RWA Compliance Agent", "Regulatory and compliance guidance for RWA tokenization", get_rwa_compliance_agent),
+        ("RWA Investment Agent", "RWA investment analysis and portfolio recommendations", get_rwa_investment_agent),
+    ],
     model=get_ai_model(model_type="azure"),
     mode="route",
     tools=[ReasoningTools()],
@@ -47,7 +81,7 @@ rwa_team = Team(
     ### Team Members and Responsibilities:
     - **asset_verification_agent**: Verify asset (property certificates, land certificates, etc.), verify their authenticity, validity and legality, generate verification reports and record key asset information
     - **asset_valuation_agent**: Based on asset verification information and detailed information provided by users (asset type, region, area, years of use, etc.), conduct professional valuation of assets through market data queries
-    - **onchain_notarization_agent**: According to valuation results ,generate token parameters (token name, symbol, supply, etc.), deploy ERC20 token contracts on Ethereum Sepolia testnet
+    - **onchain_notarization_agent**: According to valuation results ,generate token parameters (token name, symbol, supply, etc.), deploy ERC20 token contracts on the cheapest and fastest healthy testnet (Sepolia or the Arbitrum/Optimism/Base Sepolia L2 testnets, selected automatically unless the user names one)
     - **compliance_agent**: Provide regulatory and compliance guidance for RWA tokenization across multiple jurisdictions, including securities laws, licensing requirements, KYC/AML obligations, and latest regulatory news
     - **investment_agent**: Provide comprehensive RWA investment analysis, portfolio recommendations, asset comparisons, risk assessments, and market research based on data from RWA platforms
     
@@ -81,7 +115,7 @@ rwa_team = Team(
     
     If **User wants asset tokenization**
        - Retrieve user specified token information, if not specified, generate complete Token metadata(name, symbol, supply, etc.) based on valuation report 
-       - Call onchain_notarization_agent to deploy ERC20 contract on Ethereum Sepolia testnet
+       - Call onchain_notarization_agent to deploy ERC20 contract (testnet selected automatically unless the user specifies one)
        - If deployment succeeds:
          * Return contract address
          * Return transaction hash
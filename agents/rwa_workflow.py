@@ -6,14 +6,12 @@ from agno.workflow.v2 import Workflow, Step, Router
 from agno.workflow.v2.types import StepInput, StepOutput
 from agno.tools.mcp import MCPTools
 from config import get_ai_model
+from agents.storage_provider import get_memory, get_storage
 from agents.asset_verification_agent import get_asset_verification_agent
 from agents.asset_valuation_agent import get_asset_valuation_agent
 from agents.onchain_notarization_agent import get_onchain_notarization_agent
 from agents.rwa_compliance_agent import get_rwa_compliance_agent
 from agents.rwa_investment_agent import get_rwa_investment_agent
-from agno.memory.v2.db.sqlite import SqliteMemoryDb
-from agno.memory.v2.memory import Memory
-from agno.storage.sqlite import SqliteStorage
 from agno.tools.reasoning import ReasoningTools
 
 # Add project root directory to Python path
@@ -42,9 +40,8 @@ except ImportError as e:
 
 
 # Initialize shared memory and storage
-memory_db = SqliteMemoryDb(table_name="rwa_workflow_memory", db_file="storage/rwa_workflow.db")
-memory = Memory(db=memory_db)
-storage = SqliteStorage(table_name="rwa_workflow_sessions", db_file="storage/rwa_workflow.db")
+memory = get_memory("rwa_workflow_memory", db_file="storage/rwa_workflow.db")
+storage = get_storage("rwa_workflow_sessions", db_file="storage/rwa_workflow.db")
 
 # Initialize each agent
 asset_verification_agent = get_asset_verification_agent()
@@ -0,0 +1,95 @@
+"""Shared SQLite memory and storage provider for all agents
+
+每个数据库文件只创建一个SQLAlchemy引擎（连接池），连接启用WAL和busy_timeout，
+各Agent通过表名获取共享的memory/storage句柄，避免重复引擎和线程间的锁竞争。
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from agno.memory.v2.db.sqlite import SqliteMemoryDb
+from agno.memory.v2.memory import Memory
+from agno.storage.sqlite import SqliteStorage
+
+MEMORY_DB_FILE = "storage/rwa_memory.db"
+STORAGE_DB_FILE = "storage/rwa_storage.db"
+
+# 等待其他连接释放写锁的最长时间（毫秒）
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+# 每个数据库文件的连接池大小（WAL模式下读连接可以并发）
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "8"))
+
+_engines: Dict[str, Engine] = {}
+_memory_dbs: Dict[Tuple[str, str], SqliteMemoryDb] = {}
+_storages: Dict[Tuple[str, str], SqliteStorage] = {}
+_lock = threading.Lock()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def get_sqlite_engine(db_file: str) -> Engine:
+    """获取数据库文件对应的共享引擎，同一文件（按绝对路径）只创建一次"""
+    db_path = str(Path(db_file).resolve())
+    with _lock:
+        engine = _engines.get(db_path)
+        if engine is None:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            engine = create_engine(
+                f"sqlite:///{db_path}",
+                pool_size=SQLITE_POOL_SIZE,
+                max_overflow=SQLITE_MAX_OVERFLOW,
+                pool_pre_ping=True,
+                connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            )
+            event.listen(engine, "connect", _set_sqlite_pragmas)
+            _engines[db_path] = engine
+        return engine
+
+
+def get_memory_db(table_name: str, db_file: str = MEMORY_DB_FILE) -> SqliteMemoryDb:
+    """获取共享引擎上指定表的memory句柄"""
+    key = (str(Path(db_file).resolve()), table_name)
+    engine = get_sqlite_engine(db_file)
+    with _lock:
+        if key not in _memory_dbs:
+            memory_db = SqliteMemoryDb(table_name=table_name, db_engine=engine)
+            if memory_db.db_engine is not engine:
+                # 部分agno版本的SqliteMemoryDb会忽略传入的db_engine而改用内存数据库，这里重新绑定到共享引擎
+                memory_db.db_engine = engine
+                memory_db.inspector = inspect(engine)
+                memory_db.Session = scoped_session(sessionmaker(bind=engine))
+            _memory_dbs[key] = memory_db
+        return _memory_dbs[key]
+
+
+def get_memory(table_name: str, db_file: str = MEMORY_DB_FILE) -> Memory:
+    """创建使用共享memory句柄的Memory（Memory对象本身按Agent独立）"""
+    return Memory(db=get_memory_db(table_name, db_file))
+
+
+def get_storage(table_name: str, db_file: str = STORAGE_DB_FILE) -> SqliteStorage:
+    """获取共享引擎上指定表的会话storage句柄"""
+    key = (str(Path(db_file).resolve()), table_name)
+    engine = get_sqlite_engine(db_file)
+    with _lock:
+        if key not in _storages:
+            storage = SqliteStorage(table_name=table_name, db_engine=engine)
+            if storage.db_engine is not engine:
+                # 与SqliteMemoryDb相同：忽略db_engine时会话记录会写入进程内的内存数据库，重启即丢失
+                storage.db_engine = engine
+                storage.inspector = inspect(engine)
+                storage.SqlSession = sessionmaker(bind=engine)
+            _storages[key] = storage
+        return _storages[key]
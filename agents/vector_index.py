@@ -0,0 +1,94 @@
+"""ANN index lifecycle for the LanceDB knowledge tables
+
+表的行数达到阈值后建立向量索引（IVF_PQ 或 IVF_HNSW_SQ），小表保持精确的暴力检索；批量写入后未索引的行占比较小时
+增量合并进现有索引（optimize），占比较大时重新训练索引。查询参数 nprobes / refine_factor / ef 通过环境变量调整，
+可用 tools/knowledge_index_benchmark.py 按 recall@k 和查询延迟选择。
+"""
+
+import os
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+# 索引类型: IVF_PQ（内存小，适合大表）或 IVF_HNSW_SQ（召回率高，索引更大）
+KNOWLEDGE_ANN_INDEX_TYPE = os.getenv("KNOWLEDGE_ANN_INDEX_TYPE", "IVF_PQ")
+# 行数低于该值时不建索引（暴力检索足够快且结果精确；PQ训练至少需要256行）
+KNOWLEDGE_ANN_MIN_ROWS = int(os.getenv("KNOWLEDGE_ANN_MIN_ROWS", "10000"))
+# 未索引行占比超过该值时重新训练索引，否则增量合并
+KNOWLEDGE_ANN_REINDEX_FRACTION = float(os.getenv("KNOWLEDGE_ANN_REINDEX_FRACTION", "0.2"))
+# 查询参数（0表示使用LanceDB默认值）
+KNOWLEDGE_ANN_NPROBES = int(os.getenv("KNOWLEDGE_ANN_NPROBES", "20"))
+KNOWLEDGE_ANN_REFINE_FACTOR = int(os.getenv("KNOWLEDGE_ANN_REFINE_FACTOR", "0"))
+KNOWLEDGE_ANN_EF = int(os.getenv("KNOWLEDGE_ANN_EF", "0"))
+# 索引和查询使用同一距离（与agno LanceDb默认的Distance.cosine一致）
+KNOWLEDGE_ANN_DISTANCE = "cosine"
+# optimize清理旧版本时保留的天数（运行中的Agent固定在构建时的版本上，不能被清理）
+KNOWLEDGE_VERSION_RETENTION_DAYS = int(os.getenv("KNOWLEDGE_VERSION_RETENTION_DAYS", "30"))
+
+INDEX_TYPES = ("IVF_PQ", "IVF_HNSW_SQ")
+
+
+def index_config(index_type: str = KNOWLEDGE_ANN_INDEX_TYPE):
+    """索引配置（分区数、PQ子向量数使用LanceDB按行数和维度推算的默认值）"""
+    from lancedb.index import HnswSq, IvfPq
+
+    if index_type == "IVF_PQ":
+        return IvfPq(distance_type=KNOWLEDGE_ANN_DISTANCE)
+    if index_type == "IVF_HNSW_SQ":
+        return HnswSq(distance_type=KNOWLEDGE_ANN_DISTANCE)
+    raise ValueError(f"Unsupported index type {index_type}, expected one of {', '.join(INDEX_TYPES)}")
+
+
+def vector_index_stats(table, vector_column: str = "vector"):
+    """表上向量列索引的统计信息，没有索引时返回None"""
+    for index in table.list_indices():
+        if list(index.columns) == [vector_column]:
+            return table.index_stats(index.name)
+    return None
+
+
+def ensure_vector_index(table, vector_column: str = "vector", index_type: str = KNOWLEDGE_ANN_INDEX_TYPE,
+                        min_rows: int = KNOWLEDGE_ANN_MIN_ROWS, rebuild: bool = False) -> str:
+    """按当前行数维护表的向量索引，返回执行的操作: skipped / created / rebuilt / optimized / current"""
+    rows = table.count_rows()
+    stats = vector_index_stats(table, vector_column)
+    if stats is None:
+        if rows < min_rows:
+            return "skipped"
+        table.create_index(vector_column, config=index_config(index_type))
+        return "created"
+
+    unindexed_fraction = stats.num_unindexed_rows / rows if rows else 0.0
+    if rebuild or stats.index_type != index_type or unindexed_fraction > KNOWLEDGE_ANN_REINDEX_FRACTION:
+        # Retrain partitions (and PQ codebooks) on the current data
+        table.create_index(vector_column, config=index_config(index_type), replace=True)
+        return "rebuilt"
+    if stats.num_unindexed_rows:
+        # Appends the new rows to the existing index and compacts the small fragments of the bulk writes
+        table.optimize(cleanup_older_than=timedelta(days=KNOWLEDGE_VERSION_RETENTION_DAYS))
+        return "optimized"
+    return "current"
+
+
+def describe_vector_index(table, vector_column: str = "vector") -> Optional[Dict[str, Any]]:
+    stats = vector_index_stats(table, vector_column)
+    if stats is None:
+        return None
+    return {
+        "type": stats.index_type,
+        "distance": stats.distance_type,
+        "indexed_rows": stats.num_indexed_rows,
+        "unindexed_rows": stats.num_unindexed_rows,
+    }
+
+
+def apply_search_params(query, nprobes: int = KNOWLEDGE_ANN_NPROBES, refine_factor: int = KNOWLEDGE_ANN_REFINE_FACTOR,
+                        ef: int = KNOWLEDGE_ANN_EF):
+    """设置向量查询的距离和ANN参数（没有索引的表会忽略ANN参数）"""
+    query = query.distance_type(KNOWLEDGE_ANN_DISTANCE)
+    if nprobes:
+        query = query.nprobes(nprobes)
+    if refine_factor:
+        query = query.refine_factor(refine_factor)
+    if ef:
+        query = query.ef(ef)
+    return query
@@ -143,7 +143,7 @@ I am a professional RWA team system with 5 expert agents ready to help you:
             agno_images = create_agno_images_from_bytes(st.session_state.uploaded_files_data)
             
             # Create File information text (for all files)
-            file_names = [f['name'] for f in st.session_state.uploaded_files_data]
+            file_names = [f"{f['name']} (sha256: {f['sha256']})" for f in st.session_state.uploaded_files_data]
             file_info = f"\n\n[Uploaded Files: {', '.join(file_names)}]"
             
             # Display uploaded file information
@@ -3,6 +3,7 @@
 from typing import List, Dict, Any
 import streamlit as st
 import base64
+import hashlib
 import io
 from agno.media import Image
 import tempfile
@@ -60,7 +61,8 @@ def process_uploaded_files(uploaded_files) -> List[Dict[str, Any]]:
             "size": uploaded_file.size,
             "size_mb": uploaded_file.size / (1024 * 1024),
             "content": file_content,
-            "bytes": file_bytes  # Add byte content
+            "bytes": file_bytes,  # Add byte content
+            "sha256": hashlib.sha256(file_bytes).hexdigest()  # Document fingerprint for on-chain notarization
         }
         files_data.append(file_info)
     
@@ -120,6 +122,7 @@ def format_file_info_for_agent(files_data: List[Dict[str, Any]]) -> str:
         file_info_text += f"- File Name: {file_info['name']}\n"
         file_info_text += f"- File Type: {file_info['type']}\n"
         file_info_text += f"- File Size: {file_info['size_mb']:.2f}MB\n"
+        file_info_text += f"- SHA-256: {file_info['sha256']}\n"
         file_info_text += "\n"
     
     file_info_text += "Please verify and analyze these files.\n"
@@ -1,7 +1,10 @@
 """Configuration settings for the Agno Streamlit application"""
 
 import os
-from typing import Dict, Any, Optional
+import time
+import threading
+from typing import Callable, Dict, Any, Optional, Tuple
+import httpx
 from agno.models.openai import OpenAIChat
 from agno.models.deepseek import DeepSeek
 from agno.models.base import Model
@@ -41,6 +44,11 @@ class Config:
     AZURE_EMBEDDER_OPENAI_API_VERSION: str = os.getenv("AZURE_EMBEDDER_OPENAI_API_VERSION") or "2024-07-01-preview"
     AZURE_EMBEDDER_DEPLOYMENT: str = os.getenv("AZURE_EMBEDDER_DEPLOYMENT") or "text-embedding-ada-002"
 
+    # 模型HTTP连接池配置（同一模型端点的所有Agent共享）
+    MODEL_HTTP_MAX_CONNECTIONS: int = int(os.getenv("MODEL_HTTP_MAX_CONNECTIONS", "20"))
+    MODEL_HTTP_MAX_KEEPALIVE: int = int(os.getenv("MODEL_HTTP_MAX_KEEPALIVE", "10"))
+    MODEL_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("MODEL_HTTP_KEEPALIVE_EXPIRY", "60"))
+
     @classmethod
     def validate_config(cls) -> bool:
         """验证必要的配置是否存在"""
@@ -106,9 +114,134 @@ class Config:
         }
 
 
+class _MeteredStream(httpx.SyncByteStream):
+    """包装响应体流：流被关闭（读完或调用方提前关闭）时才结束一次请求的计量"""
+
+    def __init__(self, stream: httpx.SyncByteStream, on_close: Callable[[bool], None]):
+        self._stream = stream
+        self._on_close = on_close
+        self._failed = False
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        except Exception:
+            self._failed = True
+            raise
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._stream.close()
+        finally:
+            self._on_close(self._failed)
+
+
+class _MeteredTransport(httpx.HTTPTransport):
+    """统计请求数、并发数、错误数和耗时的HTTP传输层
+
+    并发数和耗时覆盖到响应体读取结束，流式响应（逐token返回）不会在收到响应头时就被计为完成。
+    """
+
+    def __init__(self, metrics: Dict[str, Any], lock: threading.Lock, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+        self.lock = lock
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with self.lock:
+            self.metrics["requests"] += 1
+            self.metrics["in_flight"] += 1
+            self.metrics["max_in_flight"] = max(self.metrics["max_in_flight"], self.metrics["in_flight"])
+        started = time.perf_counter()
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            self._finish(started, failed=True)
+            raise
+        response.stream = _MeteredStream(
+            response.stream,
+            lambda stream_failed: self._finish(started, failed=stream_failed or response.status_code >= 400),
+        )
+        return response
+
+    def _finish(self, started: float, failed: bool) -> None:
+        with self.lock:
+            self.metrics["in_flight"] -= 1
+            self.metrics["errors"] += int(failed)
+            self.metrics["total_seconds"] += time.perf_counter() - started
+
+
+class ModelClientPool:
+    """进程级模型HTTP客户端注册表，按 (model_type, model_id, endpoint) 复用httpx客户端及其keep-alive连接"""
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, str, str], httpx.Client] = {}
+        self._metrics: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, model_type: str, model_id: str, endpoint: str) -> httpx.Client:
+        """获取（必要时创建）指定模型端点的共享HTTP客户端"""
+        key = (model_type, model_id, endpoint)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                metrics = {"models": 0, "requests": 0, "in_flight": 0, "max_in_flight": 0, "errors": 0, "total_seconds": 0.0}
+                transport = _MeteredTransport(
+                    metrics,
+                    threading.Lock(),
+                    limits=httpx.Limits(
+                        max_connections=Config.MODEL_HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=Config.MODEL_HTTP_MAX_KEEPALIVE,
+                        keepalive_expiry=Config.MODEL_HTTP_KEEPALIVE_EXPIRY,
+                    ),
+                )
+                client = httpx.Client(transport=transport)
+                self._clients[key] = client
+                self._metrics[key] = metrics
+            self._metrics[key]["models"] += 1
+            return client
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """各模型端点的连接池使用情况"""
+        with self._lock:
+            items = list(self._clients.items())
+        result = {}
+        for (model_type, model_id, endpoint), client in items:
+            transport = client._transport
+            with transport.lock:
+                metrics = dict(transport.metrics)
+            # httpcore连接池中当前打开的连接（包括空闲的keep-alive连接）
+            connections = getattr(getattr(transport, "_pool", None), "connections", None)
+            metrics["open_connections"] = len(connections) if connections is not None else None
+            metrics["avg_seconds"] = metrics["total_seconds"] / metrics["requests"] if metrics["requests"] else 0.0
+            result[f"{model_type}:{model_id}@{endpoint}"] = metrics
+        return result
+
+    def close(self) -> None:
+        """关闭所有客户端及其连接"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            self._metrics.clear()
+        for client in clients:
+            client.close()
+
+
+model_client_pool = ModelClientPool()
+
+
+def get_model_client_metrics() -> Dict[str, Dict[str, Any]]:
+    """获取模型HTTP连接池的使用指标"""
+    return model_client_pool.get_metrics()
+
+
 def get_ai_model(model_id=None, model_type="deepseek") -> Model:
     """
-    获取AI模型实例
+    获取AI模型实例（同一模型端点的实例共享HTTP连接池）
 
     Args:
         model_id: 模型ID，如不指定则使用默认配置
@@ -121,7 +254,9 @@ def get_ai_model(model_id=None, model_type="deepseek") -> Model:
         # config = Config.get_old_version_azure_openai_config(model_id)
         # return AzureOpenAI(**config)
         config = Config.get_new_version_azure_openai_config(model_id)
-        return OpenAIChat(**config)
+        http_client = model_client_pool.get_client("azure", config["id"], config["base_url"])
+        return OpenAIChat(**config, http_client=http_client)
     else:
         config = Config.get_deepseek_config(model_id)
-        return DeepSeek(**config)
+        http_client = model_client_pool.get_client("deepseek", config["id"], config["base_url"])
+        return DeepSeek(**config, http_client=http_client)
@@ -0,0 +1,115 @@
+"""测试BM25关键词索引的查询转换、中文检索和RRF融合排序"""
+
+import sqlite3
+
+import pytest
+from agno.document import Document
+
+from agents.lexical_index import LEXICAL_INDEX_VERSION, LexicalIndex, fts_query, reciprocal_rank_fusion
+
+
+def document(name: str, content: str = "") -> Document:
+    return Document(name=name, content=content or name, meta_data={})
+
+
+# ==================== 查询转换 ====================
+
+def test_fts_query_quotes_and_deduplicates_terms():
+    assert fts_query("Tokenization, tokenization AND (SEC)?") == '"tokenization" OR "and" OR "sec"'
+
+
+def test_fts_query_without_terms_is_none():
+    assert fts_query("？！ -- ()") is None
+    assert fts_query("") is None
+
+
+def test_fts_query_splits_cjk_into_bigrams():
+    assert fts_query("稳定币") == '"稳 定" OR "定 币"'
+    assert fts_query("币") == '"币"'
+
+
+def test_fts_query_splits_on_script_boundaries():
+    assert fts_query("MiCA对稳定币的要求") == (
+        '"mica" OR "对 稳" OR "稳 定" OR "定 币" OR "币 的" OR "的 要" OR "要 求"'
+    )
+
+
+# ==================== 检索 ====================
+
+@pytest.fixture
+def index(tmp_path):
+    lexical = LexicalIndex(str(tmp_path / "lexical.db"))
+    with lexical.source_writer("mica", "compliance", "hash-1", {"jurisdiction": "EU"}) as add:
+        add("row-mica", document("MiCA", "MiCA规定稳定币发行人必须持有足额储备资产"))
+        add("row-sec", document("SEC", "The SEC treats most tokenized securities as securities offerings"))
+        add("row-mas", document("MAS", "新加坡金管局的沙盒允许代币化债券试点"))
+    yield lexical
+    lexical.close()
+
+
+def test_search_matches_chinese_query_inside_sentence(index):
+    results = index.search("MiCA对稳定币的要求", ["compliance"], limit=3)
+    assert results[0][0] == "row-mica"
+    assert "row-sec" not in [row_id for row_id, _, _ in results]
+
+
+def test_search_returns_original_content(index):
+    (row_id, found, _), = index.search("储备资产", ["compliance"], limit=1)
+    assert row_id == "row-mica"
+    assert found.content == "MiCA规定稳定币发行人必须持有足额储备资产"
+
+
+def test_search_stems_english_terms(index):
+    results = index.search("tokenizing security offering", ["compliance"], limit=3)
+    assert [row_id for row_id, _, _ in results] == ["row-sec"]
+
+
+def test_search_filters_table(index):
+    assert index.search("稳定币", ["education"], limit=3) == []
+
+
+def test_outdated_index_is_rebuilt(tmp_path):
+    db_file = str(tmp_path / "lexical.db")
+    conn = sqlite3.connect(db_file)
+    conn.executescript("""
+        CREATE TABLE sources (source_key TEXT PRIMARY KEY, table_name TEXT NOT NULL, source_hash TEXT NOT NULL,
+                              chunk_count INTEGER NOT NULL, updated_at REAL NOT NULL);
+        INSERT INTO sources VALUES ('mica', 'compliance', 'hash-1', 1, 0);
+    """)
+    conn.close()
+
+    lexical = LexicalIndex(db_file)
+    assert lexical.get_source("mica") is None
+    assert lexical.conn.execute("PRAGMA user_version").fetchone()[0] == LEXICAL_INDEX_VERSION
+    lexical.close()
+
+
+# ==================== RRF融合 ====================
+
+def test_rrf_ranks_documents_found_by_both_rankings_first():
+    vector = [("a", document("a")), ("b", document("b")), ("c", document("c"))]
+    keyword = [("c", document("c"))]
+    assert [doc.name for doc in reciprocal_rank_fusion([vector, keyword])] == ["c", "a", "b"]
+
+
+def test_rrf_merges_by_row_id_keeping_first_document():
+    first, duplicate = document("first"), document("duplicate")
+    fused = reciprocal_rank_fusion([[("x", first)], [("x", duplicate)]])
+    assert fused == [first]
+
+
+def test_rrf_single_ranking_keeps_order():
+    ranking = [(name, document(name)) for name in "abcd"]
+    assert [doc.name for doc in reciprocal_rank_fusion([ranking])] == list("abcd")
+
+
+def test_rrf_k_controls_weight_of_top_ranks():
+    # a: 第一个排序的第1名；b: 两个排序的第4名。k越小，单个第1名越占优
+    vector = [(name, document(name)) for name in "awxb"]
+    keyword = [(name, document(name)) for name in "yzvb"]
+    assert reciprocal_rank_fusion([vector, keyword], k=1)[0].name == "a"
+    assert reciprocal_rank_fusion([vector, keyword], k=60)[0].name == "b"
+
+
+def test_rrf_without_rankings_is_empty():
+    assert reciprocal_rank_fusion([]) == []
@@ -0,0 +1,61 @@
+"""测试预构建知识库经由Agent检索（BM25快照、元数据过滤、法域识别）"""
+
+import asyncio
+
+import pytest
+from agno.agent import Agent
+from agno.document import Document
+
+from agents.knowledge_ingestion import PrebuiltKnowledge
+from agents.lexical_index import LexicalIndex
+
+CHUNKS = [
+    ("row-mica", "MiCA stablecoin reserve requirements for e-money tokens",
+     {"source": "EU MiCA Regulation", "jurisdiction": "EU", "doc_type": "regulation", "date": "2023-06-09"}),
+    ("row-sec", "SEC custody rules for tokenized securities and stablecoin reserve disclosures",
+     {"source": "US SEC - Tokenization Regulation", "jurisdiction": "US", "doc_type": "speech", "date": "2025-05-12"}),
+]
+
+
+@pytest.fixture
+def knowledge(tmp_path):
+    lexical = LexicalIndex(str(tmp_path / "lexical.db"))
+    for row_id, content, metadata in CHUNKS:
+        with lexical.source_writer(metadata["source"], "compliance", row_id, metadata) as add:
+            add(row_id, Document(name=metadata["source"], content=content, meta_data=metadata))
+    yield PrebuiltKnowledge(lexical_index=lexical, lexical_tables=["compliance"], detect_jurisdiction=True)
+    lexical.close()
+
+
+def knowledge_agent(knowledge: PrebuiltKnowledge) -> Agent:
+    return Agent(knowledge=knowledge, retriever=knowledge.retrieve, search_knowledge=True)
+
+
+# ==================== Agent检索 ====================
+
+def test_agent_retrieves_prebuilt_knowledge(knowledge):
+    docs = knowledge_agent(knowledge).get_relevant_docs_from_knowledge("MiCA stablecoin reserve")
+    assert docs is not None
+    assert docs[0]["content"] == CHUNKS[0][1]
+    assert docs[0]["meta_data"]["jurisdiction"] == "EU"
+
+
+def test_agent_async_retrieval(knowledge):
+    docs = asyncio.run(knowledge_agent(knowledge).aget_relevant_docs_from_knowledge("MiCA stablecoin reserve"))
+    assert docs is not None and docs[0]["content"] == CHUNKS[0][1]
+
+
+def test_agent_passes_metadata_filters(knowledge):
+    docs = knowledge_agent(knowledge).get_relevant_docs_from_knowledge(
+        "stablecoin reserve", filters={"jurisdiction": "US"}
+    )
+    assert [doc["meta_data"]["jurisdiction"] for doc in docs] == ["US"]
+
+
+def test_agent_applies_jurisdiction_detected_in_query(knowledge):
+    docs = knowledge_agent(knowledge).get_relevant_docs_from_knowledge("stablecoin reserve rules in the US")
+    assert docs[0]["meta_data"]["jurisdiction"] == "US"
+
+
+def test_agent_without_matches_gets_none(knowledge):
+    assert knowledge_agent(knowledge).get_relevant_docs_from_knowledge("real estate appraisal") is None
@@ -0,0 +1,43 @@
+"""测试共享SQLite引擎上的memory和storage句柄"""
+
+import sqlite3
+
+from agents.storage_provider import get_memory_db, get_sqlite_engine, get_storage
+
+
+def table_names(db_file) -> set:
+    conn = sqlite3.connect(db_file)
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+
+
+# ==================== 共享引擎 ====================
+
+def test_storage_writes_sessions_to_the_shared_file_engine(tmp_path):
+    db_file = tmp_path / "storage.db"
+    storage = get_storage("rwa_sessions", db_file=str(db_file))
+    engine = get_sqlite_engine(str(db_file))
+
+    assert storage.db_engine is engine
+    assert storage.SqlSession.kw["bind"] is engine
+    storage.create()
+    assert "rwa_sessions" in table_names(db_file)
+
+
+def test_memory_db_uses_the_shared_file_engine(tmp_path):
+    db_file = tmp_path / "memory.db"
+    memory_db = get_memory_db("rwa_memory", db_file=str(db_file))
+    engine = get_sqlite_engine(str(db_file))
+
+    assert memory_db.db_engine is engine
+    memory_db.create()
+    assert "rwa_memory" in table_names(db_file)
+
+
+def test_handles_are_shared_per_file_and_table(tmp_path):
+    db_file = str(tmp_path / "storage.db")
+    assert get_storage("rwa_sessions", db_file=db_file) is get_storage("rwa_sessions", db_file=db_file)
+    team_storage = get_storage("rwa_team_sessions", db_file=db_file)
+    assert team_storage.db_engine is get_storage("rwa_sessions", db_file=db_file).db_engine
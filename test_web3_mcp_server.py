@@ -0,0 +1,706 @@
+"""测试Web3 MCP服务器的Merkle存证、资产分配和费用替换逻辑"""
+
+import os
+import sys
+import threading
+
+import pytest
+from eth_abi import encode as abi_encode
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools"))
+
+import web3_mcp_server as server
+
+
+def document_hash(index: int) -> str:
+    return "0x" + Web3.keccak(text=f"document-{index}").hex().removeprefix("0x")
+
+
+# ==================== Merkle树与证明 ====================
+
+def reference_merkle_root(document_hashes):
+    """独立实现的参考根：排序去重后的叶子逐层两两排序拼接哈希，奇数个节点时最后一个直接上移"""
+    level = [Web3.keccak(hexstr=value) for value in sorted(set(document_hashes))]
+    while len(level) > 1:
+        level = [Web3.keccak(b"".join(sorted(level[i:i + 2]))) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return "0x" + level[0].hex().removeprefix("0x")
+
+
+def test_merkle_single_leaf_root_is_leaf():
+    root, proofs = server.build_merkle_tree([document_hash(0)])
+    assert root == "0x" + Web3.keccak(hexstr=document_hash(0)).hex().removeprefix("0x")
+    assert proofs == {document_hash(0): []}
+    assert server.verify_merkle_proof(document_hash(0), [], root)
+
+
+def test_merkle_two_leaves_uses_sorted_pair():
+    left, right = Web3.keccak(hexstr=document_hash(1)), Web3.keccak(hexstr=document_hash(2))
+    root, proofs = server.build_merkle_tree([document_hash(1), document_hash(2)])
+    assert root == "0x" + Web3.keccak(min(left, right) + max(left, right)).hex().removeprefix("0x")
+    assert proofs[document_hash(1)] == ["0x" + right.hex().removeprefix("0x")]
+
+
+@pytest.mark.parametrize("count", [2, 3, 4, 5, 7, 8, 9, 16, 33])
+def test_merkle_every_proof_verifies(count):
+    hashes = [document_hash(i) for i in range(count)]
+    root, proofs = server.build_merkle_tree(hashes)
+    assert root == reference_merkle_root(hashes)
+    assert set(proofs) == set(hashes)
+    for value in hashes:
+        assert server.verify_merkle_proof(value, proofs[value], root)
+    # 证明不能用于其他文档或其他根
+    assert not server.verify_merkle_proof(document_hash(count + 1), proofs[hashes[0]], root)
+    other_root, _ = server.build_merkle_tree(hashes + [document_hash(count + 1)])
+    assert not server.verify_merkle_proof(hashes[0], proofs[hashes[0]], other_root)
+
+
+def test_merkle_ignores_input_order_and_duplicates():
+    hashes = [document_hash(i) for i in range(6)]
+    root, proofs = server.build_merkle_tree(hashes)
+    shuffled_root, shuffled_proofs = server.build_merkle_tree(list(reversed(hashes)) + hashes[:2])
+    assert shuffled_root == root
+    assert shuffled_proofs == proofs
+
+
+def test_anchor_records_leaf_indexes_and_releases_lock_while_waiting(tmp_path, monkeypatch):
+    """等待回执期间存证锁必须可用；证明按排序后的叶子顺序记录索引"""
+    monkeypatch.setattr(server, "REGISTRY_DB_PATH", str(tmp_path / "registry.db"))
+    hashes = [document_hash(i) for i in range(5)]
+    conn = server.get_registry_connection()
+    conn.executemany(
+        "INSERT INTO notarization_queue (document_hash, document_name, asset_id, network, queued_at) "
+        "VALUES (?, '', '', 'sepolia', 0)", [(value,) for value in hashes],
+    )
+    conn.commit()
+    conn.close()
+
+    waiting, release = threading.Event(), threading.Event()
+    lock_free_during_wait = []
+
+    class FakeAccount:
+        address = "0x" + "11" * 20
+
+    class FakeWeb3:
+        class eth:
+            class account:
+                @staticmethod
+                def from_key(key):
+                    return FakeAccount
+
+    def fake_confirm(w3, network, transaction, private_key, tx_hashes, *args, **kwargs):
+        waiting.set()
+        release.wait(5)
+        receipt = AttributeDict({"status": 1, "blockNumber": 10, "gasUsed": 21000, "effectiveGasPrice": 1})
+        return {"tx_hash": tx_hashes[-1], "receipt": receipt, "hashes": tx_hashes, "gas_price": 1, "replacements": 0}
+
+    monkeypatch.setattr(server, "get_web3_instance", lambda network: FakeWeb3)
+    monkeypatch.setattr(server, "get_private_key", lambda: "0x" + "22" * 32)
+    monkeypatch.setattr(server, "preflight_transaction", lambda *args, **kwargs: {
+        "revert_reason": None, "sufficient": True, "gas_limit": 30000, "gas_price": 1, "nonce": 0, "balance": 10**18})
+    monkeypatch.setattr(server, "sign_and_send", lambda *args: "0x" + "ab" * 32)
+    monkeypatch.setattr(server, "confirm_with_fee_bumping", fake_confirm)
+
+    results = []
+    worker = threading.Thread(target=lambda: results.append(server.anchor_pending_documents("sepolia")))
+    worker.start()
+    assert waiting.wait(5)
+    acquired = server._notarization_lock.acquire(timeout=1)
+    lock_free_during_wait.append(acquired)
+    if acquired:
+        server._notarization_lock.release()
+    release.set()
+    worker.join(5)
+
+    assert lock_free_during_wait == [True]
+    assert results[0]["status"] == "anchored" and results[0]["anchored"] == 5
+    conn = server.get_registry_connection()
+    rows = conn.execute("SELECT document_hash, leaf_index FROM notarization_proofs ORDER BY leaf_index").fetchall()
+    conn.close()
+    assert [(row["document_hash"], row["leaf_index"]) for row in rows] == list(zip(sorted(hashes), range(5)))
+
+
+def test_registry_schema_created_once_per_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "REGISTRY_DB_PATH", str(tmp_path / "registry.db"))
+    calls = []
+    original = server.create_registry_schema
+    monkeypatch.setattr(server, "create_registry_schema", lambda conn: (calls.append(1), original(conn)))
+    for _ in range(3):
+        server.get_registry_connection().close()
+    assert calls == [1]
+
+
+def test_normalize_document_hashes_keeps_first_occurrence():
+    first, second = "AB" * 32, "cd" * 32
+    assert server.normalize_document_hashes([first, "0x" + second, "0x" + first.lower()]) == ["0x" + first.lower(), "0x" + second]
+    assert server.normalize_document_hashes([first, "not-a-hash"]) is None
+
+
+# ==================== 收益分配 ====================
+
+def test_allocate_pro_rata_sums_exactly_to_total():
+    balances = {"0xA": 1, "0xB": 1, "0xC": 1}
+    allocation = server.allocate_pro_rata(100, balances)
+    assert sum(allocation.values()) == 100
+    # 余数相同时按地址顺序多分1个最小单位
+    assert allocation == {"0xA": 34, "0xB": 33, "0xC": 33}
+
+
+def test_allocate_pro_rata_largest_remainder_and_proportionality():
+    balances = {"0xA": 5, "0xB": 3, "0xC": 2}
+    assert server.allocate_pro_rata(7, balances) == {"0xA": 4, "0xB": 2, "0xC": 1}
+    large = {f"0x{i:040x}": (i * 7919) % 1000 + 1 for i in range(500)}
+    total = 10 ** 24 + 17
+    allocation = server.allocate_pro_rata(total, large)
+    assert sum(allocation.values()) == total
+    shares = sum(large.values())
+    for holder, balance in large.items():
+        assert abs(allocation[holder] - total * balance / shares) < 1 + 1e-6 * total * balance / shares
+
+
+def test_allocate_pro_rata_without_shares_returns_empty():
+    assert server.allocate_pro_rata(100, {}) == {}
+    assert server.allocate_pro_rata(100, {"0xA": 0}) == {}
+
+
+def tx(index: int) -> str:
+    return "0x" + f"{index:064x}"
+
+
+def test_reconcile_distribution_payouts_never_resends_in_flight_transfers(tmp_path, monkeypatch):
+    """已打包的按回执状态结算，nonce已被占用的释放重发，仍可能打包的保持pending"""
+    monkeypatch.setattr(server, "REGISTRY_DB_PATH", str(tmp_path / "registry.db"))
+    distribution_id = server.create_distribution(
+        "sepolia", "0xShare", "0xPay", 1, 400,
+        {"0xA": 100, "0xB": 100, "0xC": 100, "0xD": 100, "0xE": 100},
+        {"0xA": 1, "0xB": 1, "0xC": 1, "0xD": 1, "0xE": 1},
+    )
+    broadcasts = {"0xA": ([tx(1), tx(2)], 5), "0xB": ([tx(3)], 6), "0xC": ([tx(4)], 7), "0xD": ([tx(5)], 8)}
+    conn = server.get_registry_connection()
+    conn.executemany(
+        "UPDATE distribution_payouts SET tx_hash = ?, tx_hashes = ?, nonce = ? WHERE distribution_id = ? AND holder = ?",
+        [(hashes[-1], server.json.dumps(hashes), nonce, distribution_id, holder)
+         for holder, (hashes, nonce) in broadcasts.items()],
+    )
+    conn.commit()
+    conn.close()
+
+    # 替换前的tx(1)成功打包；tx(3)回滚；nonce 7已被其他交易使用；nonce 8尚未使用
+    receipts = {tx(1): AttributeDict({"status": 1}), tx(3): AttributeDict({"status": 0})}
+
+    def fake_rpc_batch(rpc_url, calls, timeout=30):
+        responses = []
+        for method, params in calls:
+            if method == "eth_getTransactionReceipt":
+                responses.append({"result": {"transactionHash": params[0]} if params[0] in receipts else None})
+            else:
+                responses.append({"result": hex(8)})
+        return responses
+
+    class FakeWeb3:
+        class eth:
+            get_transaction_receipt = staticmethod(receipts.__getitem__)
+
+    monkeypatch.setattr(server, "rpc_batch", fake_rpc_batch)
+    in_flight = server.reconcile_distribution_payouts(FakeWeb3, "sepolia", distribution_id, "0xSender")
+
+    assert in_flight == 1
+    conn = server.get_registry_connection()
+    rows = {row["holder"]: row for row in conn.execute(
+        "SELECT holder, status, tx_hash, tx_hashes FROM distribution_payouts WHERE distribution_id = ?", (distribution_id,))}
+    conn.close()
+    assert (rows["0xA"]["status"], rows["0xA"]["tx_hash"]) == ("paid", tx(1))
+    assert (rows["0xB"]["status"], rows["0xB"]["tx_hash"]) == ("failed", tx(3))
+    assert (rows["0xC"]["status"], rows["0xC"]["tx_hashes"]) == ("pending", None)
+    assert (rows["0xD"]["status"], rows["0xD"]["tx_hashes"]) == ("pending", server.json.dumps([tx(5)]))
+    assert (rows["0xE"]["status"], rows["0xE"]["tx_hashes"]) == ("pending", None)
+
+
+def test_registry_adds_columns_missing_from_older_databases(tmp_path, monkeypatch):
+    path = tmp_path / "old.db"
+    old = server.sqlite3.connect(path)
+    old.execute("CREATE TABLE distribution_payouts (distribution_id INTEGER NOT NULL, holder TEXT NOT NULL, "
+                "share_balance TEXT NOT NULL, amount TEXT NOT NULL, tx_hash TEXT, status TEXT NOT NULL, "
+                "PRIMARY KEY (distribution_id, holder))")
+    old.commit()
+    old.close()
+    monkeypatch.setattr(server, "REGISTRY_DB_PATH", str(path))
+    conn = server.get_registry_connection()
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(distribution_payouts)")}
+    conn.close()
+    assert {"tx_hashes", "nonce"} <= columns
+
+
+# ==================== ERC20模板 ====================
+
+def test_erc20_template_without_compiler_fails_instead_of_deploying_standard(monkeypatch):
+    monkeypatch.setattr(server, "_erc20_artifacts", {})
+    monkeypatch.setattr(server, "compile_erc20_contract", lambda template: (None, None))
+
+    with pytest.raises(RuntimeError, match="optimized"):
+        server.get_erc20_artifacts("optimized")
+    assert server.get_erc20_artifacts("standard") == (server.ERC20_BYTECODE, server.ERC20_ABI,
+                                                      "预编译字节码（standard模板）")
+
+
+# ==================== Web3连接 ====================
+
+def test_web3_instance_created_once_under_concurrent_access(monkeypatch):
+    created, started = [], []
+
+    class SlowWeb3:
+        def __init__(self, provider):
+            created.append(self)
+
+        def is_connected(self):
+            threading.Event().wait(0.05)
+            return True
+
+    monkeypatch.setattr(server, "Web3", SlowWeb3)
+    monkeypatch.setattr(server, "RateLimitedHTTPProvider", lambda rpc_url: rpc_url)
+    monkeypatch.setattr(server, "get_head_subscription", started.append)
+    monkeypatch.setattr(server, "_web3_instances", {})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(server.get_web3_instance("sepolia")))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(w3 is created[0] for w3 in results)
+
+
+def test_read_only_mode_starts_no_head_subscription(monkeypatch):
+    monkeypatch.setattr(server, "WEB3_MCP_READ_ONLY", True)
+    monkeypatch.setattr(server, "HAS_WEBSOCKETS", True)
+    monkeypatch.setattr(server, "HeadSubscription", lambda *args: pytest.fail("subscription started"))
+    monkeypatch.setattr(server, "_head_subscriptions", {})
+
+    assert server.get_head_subscription("sepolia") is None
+
+
+# ==================== 部署网络选择 ====================
+
+def test_auto_network_selection_skips_unfunded_networks(monkeypatch):
+    """最便宜的网络钱包余额不足部署费用时，auto选择余额足够的次优网络"""
+    gas_prices = {"sepolia": 30 * 10**9, "arbitrum-sepolia": 10**8, "optimism-sepolia": 10**9, "base-sepolia": 2 * 10**9}
+    balances = {"sepolia": 10**18, "arbitrum-sepolia": 10**13, "optimism-sepolia": 10**15, "base-sepolia": 10**18}
+    by_url = {config["rpc_url"]: network for network, config in server.TESTNETWORKS.items()}
+    now = int(server.time.time())
+    requested_balances = []
+
+    def fake_rpc_batch(rpc_url, calls, timeout=30):
+        network = by_url[rpc_url]
+        responses = []
+        for method, params in calls:
+            if method == "eth_gasPrice":
+                responses.append({"result": hex(gas_prices[network])})
+            elif method == "eth_getBlockByNumber":
+                number = 1000 if params[0] == "latest" else int(params[0], 16)
+                responses.append({"result": {"number": hex(number), "timestamp": hex(now - (1000 - number) * 2)}})
+            elif method == "eth_getBalance":
+                requested_balances.append(params[0])
+                responses.append({"result": hex(balances[network])})
+            else:
+                responses.append({"result": hex(0)})
+        return responses
+
+    monkeypatch.setattr(server, "rpc_batch", fake_rpc_batch)
+    monkeypatch.setattr(server, "WALLET_PRIVATE_KEY", "22" * 32)
+    ranked = server.rank_networks(list(server.TESTNETWORKS), force=True)
+
+    deployer = Web3().eth.account.from_key("0x" + "22" * 32).address
+    assert set(requested_balances) == {deployer}
+    assert [probe["network"] for probe in ranked if not probe["funded"]] == ["arbitrum-sepolia"]
+    assert ranked[-1]["network"] == "arbitrum-sepolia"
+    assert server.select_deployment_network("auto") == "optimism-sepolia"
+    # 批量部署按合约数计算所需余额
+    assert server.select_deployment_network("auto", deploy_count=2) == "base-sepolia"
+    assert server.select_deployment_network("sepolia") == "sepolia"
+
+
+# ==================== 延迟执行 ====================
+
+def preflight_rpc_batch(gas_price):
+    def fake_rpc_batch(rpc_url, calls, timeout=30):
+        results = {"eth_call": "0x", "eth_estimateGas": hex(50000), "eth_getBalance": hex(10**18),
+                   "eth_gasPrice": hex(gas_price), "eth_getTransactionCount": hex(3)}
+        return [{"result": results[method]} for method, _ in calls]
+    return fake_rpc_batch
+
+
+def test_preflight_gas_price_respects_cap(monkeypatch):
+    monkeypatch.setattr(server, "rpc_batch", preflight_rpc_batch(10 * 10**9))
+    tx_fields = {"from": "0x" + "11" * 20, "to": "0x" + "22" * 20, "data": "0x"}
+    assert server.preflight_transaction("sepolia", tx_fields, gas_price_multiplier=2)["gas_price"] == 20 * 10**9
+    with server.gas_price_cap(12 * 10**9):
+        assert server.preflight_transaction("sepolia", tx_fields, gas_price_multiplier=2)["gas_price"] == 12 * 10**9
+    assert server.current_gas_price_cap() is None
+
+
+def test_run_due_jobs_caps_gas_price_at_max_fee(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "REGISTRY_DB_PATH", str(tmp_path / "registry.db"))
+    monkeypatch.setattr(server, "start_gas_sampler", lambda: None)
+    monkeypatch.setattr(server, "current_gas_price", lambda network: 5 * 10**9)
+    monkeypatch.setattr(server, "cheap_gas_threshold", lambda network: None)
+    seen_caps = []
+    monkeypatch.setattr(server, "_scheduled_tools", lambda: {
+        "deploy_erc20_contract": lambda **params: seen_caps.append(server.current_gas_price_cap()) or "✅ ok"})
+    conn = server.get_registry_connection()
+    conn.executemany(
+        "INSERT INTO scheduled_jobs (kind, network, params, max_fee, deadline, status, created_at) "
+        "VALUES ('deploy_erc20_contract', 'sepolia', '{}', ?, ?, 'pending', 0)",
+        [(6 * 10**9, None), (10**9, 1.0)],
+    )
+    conn.commit()
+    conn.close()
+
+    assert server.run_due_jobs() == 2
+    # 第一个任务因价格达标执行，受max_fee限制；第二个任务已过截止时间，按当时价格执行
+    assert seen_caps == [6 * 10**9, None]
+
+
+def test_deadline_only_job_waits_for_history_until_deadline(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "REGISTRY_DB_PATH", str(tmp_path / "registry.db"))
+    monkeypatch.setattr(server, "start_gas_sampler", lambda: None)
+    monkeypatch.setattr(server, "start_scheduler", lambda: None)
+    monkeypatch.setattr(server, "current_gas_price", lambda network: 5 * 10**9)
+    monkeypatch.setattr(server, "cheap_gas_threshold", lambda network: None)
+    executed = []
+    monkeypatch.setattr(server, "_scheduled_tools", lambda: {
+        "deploy_erc20_contract": lambda **params: executed.append(params) or "✅ ok"})
+
+    queued = server.schedule_if_expensive("deploy_erc20_contract", "sepolia", {"name": "A"}, None, 60)
+    assert queued is not None and "采样历史不足" in queued
+    # 没有历史阈值时不判定为便宜，截止时间前不执行
+    assert server.run_due_jobs() == 0
+
+    conn = server.get_registry_connection()
+    conn.execute("UPDATE scheduled_jobs SET deadline = 1")
+    conn.commit()
+    conn.close()
+    assert server.run_due_jobs() == 1
+    assert executed == [{"name": "A"}]
+
+
+def test_gas_sampler_keeps_sampling_at_idle_rate(monkeypatch):
+    sampled, sleeps = [], []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            raise StopIteration
+
+    monkeypatch.setattr(server, "sample_gas_prices", sampled.append)
+    monkeypatch.setattr(server, "has_scheduled_jobs", lambda: len(sleeps) == 1)
+    monkeypatch.setattr(server.time, "sleep", fake_sleep)
+    with pytest.raises(StopIteration):
+        server._gas_sampler_loop()
+
+    assert len(sampled) == 2
+    assert sleeps == [server.GAS_IDLE_SAMPLE_INTERVAL, server.GAS_SAMPLE_INTERVAL]
+
+
+def test_recover_interrupted_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "REGISTRY_DB_PATH", str(tmp_path / "registry.db"))
+    conn = server.get_registry_connection()
+    conn.executemany(
+        "INSERT INTO scheduled_jobs (kind, network, params, status, created_at) VALUES (?, 'sepolia', '{}', ?, 0)",
+        [("execute_income_distribution", "running"), ("deploy_erc20_contract", "running"),
+         ("deploy_erc20_contract", "pending")],
+    )
+    conn.commit()
+    conn.close()
+
+    assert server.recover_interrupted_jobs() == 2
+    conn = server.get_registry_connection()
+    statuses = [row["status"] for row in conn.execute("SELECT status FROM scheduled_jobs ORDER BY job_id")]
+    conn.close()
+    assert statuses == ["pending", "failed", "pending"]
+
+
+# ==================== 加价替换与未确认交易核对 ====================
+
+class FeeBumpChain:
+    """模拟节点：记录广播的交易，第mine_after次等待后打包指定哈希"""
+
+    def __init__(self, monkeypatch, mine_after=None, mined_index=-1, market_price=1, send_errors=()):
+        self.sent = []
+        self.waits = 0
+        self.mine_after = mine_after
+        self.mined_index = mined_index
+        self.send_errors = list(send_errors)
+
+        class FakeWeb3:
+            class eth:
+                gas_price = market_price
+
+        self.w3 = FakeWeb3
+        monkeypatch.setattr(server, "expected_block_time", lambda network: 0.0)
+        monkeypatch.setattr(server, "sign_and_send", self.sign_and_send)
+        monkeypatch.setattr(server, "wait_for_any_receipt", self.wait_for_any_receipt)
+
+    def sign_and_send(self, w3, transaction, private_key):
+        if self.send_errors:
+            raise ValueError(self.send_errors.pop(0))
+        self.sent.append(dict(transaction))
+        return tx(100 + len(self.sent))
+
+    def wait_for_any_receipt(self, w3, network, tx_hashes, timeout):
+        self.waits += 1
+        if self.mine_after is not None and self.waits > self.mine_after:
+            mined = tx_hashes[self.mined_index]
+            return mined, AttributeDict({"status": 1, "blockNumber": 1})
+        return None
+
+
+def test_fee_bump_replaces_with_same_nonce_and_higher_price(monkeypatch):
+    chain = FeeBumpChain(monkeypatch, mine_after=3)
+    recorded = []
+    transaction = {"nonce": 7, "gasPrice": 1000, "to": "0x" + "11" * 20}
+    result = server.confirm_with_fee_bumping(chain.w3, "sepolia", transaction, "0xkey", [tx(1)],
+                                             deadline_seconds=60, on_broadcast=recorded.append)
+
+    assert result["replacements"] == 3
+    assert result["hashes"] == [tx(1), tx(101), tx(102), tx(103)]
+    assert result["tx_hash"] == tx(103)
+    assert [sent["nonce"] for sent in chain.sent] == [7, 7, 7]
+    # 每次至少加价12.5%（节点替换交易的最低要求），且价格严格递增
+    prices = [1000] + [sent["gasPrice"] for sent in chain.sent]
+    assert all(new >= old * 1.125 for old, new in zip(prices, prices[1:]))
+    assert result["gas_price"] == prices[-1]
+    # 每次替换后都把完整的哈希列表交给调用方持久化
+    assert recorded == [[tx(1), tx(101)], [tx(1), tx(101), tx(102)], [tx(1), tx(101), tx(102), tx(103)]]
+    # 调用方传入的交易不被修改
+    assert transaction["gasPrice"] == 1000
+
+
+def test_fee_bump_reports_price_of_the_mined_replacement(monkeypatch):
+    chain = FeeBumpChain(monkeypatch, mine_after=2, mined_index=0)
+    result = server.confirm_with_fee_bumping(chain.w3, "sepolia", {"nonce": 1, "gasPrice": 1000}, "0xkey", [tx(1)],
+                                             deadline_seconds=60)
+    assert result["tx_hash"] == tx(1)
+    assert result["gas_price"] == 1000
+
+
+def test_fee_bump_stops_at_multiplier_and_cap(monkeypatch):
+    monkeypatch.setattr(server, "MAX_FEE_BUMP_MULTIPLIER", 2)
+    chain = FeeBumpChain(monkeypatch, mine_after=20)
+    server.confirm_with_fee_bumping(chain.w3, "sepolia", {"nonce": 1, "gasPrice": 1000}, "0xkey", [tx(1)],
+                                    deadline_seconds=60)
+    assert max(sent["gasPrice"] for sent in chain.sent) <= 2000
+
+    chain = FeeBumpChain(monkeypatch, mine_after=20)
+    server.confirm_with_fee_bumping(chain.w3, "sepolia", {"nonce": 1, "gasPrice": 1000}, "0xkey", [tx(1)],
+                                    deadline_seconds=60, max_gas_price=1300)
+    assert [sent["gasPrice"] for sent in chain.sent] == [1126, 1267]
+
+
+def test_fee_bump_follows_market_price_and_stops_on_insufficient_funds(monkeypatch):
+    chain = FeeBumpChain(monkeypatch, mine_after=3, market_price=1500)
+    server.confirm_with_fee_bumping(chain.w3, "sepolia", {"nonce": 1, "gasPrice": 1000}, "0xkey", [tx(1)],
+                                    deadline_seconds=60)
+    # 市场价格高于最低加价幅度时直接跟随市场价格
+    assert chain.sent[0]["gasPrice"] == 1500
+
+    chain = FeeBumpChain(monkeypatch, mine_after=4, send_errors=["insufficient funds for gas * price + value"])
+    result = server.confirm_with_fee_bumping(chain.w3, "sepolia", {"nonce": 1, "gasPrice": 1000}, "0xkey", [tx(1)],
+                                             deadline_seconds=60)
+    assert chain.sent == [] and result["replacements"] == 0 and result["tx_hash"] == tx(1)
+
+
+def test_fee_bump_returns_unmined_after_deadline(monkeypatch):
+    chain = FeeBumpChain(monkeypatch)
+    result = server.confirm_with_fee_bumping(chain.w3, "sepolia", {"nonce": 1, "gasPrice": 1000}, "0xkey", [tx(1)],
+                                             deadline_seconds=0.05)
+    assert result["receipt"] is None
+    assert result["tx_hash"] == result["hashes"][-1]
+
+
+def test_head_subscription_untracks_replaced_and_expired_transactions(monkeypatch):
+    subscription = server.HeadSubscription("sepolia", "ws://unused")
+    subscription.track_transactions([tx(1), tx(2), tx(3)])
+    subscription.track_transactions([tx(9)])
+    subscription.pending[tx(9)]["tracked_at"] -= server.TRACKED_TX_TTL_SECONDS + 1
+    polled = []
+
+    def fake_rpc_batch(rpc_url, calls, timeout=30):
+        polled.append([params[0] for _, params in calls])
+        return [{"result": {"blockNumber": hex(10), "status": "0x1"} if params[0] == tx(2) else None}
+                for _, params in calls]
+
+    monkeypatch.setattr(server, "rpc_batch", fake_rpc_batch)
+    subscription._on_head({"number": hex(10), "timestamp": hex(0)})
+
+    assert polled == [[tx(1), tx(2), tx(3), tx(9)]]
+    # tx(2)打包后同一nonce的其他哈希停止跟踪；超过TTL无人等待的tx(9)被清理
+    assert list(subscription.pending) == [tx(2)]
+    assert subscription.mined_transaction([tx(1), tx(2)]) == tx(2)
+
+    subscription._on_head({"number": hex(11), "timestamp": hex(0)})
+    assert len(polled) == 1
+
+
+def test_wait_for_any_receipt_reads_subscription_instead_of_polling(monkeypatch):
+    subscription = server.HeadSubscription("sepolia", "ws://unused")
+    subscription.connected, subscription.block_number, subscription.updated_at = True, 10, server.time.monotonic()
+    monkeypatch.setattr(server, "get_head_subscription", lambda network: subscription)
+    monkeypatch.setattr(server, "rpc_batch", lambda *args, **kwargs: pytest.fail("不应单独轮询回执"))
+
+    def new_block(after_block, timeout):
+        subscription.pending[tx(2)].update({"receipt_block": 11, "status": 1})
+        subscription.block_number = 11
+        return True
+
+    monkeypatch.setattr(subscription, "wait_for_new_block", new_block)
+
+    class FakeWeb3:
+        class eth:
+            get_transaction_receipt = staticmethod(lambda tx_hash: AttributeDict({"status": 1, "hash": tx_hash}))
+
+    mined, receipt = server.wait_for_any_receipt(FakeWeb3, "sepolia", [tx(1), tx(2)], timeout=5)
+    assert mined == tx(2) and receipt["hash"] == tx(2)
+
+
+def test_anchor_reconciliation_settles_or_requeues_pending_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "REGISTRY_DB_PATH", str(tmp_path / "registry.db"))
+    conn = server.get_registry_connection()
+    for batch_id, hashes, nonce in [(1, [tx(1), tx(2)], 4), (2, [tx(3)], 5), (3, [tx(4)], 9)]:
+        conn.execute(
+            "INSERT INTO notarization_batches (batch_id, merkle_root, leaf_count, network, tx_hash, status, created_at, "
+            "tx_hashes, nonce) VALUES (?, '0x', 1, 'sepolia', ?, 'pending', 0, ?, ?)",
+            (batch_id, hashes[-1], server.json.dumps(hashes), nonce),
+        )
+        conn.execute("INSERT INTO notarization_queue (document_hash, document_name, asset_id, network, queued_at, batch_id) "
+                     "VALUES (?, 'doc', '', 'sepolia', 0, ?)", (document_hash(batch_id), batch_id))
+        conn.execute("INSERT INTO notarization_proofs (document_hash, batch_id, leaf_index, proof) VALUES (?, ?, 0, '[]')",
+                     (document_hash(batch_id), batch_id))
+    conn.commit()
+    conn.close()
+
+    receipts = {tx(1): AttributeDict({"status": 1, "blockNumber": 50})}
+
+    def fake_rpc_batch(rpc_url, calls, timeout=30):
+        return [{"result": ({"blockNumber": "0x32"} if params[0] in receipts else None)
+                 if method == "eth_getTransactionReceipt" else hex(8)} for method, params in calls]
+
+    class FakeWeb3:
+        class eth:
+            get_transaction_receipt = staticmethod(receipts.__getitem__)
+
+            class account:
+                @staticmethod
+                def from_key(key):
+                    return AttributeDict({"address": "0x" + "11" * 20})
+
+    monkeypatch.setattr(server, "rpc_batch", fake_rpc_batch)
+    monkeypatch.setattr(server, "get_web3_instance", lambda network: FakeWeb3)
+    monkeypatch.setattr(server, "get_private_key", lambda: "0x" + "22" * 32)
+
+    assert server.reconcile_anchor_batches("sepolia") == 2
+    conn = server.get_registry_connection()
+    batches = {row["batch_id"]: (row["status"], row["tx_hash"]) for row in conn.execute("SELECT * FROM notarization_batches")}
+    queue = {row["document_hash"]: row["batch_id"] for row in conn.execute("SELECT * FROM notarization_queue")}
+    proofs = {row["batch_id"] for row in conn.execute("SELECT batch_id FROM notarization_proofs")}
+    fingerprints = conn.execute("SELECT document_hash, tx_hash FROM document_fingerprints").fetchall()
+    conn.close()
+    # 批次1的原交易已打包；批次2的nonce已被使用，文档重新排队；批次3仍在等待
+    assert batches == {1: ("anchored", tx(1)), 2: ("dropped", tx(3)), 3: ("pending", tx(4))}
+    assert queue == {document_hash(1): 1, document_hash(2): None, document_hash(3): 3}
+    assert proofs == {1, 3}
+    assert [tuple(row) for row in fingerprints] == [(document_hash(1), tx(1))]
+
+
+def test_asset_registry_resumes_pending_deploy_instead_of_redeploying(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "REGISTRY_DB_PATH", str(tmp_path / "registry.db"))
+    server.record_asset_registry("sepolia", "0x" + "33" * 20, [tx(1), tx(2)], "pending", nonce=3)
+    waited = []
+
+    class FakeWeb3:
+        class eth:
+            class account:
+                @staticmethod
+                def from_key(key):
+                    return AttributeDict({"address": "0x" + "11" * 20})
+
+    def fake_wait(w3, network, tx_hashes, timeout):
+        waited.append(tx_hashes)
+        return tx(2), AttributeDict({"status": 1, "contractAddress": "0x" + "33" * 20, "gasUsed": 1})
+
+    monkeypatch.setattr(server, "get_web3_instance", lambda network: FakeWeb3)
+    monkeypatch.setattr(server, "get_private_key", lambda: "0x" + "22" * 32)
+    monkeypatch.setattr(server, "reconcile_broadcast", lambda *args: ("pending", None, None))
+    monkeypatch.setattr(server, "wait_for_any_receipt", fake_wait)
+    monkeypatch.setattr(server, "compile_asset_registry", lambda: pytest.fail("不应重新部署"))
+
+    registry = server.ensure_asset_registry("sepolia")
+    assert waited == [[tx(1), tx(2)]]
+    assert registry["address"] == "0x" + "33" * 20 and registry["tx_hash"] == tx(2)
+    assert server.get_asset_registry_address("sepolia") == "0x" + "33" * 20
+    assert server.ensure_asset_registry("sepolia") == {"address": "0x" + "33" * 20, "deployed": False}
+
+
+# ==================== DEX流动性 ====================
+
+def test_slippage_curve_matches_constant_product_quote():
+    # 1000基础代币 / 2000报价代币，0.3%手续费，现价2
+    curve = server.slippage_curve(1000.0, 2000.0, 0.003, [0.0, 1.0, 10.0, 100.0])
+    assert curve[0]["execution_price"] == 2.0 and curve[0]["slippage"] == 0.0
+    quote = curve[2]
+    amount_in = 10 * 0.997
+    assert quote["amount_out"] == pytest.approx(2000 * amount_in / (1000 + amount_in))
+    # 交易后储备乘积不变（手续费部分不参与定价）
+    assert (1000 + amount_in) * (2000 - quote["amount_out"]) == pytest.approx(1000 * 2000)
+    assert quote["price_impact"] == pytest.approx(amount_in / (1000 + amount_in))
+    assert quote["slippage"] == pytest.approx(1 - quote["amount_out"] / 10 / 2)
+    # 规模越大滑点越高，且滑点至少包含手续费
+    slippages = [point["slippage"] for point in curve[1:]]
+    assert slippages == sorted(slippages)
+    assert all(value > 0.003 for value in slippages)
+
+
+def test_impact_depth_inverts_price_impact():
+    for impact in (0.001, 0.01, 0.02, 0.1):
+        depth = server.impact_depth(5000.0, 0.003, impact)
+        point = server.slippage_curve(5000.0, 1.0, 0.003, [depth])[0]
+        assert point["price_impact"] == pytest.approx(impact)
+    assert server.impact_depth(5000.0, 0.0, 0.01) == pytest.approx(5000 * 0.01 / 0.99)
+
+
+def test_pool_tokens_share_the_token_metadata_cache(monkeypatch):
+    pool, token0, token1 = "0x" + "aa" * 20, "0x" + "01" * 20, "0x" + "02" * 20
+    monkeypatch.setattr(server, "_token_metadata_cache", {})
+    monkeypatch.setattr(server, "_pool_static_cache", {})
+    monkeypatch.setattr(server, "_pool_state_cache", {})
+    monkeypatch.setattr(server, "price_freshness_key", lambda network: 1)
+    pool_fields = {server.TOKEN0_SELECTOR: abi_encode(["address"], [token0]),
+                   server.TOKEN1_SELECTOR: abi_encode(["address"], [token1]),
+                   server.GET_RESERVES_SELECTOR: abi_encode(["uint112", "uint112", "uint32"], [10**18, 2 * 10**6, 0])}
+    monkeypatch.setattr(server, "multicall", lambda network, calls: [
+        (selector in pool_fields, pool_fields.get(selector, b"")) for _, selector in calls])
+    token_fields = {
+        token0: {"0x313ce567": abi_encode(["uint8"], [18]), "0x06fdde03": abi_encode(["string"], ["Wrapped Ether"]),
+                 "0x95d89b41": abi_encode(["string"], ["WETH"])},
+        # 旧代币的symbol返回bytes32
+        token1: {"0x313ce567": abi_encode(["uint8"], [6]), "0x06fdde03": abi_encode(["string"], ["Maker"]),
+                 "0x95d89b41": b"MKR".ljust(32, b"\x00")},
+    }
+    batches = []
+
+    def fake_rpc_batch(rpc_url, calls, timeout=30):
+        batches.append(calls)
+        return [{"result": "0x" + token_fields[params[0]["to"]][params[0]["data"]].hex()} for _, params in calls]
+
+    monkeypatch.setattr(server, "rpc_batch", fake_rpc_batch)
+    state = server.read_pool_states("sepolia", [pool])[pool]
+
+    assert (state["version"], state["symbol0"], state["decimals0"], state["symbol1"], state["decimals1"]) == \
+        ("v2", "WETH", 18, "MKR", 6)
+    # 两个代币的元数据合并为一次批量RPC，代币工具随后直接命中同一缓存
+    assert len(batches) == 1 and len(batches[0]) == 6
+    assert server.get_token_metadata("sepolia", token1) == {"decimals": 6, "name": "Maker", "symbol": "MKR"}
+    assert len(batches) == 1
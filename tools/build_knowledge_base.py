@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+知识库离线构建
+从 knowledge/compliance/*.pdf、配置的监管网站和教育PDF增量构建 storage/knowledge/lancedb 下的LanceDB表和本地BM25索引，
+并在 knowledge_build.json 中记录每个表的版本和BM25索引快照（未配置嵌入接口时只构建BM25索引）。Agent启动时只读打开这些版本，不抓取网页也不调用嵌入接口。
+
+使用方法:
+python tools/build_knowledge_base.py
+python tools/build_knowledge_base.py --force
+python tools/build_knowledge_base.py --prune
+python tools/build_knowledge_base.py --reindex
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add project root to system path for imports
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from agents.embedding_cache import get_embedding_cache_metrics
+from agents.knowledge_ingestion import BUILD_MANIFEST_FILE, build_knowledge_base, drop_obsolete_tables
+from agents.vector_index import KNOWLEDGE_ANN_MIN_ROWS
+
+
+def format_index(index, action) -> str:
+    if index is None:
+        return f"无（行数低于 {KNOWLEDGE_ANN_MIN_ROWS:,}，精确检索）" if action == "skipped" else "无"
+    return f"{index['type']}，{index['indexed_rows']:,} 行已索引（{action or '未变'}）"
+
+
+def format_report(build) -> str:
+    """生成Markdown格式的构建报告"""
+    rows = [
+        f"| {table_name} | {entry['version']} | {entry['rows']:,} | {len(entry['sources'])} | "
+        f"{format_index(entry.get('index'), build['index_actions'].get(table_name))} |"
+        for table_name, entry in build["tables"].items()
+    ]
+    results = build["results"]
+    added = sum(result.added for result in results)
+    deleted = sum(result.deleted for result in results)
+    failed = [result for result in results if result.status in ("missing", "error")]
+    failed_lines = "\n".join(f"- {result.source}: {result.error}" for result in failed) or "- 无"
+    cache_lines = "\n".join(
+        f"- {db_path}: 命中率 {metrics['hit_rate']:.1%}（{metrics['hits']} 命中 / {metrics['misses']} 未命中），"
+        f"{metrics['entries']:,} / {metrics['max_entries']:,} 条，已淘汰 {metrics['evictions']:,} 条"
+        for db_path, metrics in get_embedding_cache_metrics().items()
+    ) or "- 未启用"
+    embedder = build["embedder"]
+    embedder_line = f"{embedder['id']}（{embedder['dimensions']} 维）" if embedder else "未配置（只构建BM25关键词索引）"
+    lexical_rows = sum(build["lexical_index"]["rows"].values())
+    obsolete_lines = "\n".join(f"- {table_name}" for table_name in build["obsolete_tables"]) or "- 无"
+
+    return f"""# 知识库构建报告
+
+**构建ID**: {build['build_id']}
+**嵌入模型**: {embedder_line}
+**BM25索引快照**: {build['lexical_index']['snapshot']}（{lexical_rows:,} 个分块）
+**新增嵌入**: {added} 个分块
+**删除分块**: {deleted} 个
+**构建清单**: {BUILD_MANIFEST_FILE}
+
+**嵌入缓存**:
+{cache_lines}
+
+| 表 | 版本 | 行数 | 来源数 | 向量索引 |
+|------|------|------|------|------|
+{chr(10).join(rows)}
+
+**未构建的来源**:
+{failed_lines}
+
+**不再使用的表**（重启Agent后可用 --prune 删除）:
+{obsolete_lines}
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the prebuilt LanceDB knowledge tables used by the agents")
+    parser.add_argument("--force", action="store_true", help="Re-check every chunk even if the source hash is unchanged")
+    parser.add_argument("--reindex", action="store_true", help="Rebuild the vector index of every table above the size threshold")
+    parser.add_argument("--prune", action="store_true", help="Drop tables and BM25 snapshots that are no longer part of the build")
+    args = parser.parse_args()
+
+    try:
+        build = build_knowledge_base(force=args.force, reindex=args.reindex)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if args.prune:
+        removed = drop_obsolete_tables(build)
+        print(f"🗑️ 已删除 {len(removed)} 个不再使用的表和BM25快照")
+        build["obsolete_tables"] = []
+    print(format_report(build))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+ERC20模板Gas基准测试
+在本地EVM（eth-tester + py-evm）上部署 web3_mcp_server.ERC20_TEMPLATES 中的每个模板，
+统计部署、单笔转账和batchTransfer批量转账的Gas消耗，用于选择默认部署模板。
+
+使用方法:
+pip install py-solc-x "eth-tester[py-evm]"
+python tools/erc20_gas_benchmark.py --recipients 10
+"""
+
+import argparse
+from typing import Dict, Any, List, Optional
+
+from web3 import Web3, EthereumTesterProvider
+
+from web3_mcp_server import ERC20_TEMPLATES, DEFAULT_ERC20_TEMPLATE, compile_erc20_contract
+
+
+def benchmark_template(w3: Web3, template: str, recipients: List[str]) -> Optional[Dict[str, Any]]:
+    """部署单个模板并测量各操作的Gas"""
+    bytecode, abi = compile_erc20_contract(template)
+    if not bytecode:
+        return None
+
+    deployer = w3.eth.accounts[0]
+    factory = w3.eth.contract(abi=abi, bytecode=bytecode)
+    tx_hash = factory.constructor("Benchmark Token", "BMK", 1000000).transact({"from": deployer})
+    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    token = w3.eth.contract(address=receipt.contractAddress, abi=abi)
+
+    # 单笔转账：接收方首次持有（冷存储槽），与实际发行场景一致
+    transfer_hash = token.functions.transfer(recipients[0], 10**18).transact({"from": deployer})
+    transfer_gas = w3.eth.wait_for_transaction_receipt(transfer_hash).gasUsed
+
+    batch_gas = None
+    if any(item.get("name") == "batchTransfer" for item in abi):
+        batch_recipients = recipients[1:]
+        batch_hash = token.functions.batchTransfer(
+            batch_recipients, [10**18] * len(batch_recipients)
+        ).transact({"from": deployer})
+        batch_gas = w3.eth.wait_for_transaction_receipt(batch_hash).gasUsed
+
+    return {
+        "template": template,
+        "deploy_gas": receipt.gasUsed,
+        "transfer_gas": transfer_gas,
+        "batch_gas": batch_gas,
+        "batch_size": len(recipients) - 1,
+    }
+
+
+def run_benchmark(recipient_count: int = 10) -> List[Dict[str, Any]]:
+    """在全新的本地EVM上依次测试所有模板"""
+    results = []
+    for template in ERC20_TEMPLATES:
+        w3 = Web3(EthereumTesterProvider())
+        # 每个模板使用相同的一批新地址作为接收方
+        recipients = [w3.eth.account.create().address for _ in range(recipient_count + 1)]
+        result = benchmark_template(w3, template, recipients)
+        if result is None:
+            print(f"⚠️ 模板 {template} 编译失败，已跳过（需要py-solc-x及可用的solc编译器）")
+            continue
+        results.append(result)
+    return results
+
+
+def format_report(results: List[Dict[str, Any]]) -> str:
+    """生成Markdown格式的基准测试报告"""
+    rows = []
+    for result in results:
+        if result["batch_gas"] is not None:
+            batch_cell = f"{result['batch_gas']:,} ({result['batch_gas'] // result['batch_size']:,}/笔)"
+        else:
+            batch_cell = f"不支持 (逐笔约 {result['transfer_gas'] * result['batch_size']:,})"
+        rows.append(
+            f"| {result['template']} | {result['deploy_gas']:,} | {result['transfer_gas']:,} | {batch_cell} | "
+            f"{ERC20_TEMPLATES[result['template']]['description']} |"
+        )
+
+    cheapest_deploy = min(results, key=lambda r: r["deploy_gas"])
+    cheapest_transfer = min(results, key=lambda r: r["transfer_gas"])
+    # 批量分发按每个接收方的平均Gas比较，不支持batchTransfer的模板按逐笔转账计算
+    cheapest_distribution = min(
+        results,
+        key=lambda r: (r["batch_gas"] / r["batch_size"]) if r["batch_gas"] is not None else r["transfer_gas"],
+    )
+
+    return f"""# ERC20模板Gas基准测试报告
+
+| 模板 | 部署 Gas | 单笔转账 Gas | batchTransfer Gas ({results[0]['batch_size']}个接收方) | 说明 |
+|------|------|------|------|------|
+{chr(10).join(rows)}
+
+**部署最省**: {cheapest_deploy['template']}
+**单笔转账最省**: {cheapest_transfer['template']}
+**批量分发最省**: {cheapest_distribution['template']}
+**当前默认模板**: {DEFAULT_ERC20_TEMPLATE}（可通过环境变量 ERC20_DEFAULT_TEMPLATE 修改）
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gas usage of ERC20 templates on a local EVM")
+    parser.add_argument("--recipients", type=int, default=10, help="Number of recipients in the batchTransfer call")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.recipients)
+    if not results:
+        print("❌ 没有可用的基准测试结果")
+        return
+    print(format_report(results))
+
+
+if __name__ == "__main__":
+    main()
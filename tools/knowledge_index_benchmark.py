@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+知识库向量索引基准测试
+把知识表的向量复制到临时LanceDB目录，分别建立 IVF_PQ / IVF_HNSW_SQ 索引，以表中随机两条向量的中点作为查询，
+测量不同 nprobes / refine_factor / ef 设置相对精确检索的 recall@k 和查询延迟，用于选择 KNOWLEDGE_ANN_* 参数。
+不调用嵌入接口，也不修改知识表本身。
+
+使用方法:
+python tools/knowledge_index_benchmark.py
+python tools/knowledge_index_benchmark.py --table rwa_education --k 5 --queries 200
+python tools/knowledge_index_benchmark.py --rows 100000
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import lancedb
+import numpy as np
+import pyarrow as pa
+
+# Add project root to system path for imports
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from agents.knowledge_ingestion import COMPLIANCE_TABLE, LANCEDB_URI
+from agents.vector_index import INDEX_TYPES, KNOWLEDGE_ANN_MIN_ROWS, apply_search_params, index_config
+
+DEFAULT_DIMENSIONS = 1536
+# PQ码本训练至少需要的行数
+MIN_BENCHMARK_ROWS = 256
+# 扩充数据时相对每维标准差的噪声幅度
+SYNTHETIC_NOISE = 0.1
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def load_vectors(table_name: str, rows: Optional[int], seed: int) -> np.ndarray:
+    """读取知识表的全部向量；指定 rows 时在现有向量上加噪声扩充到该行数，模拟语料增长"""
+    rng = np.random.default_rng(seed)
+    connection = lancedb.connect(LANCEDB_URI)
+    if table_name in connection.table_names():
+        column = connection.open_table(table_name).to_arrow().column("vector").combine_chunks()
+        vectors = np.asarray(column.values, dtype=np.float32).reshape(len(column), -1)
+    else:
+        print(f"⚠️ 知识表 {table_name} 不存在，使用随机向量（召回率会偏低）")
+        vectors = np.empty((0, DEFAULT_DIMENSIONS), dtype=np.float32)
+
+    if rows is not None and rows > len(vectors):
+        if len(vectors):
+            base = vectors[rng.integers(0, len(vectors), rows - len(vectors))]
+            noise = rng.normal(size=base.shape) * vectors.std(axis=0) * SYNTHETIC_NOISE
+            extra = normalize(base + noise)
+        else:
+            extra = normalize(rng.normal(size=(rows, vectors.shape[1])))
+        vectors = np.vstack([vectors, extra.astype(np.float32)])
+    return vectors
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """随机两条向量的中点，近似“介于两个分块之间”的自然语言查询"""
+    rng = np.random.default_rng(seed + 1)
+    pairs = rng.integers(0, len(vectors), size=(count, 2))
+    return normalize(vectors[pairs[:, 0]] + vectors[pairs[:, 1]]).astype(np.float32)
+
+
+def run_queries(table, queries: np.ndarray, k: int, **params) -> Dict[str, Any]:
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        frame = apply_search_params(table.search(query), **params).limit(k).select(["id"]).to_arrow()
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(frame.column("id").to_pylist())
+    return {"results": results, "p50": float(np.percentile(latencies, 50)), "p95": float(np.percentile(latencies, 95))}
+
+
+def recall_at_k(results: List[List[str]], exact: List[List[str]], k: int) -> float:
+    return float(np.mean([len(set(found) & set(truth)) / k for found, truth in zip(results, exact)]))
+
+
+def run_benchmark(vectors: np.ndarray, queries: np.ndarray, k: int, index_types: List[str],
+                  nprobes_values: List[int], refine_factors: List[int], ef_values: List[int]) -> Dict[str, Any]:
+    """在临时目录中建表，先测精确检索，再对每种索引测量各参数组合"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        connection = lancedb.connect(temp_dir)
+        data = pa.table({
+            "vector": pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel(), pa.float32()), vectors.shape[1]),
+            "id": pa.array([str(i) for i in range(len(vectors))]),
+        })
+        table = connection.create_table("benchmark", data=data)
+
+        exact = run_queries(table, queries, k, nprobes=0, refine_factor=0, ef=0)
+        settings = [{"index": "精确检索", "params": "-", "build_seconds": None, "recall": 1.0,
+                     "p50": exact["p50"], "p95": exact["p95"], "env": None}]
+        for index_type in index_types:
+            started = time.perf_counter()
+            table.create_index("vector", config=index_config(index_type), replace=True)
+            build_seconds = time.perf_counter() - started
+            second_values = refine_factors if index_type == "IVF_PQ" else ef_values
+            second_name = "refine_factor" if index_type == "IVF_PQ" else "ef"
+            for nprobes in nprobes_values:
+                for second in second_values:
+                    params = {"nprobes": nprobes, "refine_factor": 0, "ef": 0, second_name: second}
+                    measured = run_queries(table, queries, k, **params)
+                    settings.append({
+                        "index": index_type,
+                        "params": f"nprobes={nprobes or '默认'}, {second_name}={second or '默认'}",
+                        "build_seconds": build_seconds,
+                        "recall": recall_at_k(measured["results"], exact["results"], k),
+                        "p50": measured["p50"],
+                        "p95": measured["p95"],
+                        "env": {"KNOWLEDGE_ANN_INDEX_TYPE": index_type, "KNOWLEDGE_ANN_NPROBES": nprobes,
+                                "KNOWLEDGE_ANN_REFINE_FACTOR": params["refine_factor"], "KNOWLEDGE_ANN_EF": params["ef"]},
+                    })
+    return {"rows": len(vectors), "dimensions": vectors.shape[1], "queries": len(queries), "k": k, "settings": settings}
+
+
+def format_report(report: Dict[str, Any], target_recall: float) -> str:
+    """生成Markdown格式的基准测试报告"""
+    rows = []
+    for setting in report["settings"]:
+        build = f"{setting['build_seconds']:.1f}s" if setting["build_seconds"] is not None else "-"
+        rows.append(f"| {setting['index']} | {setting['params']} | {build} | {setting['recall']:.3f} | "
+                    f"{setting['p50']:.2f} | {setting['p95']:.2f} |")
+
+    candidates = [s for s in report["settings"] if s["env"] is not None and s["recall"] >= target_recall]
+    if candidates:
+        best = min(candidates, key=lambda s: s["p50"])
+        env_line = " ".join(f"{key}={value}" for key, value in best["env"].items())
+        exact_p50 = report["settings"][0]["p50"]
+        recommendation = (f"`{env_line}`\n\n"
+                          f"{best['index']}（{best['params']}）: recall@{report['k']} {best['recall']:.3f}，"
+                          f"p50 {best['p50']:.2f} ms（精确检索 {exact_p50:.2f} ms）")
+    else:
+        recommendation = f"没有设置达到 recall@{report['k']} ≥ {target_recall}，请增大 nprobes / refine_factor / ef"
+
+    return f"""# 知识库向量索引基准测试报告
+
+**数据**: {report['rows']:,} 行 × {report['dimensions']} 维，{report['queries']} 个查询，k = {report['k']}
+**当前建索引阈值**: {KNOWLEDGE_ANN_MIN_ROWS:,} 行（KNOWLEDGE_ANN_MIN_ROWS）
+
+| 索引 | 查询参数 | 建索引耗时 | recall@{report['k']} | p50 延迟 (ms) | p95 延迟 (ms) |
+|------|------|------|------|------|------|
+{chr(10).join(rows)}
+
+**推荐设置**（recall@{report['k']} ≥ {target_recall} 中p50延迟最低）:
+{recommendation}
+"""
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ANN index settings of a knowledge table (recall@k and latency)")
+    parser.add_argument("--table", default=COMPLIANCE_TABLE, help="Knowledge table whose vectors are used")
+    parser.add_argument("--rows", type=int, default=None, help="Expand the vectors with noisy copies to this many rows")
+    parser.add_argument("--queries", type=int, default=100, help="Number of benchmark queries")
+    parser.add_argument("--k", type=int, default=10, help="Results per query (recall@k)")
+    parser.add_argument("--index-types", default=",".join(INDEX_TYPES), help="Comma separated index types")
+    parser.add_argument("--nprobes", default="5,10,20,50", help="Comma separated nprobes values (0 = LanceDB default)")
+    parser.add_argument("--refine-factors", default="0,5", help="Comma separated IVF_PQ refine factors (0 = none)")
+    parser.add_argument("--ef", default="0,32,64,128", help="Comma separated IVF_HNSW_SQ ef values (0 = LanceDB default)")
+    parser.add_argument("--target-recall", type=float, default=0.95, help="Minimum recall@k for the recommendation")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.table, args.rows, args.seed)
+    if len(vectors) < MIN_BENCHMARK_ROWS:
+        print(f"❌ 只有 {len(vectors)} 行向量，至少需要 {MIN_BENCHMARK_ROWS} 行才能训练索引，可用 --rows 扩充")
+        return
+    queries = make_queries(vectors, args.queries, args.seed)
+    report = run_benchmark(
+        vectors, queries, args.k, args.index_types.split(","),
+        parse_int_list(args.nprobes), parse_int_list(args.refine_factors), parse_int_list(args.ef),
+    )
+    print(format_report(report, args.target_recall))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,17 @@ Web3以太坊MCP服务器 - 完整版本
 
 功能模块:
 1. 链上数据查询: ETH余额、Gas价格、区块信息、交易计数
-2. ERC20合约: 动态编译、智能部署、代币转账、余额查询  
+2. ERC20合约: 动态编译、智能部署、批量部署、代币转账、余额查询，支持Gas优化模板
 3. 网络支持: 主网、测试网、Layer2网络
+4. RPC限流: 按端点的自适应令牌桶，根据429/Retry-After自动降速并排队重试
+5. 链上状态订阅: 通过WebSocket newHeads推送维护最新区块、基础费用和待确认交易
+6. 文档存证: 文档哈希排队后构建Merkle树，单笔交易锚定根哈希并在本地保存每个文档的证明
+7. 文档指纹登记: 文档SHA-256与合约地址、交易哈希的本地索引，支持批量查询
+8. 多资产登记: 每个网络部署一次ERC-1155登记合约，新资产通过mint发行，balanceOfBatch批量查询份额
+9. 收益分配: 基于Transfer日志的持有人快照、按比例整数精确分配、批量/流水线执行转账
+10. 预言机价格: 通过Multicall3批量读取Chainlink价格源，按轮次缓存并提供历史时间序列
+11. Gas历史与延迟执行: 后台采样Gas价格时间序列，非紧急的部署和批量转账在Gas低于阈值或到截止时间时执行
+12. DEX流动性: 批量读取Uniswap v2/v3类池子状态，按区块缓存并计算RWA代币的滑点曲线和流动性深度
 
 使用方法:
 pip install fastmcp web3 eth-utils python-dotenv py-solc-x requests
@@ -15,24 +24,44 @@ python tools/web3_mcp_server.py
 """
 
 import os
+import json
+import time
+import sqlite3
+import hashlib
+import asyncio
 import logging
+import threading
 import requests
-from typing import Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple, List, Set, Callable
 from datetime import datetime
+from decimal import Decimal
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
 
 from fastmcp import FastMCP
 
 # Web3相关导入
 try:
-    from web3 import Web3
+    from web3 import Web3, HTTPProvider
+    from web3.utils import get_create_address
     from eth_utils import is_address, to_checksum_address
+    from eth_abi import decode as abi_decode, encode as abi_encode
     HAS_WEB3 = True
 except ImportError:
     HAS_WEB3 = False
     print("Error: Please install web3: pip install web3 eth-utils")
     exit(1)
 
+# WebSocket订阅导入（可选）
+try:
+    import websockets
+    HAS_WEBSOCKETS = True
+except ImportError:
+    HAS_WEBSOCKETS = False
+    print("Warning: websockets not found. Block and receipt tracking will use HTTP polling.")
+
 # Solidity编译器导入
 try:
     from solcx import compile_source, install_solc, set_solc_version
@@ -49,7 +78,9 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 从环境变量和配置文件读取配置
-WALLET_PRIVATE_KEY = os.getenv('WALLET_PRIVATE_KEY')
+# 只读模式：不加载钱包私钥（签名类工具全部不可用），也不启动后台任务，供只做行情查询的智能体使用
+WEB3_MCP_READ_ONLY = os.getenv('WEB3_MCP_READ_ONLY', '').lower() in ('1', 'true', 'yes')
+WALLET_PRIVATE_KEY = None if WEB3_MCP_READ_ONLY else os.getenv('WALLET_PRIVATE_KEY')
 WALLET_ADDRESS = os.getenv('WALLET_ADDRESS')
 INFURA_API_KEY = os.getenv('INFURA_API_KEY')
 
@@ -88,6 +119,7 @@ def get_networks():
             "mainnet": {
                 "name": "Ethereum Mainnet",
                 "rpc_url": f"https://mainnet.infura.io/v3/{INFURA_API_KEY}",
+                "ws_url": f"wss://mainnet.infura.io/ws/v3/{INFURA_API_KEY}",
                 "chain_id": 1,
                 "explorer": "https://etherscan.io",
                 "type": "mainnet"
@@ -95,20 +127,44 @@ def get_networks():
             "sepolia": {
                 "name": "Sepolia Testnet",
                 "rpc_url": f"https://sepolia.infura.io/v3/{INFURA_API_KEY}",
+                "ws_url": f"wss://sepolia.infura.io/ws/v3/{INFURA_API_KEY}",
                 "chain_id": 11155111,
                 "explorer": "https://sepolia.etherscan.io",
                 "type": "testnet"
             },
-            "goerli": {
-                "name": "Goerli Testnet", 
-                "rpc_url": f"https://goerli.infura.io/v3/{INFURA_API_KEY}",
-                "chain_id": 5,
-                "explorer": "https://goerli.etherscan.io",
-                "type": "testnet"
+            "arbitrum-sepolia": {
+                "name": "Arbitrum Sepolia Testnet",
+                "rpc_url": f"https://arbitrum-sepolia.infura.io/v3/{INFURA_API_KEY}",
+                "ws_url": f"wss://arbitrum-sepolia.infura.io/ws/v3/{INFURA_API_KEY}",
+                "chain_id": 421614,
+                "explorer": "https://sepolia.arbiscan.io",
+                "type": "testnet",
+                "layer": 2,
+            },
+            "optimism-sepolia": {
+                "name": "Optimism Sepolia Testnet",
+                "rpc_url": f"https://optimism-sepolia.infura.io/v3/{INFURA_API_KEY}",
+                "ws_url": f"wss://optimism-sepolia.infura.io/ws/v3/{INFURA_API_KEY}",
+                "chain_id": 11155420,
+                "explorer": "https://sepolia-optimism.etherscan.io",
+                "type": "testnet",
+                "layer": 2,
+                "op_stack": True,
+            },
+            "base-sepolia": {
+                "name": "Base Sepolia Testnet",
+                "rpc_url": f"https://base-sepolia.infura.io/v3/{INFURA_API_KEY}",
+                "ws_url": f"wss://base-sepolia.infura.io/ws/v3/{INFURA_API_KEY}",
+                "chain_id": 84532,
+                "explorer": "https://sepolia.basescan.org",
+                "type": "testnet",
+                "layer": 2,
+                "op_stack": True,
             },
             "polygon": {
                 "name": "Polygon Mainnet",
                 "rpc_url": f"https://polygon-mainnet.infura.io/v3/{INFURA_API_KEY}",
+                "ws_url": f"wss://polygon-mainnet.infura.io/ws/v3/{INFURA_API_KEY}",
                 "chain_id": 137,
                 "explorer": "https://polygonscan.com",
                 "type": "layer2"
@@ -116,6 +172,7 @@ def get_networks():
             "arbitrum": {
                 "name": "Arbitrum One",
                 "rpc_url": f"https://arbitrum-mainnet.infura.io/v3/{INFURA_API_KEY}",
+                "ws_url": f"wss://arbitrum-mainnet.infura.io/ws/v3/{INFURA_API_KEY}",
                 "chain_id": 42161,
                 "explorer": "https://arbiscan.io",
                 "type": "layer2"
@@ -123,6 +180,7 @@ def get_networks():
             "optimism": {
                 "name": "Optimism Mainnet",
                 "rpc_url": f"https://optimism-mainnet.infura.io/v3/{INFURA_API_KEY}",
+                "ws_url": f"wss://optimism-mainnet.infura.io/ws/v3/{INFURA_API_KEY}",
                 "chain_id": 10,
                 "explorer": "https://optimistic.etherscan.io",
                 "type": "layer2"
@@ -134,16 +192,57 @@ def get_networks():
             "mainnet": {
                 "name": "Ethereum Mainnet",
                 "rpc_url": "https://eth.llamarpc.com",
+                "ws_url": "wss://eth.llamarpc.com",
                 "chain_id": 1,
                 "explorer": "https://etherscan.io",
-                "type": "mainnet"
+                "type": "mainnet",
+                "rate_limit": 3
             },
             "polygon": {
                 "name": "Polygon Mainnet",
                 "rpc_url": "https://polygon-rpc.com",
                 "chain_id": 137,
                 "explorer": "https://polygonscan.com",
-                "type": "layer2"
+                "type": "layer2",
+                "rate_limit": 3
+            },
+            "sepolia": {
+                "name": "Sepolia Testnet",
+                "rpc_url": "https://ethereum-sepolia-rpc.publicnode.com",
+                "ws_url": "wss://ethereum-sepolia-rpc.publicnode.com",
+                "chain_id": 11155111,
+                "explorer": "https://sepolia.etherscan.io",
+                "type": "testnet",
+                "rate_limit": 3
+            },
+            "arbitrum-sepolia": {
+                "name": "Arbitrum Sepolia Testnet",
+                "rpc_url": "https://sepolia-rollup.arbitrum.io/rpc",
+                "chain_id": 421614,
+                "explorer": "https://sepolia.arbiscan.io",
+                "type": "testnet",
+                "layer": 2,
+                "rate_limit": 3
+            },
+            "optimism-sepolia": {
+                "name": "Optimism Sepolia Testnet",
+                "rpc_url": "https://sepolia.optimism.io",
+                "chain_id": 11155420,
+                "explorer": "https://sepolia-optimism.etherscan.io",
+                "type": "testnet",
+                "layer": 2,
+                "op_stack": True,
+                "rate_limit": 3
+            },
+            "base-sepolia": {
+                "name": "Base Sepolia Testnet",
+                "rpc_url": "https://sepolia.base.org",
+                "chain_id": 84532,
+                "explorer": "https://sepolia.basescan.org",
+                "type": "testnet",
+                "layer": 2,
+                "op_stack": True,
+                "rate_limit": 3
             }
         })
     
@@ -154,6 +253,215 @@ NETWORKS = get_networks()
 # 区分可部署合约的测试网络
 TESTNETWORKS = {k: v for k, v in NETWORKS.items() if v.get("type") == "testnet"}
 
+# ==================== RPC自适应限流 ====================
+
+# 每个端点的初始/最大请求速率（请求/秒），网络配置中的rate_limit优先
+RPC_RATE_LIMIT_RPS = float(os.getenv('RPC_RATE_LIMIT_RPS', '10'))
+RPC_RATE_LIMIT_MIN_RPS = float(os.getenv('RPC_RATE_LIMIT_MIN_RPS', '0.5'))
+RPC_MAX_RETRIES = int(os.getenv('RPC_MAX_RETRIES', '5'))
+RPC_QUEUE_TIMEOUT = float(os.getenv('RPC_QUEUE_TIMEOUT', '120'))
+
+# 批量交易并发等待回执的线程数
+RECEIPT_WAIT_WORKERS = int(os.getenv('RECEIPT_WAIT_WORKERS', '8'))
+
+# 部分服务商以HTTP 200 + JSON-RPC错误的形式返回限流
+RPC_RATE_LIMIT_ERROR_CODES = {-32005, -32029, 429}
+
+
+class AdaptiveTokenBucket:
+    """单个RPC端点的令牌桶
+    
+    请求在桶内排队等待令牌而不是直接失败；收到429时速率减半并按Retry-After暂停，
+    之后每次成功请求线性恢复速率（AIMD）。
+    """
+
+    def __init__(self, endpoint: str, rate: float, min_rate: float = RPC_RATE_LIMIT_MIN_RPS):
+        self.endpoint = endpoint
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+        # 指标
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.total_requests = 0
+        self.throttled_count = 0
+        self.total_wait = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, cost: float = 1.0, timeout: float = RPC_QUEUE_TIMEOUT) -> None:
+        """排队获取cost个令牌（批量请求按调用数计费），超过timeout秒仍未获取则抛出TimeoutError"""
+        cost = min(cost, self.capacity)
+        start = time.monotonic()
+        with self.condition:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now >= self.paused_until and self.tokens >= cost:
+                        self.tokens -= cost
+                        self.total_requests += 1
+                        self.total_wait += now - start
+                        return
+                    if now - start >= timeout:
+                        raise TimeoutError(f"RPC端点 {self.endpoint} 排队超时（{timeout:.0f}秒）")
+                    delay = max(self.paused_until - now, (cost - self.tokens) / self.rate)
+                    self.condition.wait(min(delay, 1.0))
+            finally:
+                self.queue_depth -= 1
+
+    def on_throttled(self, retry_after: Optional[float] = None) -> None:
+        """收到限流响应：速率减半，并暂停到Retry-After指定的时间"""
+        with self.condition:
+            now = time.monotonic()
+            self.throttled_count += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.updated_at = now
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self.paused_until = max(self.paused_until, now + pause)
+            logger.warning(f"RPC端点 {self.endpoint} 触发限流，速率降至 {self.rate:.2f} req/s，暂停 {pause:.1f} 秒")
+            self.condition.notify_all()
+
+    def on_success(self) -> None:
+        """请求成功：线性恢复速率直到上限"""
+        if self.rate < self.max_rate:
+            with self.condition:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                "endpoint": self.endpoint,
+                "rate": self.rate,
+                "max_rate": self.max_rate,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "total_requests": self.total_requests,
+                "throttled_count": self.throttled_count,
+                "avg_wait_ms": (self.total_wait / self.total_requests * 1000) if self.total_requests else 0.0,
+            }
+
+
+_rate_limiters: Dict[str, AdaptiveTokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def mask_rpc_url(rpc_url: str) -> str:
+    """隐藏RPC地址中的API Key"""
+    if INFURA_API_KEY and INFURA_API_KEY in rpc_url:
+        return rpc_url.replace(INFURA_API_KEY, INFURA_API_KEY[:4] + "***")
+    return rpc_url
+
+
+def get_rate_limiter(rpc_url: str) -> AdaptiveTokenBucket:
+    """获取（或创建）RPC端点对应的令牌桶，raw requests与web3 provider共用"""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(rpc_url)
+        if limiter is None:
+            rate = next(
+                (net.get("rate_limit", RPC_RATE_LIMIT_RPS) for net in NETWORKS.values() if net["rpc_url"] == rpc_url),
+                RPC_RATE_LIMIT_RPS,
+            )
+            limiter = AdaptiveTokenBucket(mask_rpc_url(rpc_url), rate)
+            _rate_limiters[rpc_url] = limiter
+        return limiter
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头（秒数或HTTP日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(retry_at.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limit_error(error: Any) -> bool:
+    """判断JSON-RPC错误是否为限流错误"""
+    if not isinstance(error, dict):
+        return False
+    message = str(error.get("message", "")).lower()
+    return error.get("code") in RPC_RATE_LIMIT_ERROR_CODES or "rate limit" in message or "too many requests" in message
+
+
+def rpc_post(rpc_url: str, payload: Any, timeout: int = 30) -> Any:
+    """经过限流器发送JSON-RPC请求，遇到限流时排队重试而不是直接失败"""
+    limiter = get_rate_limiter(rpc_url)
+    cost = len(payload) if isinstance(payload, list) else 1
+    for _ in range(RPC_MAX_RETRIES + 1):
+        limiter.acquire(cost)
+        response = requests.post(rpc_url, json=payload, timeout=timeout)
+        if response.status_code == 429:
+            limiter.on_throttled(parse_retry_after(response.headers.get("Retry-After")))
+            continue
+        response.raise_for_status()
+        data = response.json()
+        items = data if isinstance(data, list) else [data]
+        if any(isinstance(item, dict) and is_rate_limit_error(item.get("error")) for item in items):
+            limiter.on_throttled(None)
+            continue
+        limiter.on_success()
+        return data
+    raise ConnectionError(f"RPC端点 {limiter.endpoint} 持续限流，已重试 {RPC_MAX_RETRIES} 次")
+
+
+def rpc_batch(rpc_url: str, calls: List[Tuple[str, list]], timeout: int = 30) -> List[Dict[str, Any]]:
+    """用一次HTTP往返发送多个JSON-RPC调用（JSON-RPC批量请求），按调用顺序返回响应"""
+    payload = [
+        {"jsonrpc": "2.0", "method": method, "params": params, "id": index}
+        for index, (method, params) in enumerate(calls)
+    ]
+    data = rpc_post(rpc_url, payload, timeout)
+    if isinstance(data, list):
+        by_id = {item.get("id"): item for item in data if isinstance(item, dict)}
+        return [by_id.get(index, {"error": {"message": "批量请求缺少响应"}}) for index in range(len(calls))]
+    # 端点不支持批量请求时退回逐个发送
+    logger.debug(f"端点 {mask_rpc_url(rpc_url)} 不支持JSON-RPC批量请求，改为逐个发送")
+    return [rpc_post(rpc_url, item, timeout) for item in payload]
+
+
+class RateLimitedHTTPProvider(HTTPProvider):
+    """与rpc_post共用令牌桶的web3 HTTP Provider"""
+
+    def __init__(self, endpoint_uri=None, **kwargs):
+        # 重试由限流器负责：web3自带的异常重试会在super().make_request内部重试429，令牌桶看不到最初的限流
+        kwargs.setdefault("exception_retry_configuration", None)
+        super().__init__(endpoint_uri, **kwargs)
+
+    def make_request(self, method, params):
+        limiter = get_rate_limiter(self.endpoint_uri)
+        for _ in range(RPC_MAX_RETRIES + 1):
+            limiter.acquire()
+            try:
+                response = super().make_request(method, params)
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code == 429:
+                    limiter.on_throttled(parse_retry_after(e.response.headers.get("Retry-After")))
+                    continue
+                raise
+            if is_rate_limit_error(response.get("error")):
+                limiter.on_throttled(None)
+                continue
+            limiter.on_success()
+            return response
+        raise ConnectionError(f"RPC端点 {limiter.endpoint} 持续限流，已重试 {RPC_MAX_RETRIES} 次")
+
 # ERC20合约相关常量和ABI
 ERC20_ABI = [
     {"inputs": [{"internalType": "string", "name": "_name", "type": "string"}, {"internalType": "string", "name": "_symbol", "type": "string"}, {"internalType": "uint256", "name": "_totalSupply", "type": "uint256"}], "stateMutability": "nonpayable", "type": "constructor"},
@@ -221,35 +529,183 @@ contract SimpleERC20 {
 }
 '''
 
+# Gas优化版ERC20：immutable精度、自定义错误、unchecked算术，可选batchTransfer批量转账
+_ERC20_OPTIMIZED_TEMPLATE = '''
+pragma solidity ^0.8.19;
+
+contract OptimizedERC20 {
+    string public name;
+    string public symbol;
+    uint8 public immutable decimals;
+    uint256 public totalSupply;
+    
+    mapping(address => uint256) public balanceOf;
+    mapping(address => mapping(address => uint256)) public allowance;
+    
+    event Transfer(address indexed from, address indexed to, uint256 value);
+    event Approval(address indexed owner, address indexed spender, uint256 value);
+    
+    error InsufficientBalance(uint256 available, uint256 required);
+    error InsufficientAllowance(uint256 available, uint256 required);
+    error ZeroAddress();
+    error LengthMismatch();
+    
+    constructor(string memory _name, string memory _symbol, uint256 _totalSupply) {
+        name = _name;
+        symbol = _symbol;
+        decimals = 18;
+        uint256 supply = _totalSupply * 10**18;
+        totalSupply = supply;
+        balanceOf[msg.sender] = supply;
+        emit Transfer(address(0), msg.sender, supply);
+    }
+    
+    function _transfer(address from, address to, uint256 value) internal {
+        if (to == address(0)) revert ZeroAddress();
+        uint256 fromBalance = balanceOf[from];
+        if (fromBalance < value) revert InsufficientBalance(fromBalance, value);
+        unchecked {
+            // 余额之和不超过totalSupply，不会溢出
+            balanceOf[from] = fromBalance - value;
+            balanceOf[to] += value;
+        }
+        emit Transfer(from, to, value);
+    }
+    
+    function transfer(address to, uint256 value) external returns (bool) {
+        _transfer(msg.sender, to, value);
+        return true;
+    }
+    
+    function approve(address spender, uint256 value) external returns (bool) {
+        allowance[msg.sender][spender] = value;
+        emit Approval(msg.sender, spender, value);
+        return true;
+    }
+    
+    function transferFrom(address from, address to, uint256 value) external returns (bool) {
+        uint256 allowed = allowance[from][msg.sender];
+        if (allowed != type(uint256).max) {
+            if (allowed < value) revert InsufficientAllowance(allowed, value);
+            unchecked {
+                allowance[from][msg.sender] = allowed - value;
+            }
+        }
+        _transfer(from, to, value);
+        return true;
+    }
+%(batch_transfer)s}
+'''
+
+_ERC20_BATCH_TRANSFER_FUNCTION = '''
+    function batchTransfer(address[] calldata recipients, uint256[] calldata values) external returns (bool) {
+        if (recipients.length != values.length) revert LengthMismatch();
+        uint256 senderBalance = balanceOf[msg.sender];
+        for (uint256 i; i < recipients.length; ) {
+            address to = recipients[i];
+            uint256 value = values[i];
+            if (to == address(0)) revert ZeroAddress();
+            if (senderBalance < value) revert InsufficientBalance(senderBalance, value);
+            unchecked {
+                senderBalance -= value;
+                if (to == msg.sender) {
+                    senderBalance += value;
+                } else {
+                    balanceOf[to] += value;
+                }
+                ++i;
+            }
+            emit Transfer(msg.sender, to, value);
+        }
+        balanceOf[msg.sender] = senderBalance;
+        return true;
+    }
+'''
+
+ERC20_LEAN_SOURCE_CODE = _ERC20_OPTIMIZED_TEMPLATE % {"batch_transfer": ""}
+ERC20_OPTIMIZED_SOURCE_CODE = _ERC20_OPTIMIZED_TEMPLATE % {"batch_transfer": _ERC20_BATCH_TRANSFER_FUNCTION}
+
+# 可选的ERC20模板，构造函数参数一致: (name, symbol, totalSupply)
+ERC20_TEMPLATES = {
+    "standard": {
+        "source": ERC20_SOURCE_CODE,
+        "contract": "SimpleERC20",
+        "optimize": False,
+        "description": "原始模板（存储decimals、require字符串、未开启优化器）",
+    },
+    "standard_optimizer": {
+        "source": ERC20_SOURCE_CODE,
+        "contract": "SimpleERC20",
+        "optimize": True,
+        "description": "原始模板 + 编译器优化",
+    },
+    "lean": {
+        "source": ERC20_LEAN_SOURCE_CODE,
+        "contract": "OptimizedERC20",
+        "optimize": True,
+        "description": "immutable精度 + 自定义错误 + unchecked算术 + 编译器优化",
+    },
+    "optimized": {
+        "source": ERC20_OPTIMIZED_SOURCE_CODE,
+        "contract": "OptimizedERC20",
+        "optimize": True,
+        "description": "lean模板 + batchTransfer批量转账",
+    },
+}
+
+# 默认部署模板（与引入模板前的部署字节码一致），运行 tools/erc20_gas_benchmark.py 确认节省后可通过环境变量切换
+DEFAULT_ERC20_TEMPLATE = os.getenv('ERC20_DEFAULT_TEMPLATE', 'standard')
+SOLC_VERSION = '0.8.19'
+SOLC_OPTIMIZE_RUNS = int(os.getenv('SOLC_OPTIMIZE_RUNS', '200'))
+
+ERC20_BATCH_TRANSFER_ABI = [
+    {"inputs": [{"internalType": "address[]", "name": "recipients", "type": "address[]"}, {"internalType": "uint256[]", "name": "values", "type": "uint256[]"}], "name": "batchTransfer", "outputs": [{"internalType": "bool", "name": "", "type": "bool"}], "stateMutability": "nonpayable", "type": "function"}
+]
+
 # 预编译的ERC20字节码（简化版）
 ERC20_BYTECODE = "0x608060405260126002600a6101000a81548160ff021916908360ff1602179055503480156200002d57600080fd5b506040516200188138038062001881833981016040528101906200005391906200032f565b82600090816200006491906200060a565b5081600190816200007691906200060a565b50600260009054906101000a900460ff16600a6200009591906200088156005081620000a29190620008d2565b600381905550600354600460003373ffffffffffffffffffffffffffffffffffffffff1673ffffffffffffffffffffffffffffffffffffffff168152602001908152602001600020819055503373ffffffffffffffffffffffffffffffffffffffff16600073ffffffffffffffffffffffffffffffffffffffff167fddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef6003546040516200015091906200092e565b60405180910390a35050506200094b565b"
 
 # 辅助函数
+# 按网络缓存的Web3实例，连接检查只在首次创建时进行
+_web3_instances: Dict[str, Web3] = {}
+_web3_instances_lock = threading.Lock()
+
 def get_web3_instance(network: str) -> Web3:
-    """获取Web3实例"""
+    """获取Web3实例（批量部署线程池、调度器和存证定时器会并发调用）"""
     if network not in NETWORKS:
         raise ValueError(f"不支持的网络: {network}")
     
-    rpc_url = NETWORKS[network]["rpc_url"]
-    w3 = Web3(Web3.HTTPProvider(rpc_url))
-    
-    if not w3.is_connected():
-        raise ConnectionError(f"无法连接到{network}网络")
+    with _web3_instances_lock:
+        w3 = _web3_instances.get(network)
+        if w3 is None:
+            rpc_url = NETWORKS[network]["rpc_url"]
+            w3 = Web3(RateLimitedHTTPProvider(rpc_url))
+            
+            if not w3.is_connected():
+                raise ConnectionError(f"无法连接到{network}网络")
+            
+            _web3_instances[network] = w3
+    # 提前启动newHeads订阅，后续等待回执时可直接使用推送（只读模式下不启动）
+    get_head_subscription(network)
     
     return w3
 
-def compile_erc20_contract() -> Tuple[Optional[str], Optional[list]]:
-    """编译ERC20合约，返回字节码和ABI"""
+def compile_erc20_contract(template: str = "standard") -> Tuple[Optional[str], Optional[list]]:
+    """编译指定模板的ERC20合约，返回字节码和ABI"""
     if not HAS_SOLCX:
         logger.warning("没有安装py-solc-x，使用预编译的字节码")
         return None, None
     
     try:
-        install_solc('0.8.19')
-        set_solc_version('0.8.19')
-        logger.info("正在编译ERC20合约...")
-        compiled_sol = compile_source(ERC20_SOURCE_CODE)
-        contract_interface = compiled_sol['<stdin>:SimpleERC20']
+        template_config = ERC20_TEMPLATES[template]
+        install_solc(SOLC_VERSION)
+        set_solc_version(SOLC_VERSION)
+        logger.info(f"正在编译ERC20合约（模板: {template}）...")
+        if template_config["optimize"]:
+            compiled_sol = compile_source(template_config["source"], optimize=True, optimize_runs=SOLC_OPTIMIZE_RUNS)
+        else:
+            compiled_sol = compile_source(template_config["source"])
+        contract_interface = compiled_sol[f"<stdin>:{template_config['contract']}"]
         bytecode = contract_interface['bin']
         abi = contract_interface['abi']
         logger.info(f"✅ 合约编译成功，字节码长度: {len(bytecode)} 字符")
@@ -258,6 +714,537 @@ def compile_erc20_contract() -> Tuple[Optional[str], Optional[list]]:
         logger.error(f"合约编译失败: {e}")
         return None, None
 
+# 编译结果缓存（按模板），避免每次部署重复编译
+_erc20_artifacts: Dict[str, Tuple[str, list, str]] = {}
+_erc20_artifacts_lock = threading.Lock()
+
+def get_erc20_artifacts(template: str = DEFAULT_ERC20_TEMPLATE) -> Tuple[str, list, str]:
+    """获取ERC20部署所需的字节码、ABI和编译方式（每个模板在进程内只编译一次）"""
+    if template not in ERC20_TEMPLATES:
+        raise ValueError(f"不支持的ERC20模板: {template}。可选模板: {', '.join(ERC20_TEMPLATES.keys())}")
+    
+    with _erc20_artifacts_lock:
+        if template not in _erc20_artifacts:
+            compiled_bytecode, compiled_abi = compile_erc20_contract(template)
+            if compiled_bytecode and compiled_abi:
+                logger.info("✅ 使用动态编译的合约字节码")
+                _erc20_artifacts[template] = (compiled_bytecode, compiled_abi, f"动态编译（{template}模板）")
+            elif template != "standard":
+                # 预编译字节码只有标准模板，其他模板回退会部署出缺少模板功能的合约
+                raise RuntimeError(f"{template}模板动态编译失败（需要solc），预编译字节码只支持standard模板")
+            else:
+                # 编译失败不缓存，下次调用时重试
+                logger.info("⚠️ 动态编译失败，使用预编译的字节码")
+                return ERC20_BYTECODE, ERC20_ABI, "预编译字节码（standard模板）"
+        return _erc20_artifacts[template]
+
+def get_private_key() -> str:
+    """返回带0x前缀的钱包私钥"""
+    if WALLET_PRIVATE_KEY.startswith('0x'):
+        return WALLET_PRIVATE_KEY
+    return '0x' + WALLET_PRIVATE_KEY
+
+# ==================== 链上状态订阅 ====================
+
+# 推送数据超过该秒数未更新时视为过期，回退到HTTP查询
+HEAD_STALE_SECONDS = float(os.getenv('HEAD_STALE_SECONDS', '60'))
+# 已确认交易保留跟踪的确认数
+TRACKED_TX_CONFIRMATIONS = int(os.getenv('TRACKED_TX_CONFIRMATIONS', '12'))
+# 未打包交易超过该秒数没有调用方等待时停止跟踪
+TRACKED_TX_TTL_SECONDS = float(os.getenv('TRACKED_TX_TTL_SECONDS', '3600'))
+
+
+class HeadSubscription:
+    """单个网络的newHeads订阅
+    
+    后台线程通过WebSocket接收新区块头，在内存中维护最新区块号、基础费用，
+    并在每个新区块到达时一次批量查询所有待确认交易的回执，唤醒等待中的调用方。
+    """
+
+    def __init__(self, network: str, ws_url: str):
+        self.network = network
+        self.ws_url = ws_url
+        self.condition = threading.Condition()
+        self.connected = False
+        self.block_number: Optional[int] = None
+        self.base_fee: Optional[int] = None
+        self.block_timestamp: Optional[int] = None
+        self.updated_at = 0.0
+        self.heads_received = 0
+        # 最近一次eth_gasPrice结果及其所在区块
+        self.gas_price: Optional[int] = None
+        self.gas_price_block: Optional[int] = None
+        # tx_hash -> {"receipt_block": 区块号或None, "status": 交易状态或None,
+        #             "tracked_at": 最近一次有调用方等待的时间（monotonic）, "group": 同一nonce的全部哈希}
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.thread = threading.Thread(target=self._run, name=f"newHeads-{network}", daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def is_fresh(self) -> bool:
+        return self.connected and self.block_number is not None and time.monotonic() - self.updated_at < HEAD_STALE_SECONDS
+
+    def _run(self) -> None:
+        asyncio.run(self._listen_forever())
+
+    async def _listen_forever(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                async with websockets.connect(self.ws_url, ping_interval=20, ping_timeout=20) as ws:
+                    await ws.send(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}))
+                    subscription = json.loads(await ws.recv())
+                    if "error" in subscription:
+                        raise ConnectionError(subscription["error"].get("message"))
+                    logger.info(f"✅ 已订阅 {self.network} newHeads")
+                    self.connected = True
+                    backoff = 1.0
+                    async for message in ws:
+                        head = json.loads(message).get("params", {}).get("result")
+                        if head:
+                            await asyncio.get_running_loop().run_in_executor(None, self._on_head, head)
+            except Exception as e:
+                logger.warning(f"{self.network} newHeads订阅中断: {e}，{backoff:.0f}秒后重连")
+            finally:
+                self.connected = False
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def _on_head(self, head: Dict[str, Any]) -> None:
+        block_number = int(head["number"], 16)
+        with self.condition:
+            self.block_number = block_number
+            self.base_fee = int(head["baseFeePerGas"], 16) if head.get("baseFeePerGas") else None
+            self.block_timestamp = int(head["timestamp"], 16)
+            self.updated_at = time.monotonic()
+            self.heads_received += 1
+            unresolved = [tx_hash for tx_hash, item in self.pending.items() if item["receipt_block"] is None]
+        
+        if unresolved:
+            try:
+                receipts = rpc_batch(
+                    NETWORKS[self.network]["rpc_url"],
+                    [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in unresolved],
+                )
+                with self.condition:
+                    for tx_hash, response in zip(unresolved, receipts):
+                        receipt = response.get("result")
+                        if receipt and tx_hash in self.pending:
+                            item = self.pending[tx_hash]
+                            item["receipt_block"] = int(receipt["blockNumber"], 16)
+                            item["status"] = int(receipt["status"], 16)
+                            # 同一nonce的其他哈希（被替换的交易）不会再打包
+                            for sibling in item["group"] - {tx_hash}:
+                                if sibling in self.pending and self.pending[sibling]["receipt_block"] is None:
+                                    del self.pending[sibling]
+            except Exception as e:
+                logger.debug(f"{self.network} 回执查询失败: {e}")
+        
+        with self.condition:
+            # 清理确认数足够的旧交易，以及长时间没有调用方等待的未打包交易
+            now = time.monotonic()
+            for tx_hash in [tx_hash for tx_hash, item in self.pending.items()
+                            if (item["receipt_block"] is not None
+                                and block_number - item["receipt_block"] + 1 > TRACKED_TX_CONFIRMATIONS)
+                            or (item["receipt_block"] is None and now - item["tracked_at"] > TRACKED_TX_TTL_SECONDS)]:
+                del self.pending[tx_hash]
+            self.condition.notify_all()
+
+    def remember_gas_price(self, gas_price: int) -> None:
+        with self.condition:
+            self.gas_price = gas_price
+            self.gas_price_block = self.block_number
+
+    def track_transactions(self, tx_hashes: List[str]) -> None:
+        """跟踪同一nonce的一组交易（原交易及其加价替换），其中一笔打包后其余停止跟踪"""
+        group = set(tx_hashes)
+        now = time.monotonic()
+        with self.condition:
+            for tx_hash in tx_hashes:
+                item = self.pending.setdefault(tx_hash, {"receipt_block": None, "status": None})
+                item.update({"tracked_at": now, "group": group})
+
+    def mined_transaction(self, tx_hashes: List[str]) -> Optional[str]:
+        """返回tx_hashes中订阅已查到回执的哈希"""
+        with self.condition:
+            return next((tx_hash for tx_hash in tx_hashes
+                         if self.pending.get(tx_hash, {}).get("receipt_block") is not None), None)
+
+    def confirmations(self, tx_hash: str) -> int:
+        with self.condition:
+            item = self.pending.get(tx_hash)
+            if not item or item["receipt_block"] is None or self.block_number is None:
+                return 0
+            return self.block_number - item["receipt_block"] + 1
+
+    def wait_for_new_block(self, after_block: Optional[int], timeout: float) -> bool:
+        """阻塞直到收到比after_block更新的区块或超时"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.block_number == after_block:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.is_fresh():
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+
+_head_subscriptions: Dict[str, HeadSubscription] = {}
+_head_subscriptions_lock = threading.Lock()
+
+
+def get_head_subscription(network: str) -> Optional[HeadSubscription]:
+    """获取网络的newHeads订阅，首次访问时在后台启动；只读模式、未配置ws_url或缺少websockets时返回None"""
+    ws_url = NETWORKS.get(network, {}).get("ws_url")
+    if WEB3_MCP_READ_ONLY or not HAS_WEBSOCKETS or not ws_url:
+        return None
+    with _head_subscriptions_lock:
+        subscription = _head_subscriptions.get(network)
+        if subscription is None:
+            subscription = HeadSubscription(network, ws_url)
+            subscription.start()
+            _head_subscriptions[network] = subscription
+        return subscription
+
+
+def to_tx_hash_hex(tx_hash: Any) -> str:
+    """统一交易哈希格式为0x开头的十六进制字符串"""
+    value = tx_hash if isinstance(tx_hash, str) else tx_hash.hex()
+    return value if value.startswith("0x") else "0x" + value
+
+
+# ==================== 交易发送与加价替换 ====================
+
+# 默认确认截止时间（秒）：超过后不再判定失败，而是报告仍在等待的交易哈希
+CONFIRMATION_DEADLINE_SECONDS = float(os.getenv('CONFIRMATION_DEADLINE_SECONDS', '300'))
+# 超过预期出块数仍未打包时以相同nonce加价重发
+CONFIRMATION_TARGET_BLOCKS = int(os.getenv('CONFIRMATION_TARGET_BLOCKS', '3'))
+# 每次替换至少加价12.5%（节点替换交易的最低要求为10%）
+FEE_BUMP_PERCENT = 12.5
+# 加价上限：不超过初始Gas价格的倍数
+MAX_FEE_BUMP_MULTIPLIER = float(os.getenv('MAX_FEE_BUMP_MULTIPLIER', '8'))
+# 没有newHeads推送时的回执轮询间隔（秒）
+RECEIPT_POLL_INTERVAL = 2.0
+
+
+def expected_block_time(network: str) -> float:
+    """网络的预期出块时间：优先使用最近一次网络排名的测量值"""
+    for probe in _network_ranking["results"]:
+        if probe["network"] == network and probe.get("block_time"):
+            return probe["block_time"]
+    return 2.0 if NETWORKS[network].get("layer") == 2 else 12.0
+
+
+# 延迟任务执行期间的Gas价格上限（按线程设置），预检得到的发送价格和加价替换都不会超过该值
+_gas_price_cap = threading.local()
+
+
+@contextmanager
+def gas_price_cap(max_fee: Optional[int]):
+    """在当前线程内把发送交易的Gas价格限制在max_fee以内（None表示不限制）"""
+    previous = getattr(_gas_price_cap, "value", None)
+    _gas_price_cap.value = max_fee
+    try:
+        yield
+    finally:
+        _gas_price_cap.value = previous
+
+
+def current_gas_price_cap() -> Optional[int]:
+    return getattr(_gas_price_cap, "value", None)
+
+
+def sign_and_send(w3: Web3, transaction: Dict[str, Any], private_key: str) -> str:
+    signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
+    return to_tx_hash_hex(w3.eth.send_raw_transaction(signed_txn.raw_transaction))
+
+
+def wait_for_any_receipt(w3: Web3, network: str, tx_hashes: List[str], timeout: float) -> Optional[Tuple[str, Any]]:
+    """等待同一nonce的任一交易被打包
+    
+    有newHeads推送时由订阅在每个新区块批量查询回执，这里只读取结果；订阅不可用或过期时按固定间隔自行轮询。
+    """
+    subscription = get_head_subscription(network)
+    deadline = time.monotonic() + timeout
+    while True:
+        if subscription is not None and subscription.is_fresh():
+            subscription.track_transactions(tx_hashes)
+            mined = subscription.mined_transaction(tx_hashes)
+        else:
+            responses = rpc_batch(NETWORKS[network]["rpc_url"],
+                                  [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in tx_hashes])
+            mined = next((tx_hash for tx_hash, response in zip(tx_hashes, responses) if response.get("result")), None)
+        if mined is not None:
+            return mined, w3.eth.get_transaction_receipt(mined)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        if subscription is not None and subscription.is_fresh():
+            subscription.wait_for_new_block(subscription.block_number, min(remaining, HEAD_STALE_SECONDS))
+        else:
+            time.sleep(min(remaining, RECEIPT_POLL_INTERVAL))
+
+
+def confirm_with_fee_bumping(w3: Web3, network: str, transaction: Dict[str, Any], private_key: str,
+                             tx_hashes: List[str], deadline_seconds: float = CONFIRMATION_DEADLINE_SECONDS,
+                             on_broadcast: Optional[Callable[[List[str]], None]] = None,
+                             max_gas_price: Optional[int] = None) -> Dict[str, Any]:
+    """等待已广播的交易确认；超过预期出块数未打包时以相同nonce加价替换，直到确认或到达截止时间
+    
+    on_broadcast在每次广播替换交易后以全部哈希调用，供调用方持久化（进程中断后据此核对，避免重复发送）。
+    max_gas_price限制替换交易的Gas价格，默认为当前线程的gas_price_cap（在工作线程中等待时需显式传入）。
+    
+    Returns:
+        包含tx_hash（最终被打包或最新广播的哈希）、receipt（未确认时为None）、
+        hashes（所有广播过的哈希）、gas_price、replacements的字典
+    """
+    transaction = dict(transaction)
+    gas_prices = {tx_hashes[-1]: transaction["gasPrice"]}
+    bump_limit = int(transaction["gasPrice"] * MAX_FEE_BUMP_MULTIPLIER)
+    cap = max_gas_price if max_gas_price is not None else current_gas_price_cap()
+    max_gas_price = bump_limit if cap is None else max(transaction["gasPrice"], min(bump_limit, cap))
+    bump_interval = expected_block_time(network) * CONFIRMATION_TARGET_BLOCKS
+    started = time.monotonic()
+    replacements = 0
+    
+    while True:
+        remaining = deadline_seconds - (time.monotonic() - started)
+        mined = wait_for_any_receipt(w3, network, tx_hashes, max(0.0, min(bump_interval, remaining)))
+        if mined is not None:
+            tx_hash, receipt = mined
+            return {"tx_hash": tx_hash, "receipt": receipt, "hashes": tx_hashes,
+                    "gas_price": gas_prices.get(tx_hash, transaction["gasPrice"]), "replacements": replacements}
+        if time.monotonic() - started >= deadline_seconds:
+            return {"tx_hash": tx_hashes[-1], "receipt": None, "hashes": tx_hashes,
+                    "gas_price": transaction["gasPrice"], "replacements": replacements}
+        
+        previous_price = transaction["gasPrice"]
+        bumped = previous_price * int(1000 + FEE_BUMP_PERCENT * 10) // 1000 + 1
+        if bumped > max_gas_price:
+            # 已达到加价上限，继续等待
+            continue
+        transaction["gasPrice"] = max(bumped, min(max_gas_price, w3.eth.gas_price))
+        try:
+            tx_hash = sign_and_send(w3, transaction, private_key)
+        except Exception as e:
+            message = str(e).lower()
+            if "insufficient funds" in message:
+                # 余额不足以支付更高费用，停止加价
+                transaction["gasPrice"] = previous_price
+                max_gas_price = previous_price
+            elif "nonce too low" not in message and "already known" not in message and "underpriced" not in message:
+                logger.warning(f"替换交易发送失败: {e}")
+            continue
+        tx_hashes.append(tx_hash)
+        gas_prices[tx_hash] = transaction["gasPrice"]
+        replacements += 1
+        if on_broadcast is not None:
+            on_broadcast(list(tx_hashes))
+        logger.info(f"交易 {bump_interval:.0f} 秒内未打包，已加价至 {Web3.from_wei(transaction['gasPrice'], 'gwei'):.4f} Gwei "
+                    f"重新广播: {tx_hash}（nonce {transaction['nonce']}）")
+
+
+def send_transaction_with_deadline(w3: Web3, network: str, transaction: Dict[str, Any], private_key: str,
+                                   deadline_seconds: float = CONFIRMATION_DEADLINE_SECONDS) -> Dict[str, Any]:
+    """签名并广播交易，未按时打包时自动加价替换（返回值同confirm_with_fee_bumping）"""
+    tx_hash = sign_and_send(w3, transaction, private_key)
+    logger.info(f"交易已发送: {tx_hash}")
+    return confirm_with_fee_bumping(w3, network, transaction, private_key, [tx_hash], deadline_seconds)
+
+
+def reconcile_broadcast(w3: Web3, network: str, sender: str, tx_hashes: List[str],
+                        nonce: Optional[int]) -> Tuple[str, Optional[str], Any]:
+    """核对之前已广播但未确认的交易（同一nonce的全部哈希），决定能否重新发送
+    
+    Returns:
+        ("mined", tx_hash, receipt)：其中一笔已打包（receipt.status为0表示回滚）；
+        ("released", None, None)：nonce已被其他交易使用且这些哈希都没有回执，不会再打包，可以重新发送；
+        ("pending", None, None)：仍可能被打包，不能重新发送
+    """
+    rpc_url = NETWORKS[network]["rpc_url"]
+    # nonce已被使用却没有回执时再查一次，排除回执查询与nonce查询之间恰好出块的情况
+    for _ in range(2):
+        responses = rpc_batch(rpc_url, [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in tx_hashes]
+                              + [("eth_getTransactionCount", [sender, "latest"])])
+        for tx_hash, response in zip(tx_hashes, responses):
+            if response.get("result"):
+                return "mined", tx_hash, w3.eth.get_transaction_receipt(tx_hash)
+        confirmed_nonce = responses[-1].get("result")
+        if nonce is None or confirmed_nonce is None or int(confirmed_nonce, 16) <= nonce:
+            return "pending", None, None
+    return "released", None, None
+
+
+def receipt_fee(receipt: Any, gas_price: int) -> int:
+    """交易实际费用，优先使用回执中的effectiveGasPrice"""
+    return receipt.gasUsed * receipt.get("effectiveGasPrice", gas_price)
+
+
+def format_pending_transaction(sent: Dict[str, Any], network: str) -> str:
+    """交易在截止时间内未确认时的说明（交易仍然有效，不是失败）"""
+    explorer = NETWORKS[network]['explorer']
+    hashes = "\n".join(f"- `{tx_hash}`" for tx_hash in sent["hashes"])
+    return f"""# 交易等待确认中 ⏳
+
+交易在截止时间内尚未打包，但仍在内存池中等待，**不是失败**。同一nonce只会有一笔交易最终上链。
+
+**最新交易哈希**: `{sent['tx_hash']}`
+**当前Gas价格**: {Web3.from_wei(sent['gas_price'], 'gwei'):.4f} Gwei（已加价替换 {sent['replacements']} 次）
+**网络**: {NETWORKS[network]['name']}
+
+## 已广播的全部交易哈希
+
+{hashes}
+
+[在区块浏览器中查看最新交易]({explorer}/tx/{sent['tx_hash']})
+"""
+
+# ==================== 交易预检 ====================
+
+# Solidity内置错误选择器
+ERROR_STRING_SELECTOR = "08c379a0"   # Error(string)
+PANIC_SELECTOR = "4e487b71"          # Panic(uint256)
+
+def decode_revert_reason(error: Dict[str, Any], abi: Optional[list] = None) -> str:
+    """解析eth_call/eth_estimateGas返回的回滚原因，支持Error(string)、Panic和ABI中的自定义错误"""
+    message = error.get("message") or "execution reverted"
+    data = error.get("data")
+    if isinstance(data, dict):
+        data = data.get("data")
+    if not isinstance(data, str) or len(data) < 10:
+        return message
+    
+    selector, payload = data[2:10], bytes.fromhex(data[10:])
+    try:
+        if selector == ERROR_STRING_SELECTOR:
+            return abi_decode(["string"], payload)[0]
+        if selector == PANIC_SELECTOR:
+            return f"Panic(0x{abi_decode(['uint256'], payload)[0]:x})"
+        for item in abi or []:
+            if item.get("type") != "error":
+                continue
+            types = [arg["type"] for arg in item.get("inputs", [])]
+            if Web3.keccak(text=f"{item['name']}({','.join(types)})")[:4].hex().removeprefix("0x") == selector:
+                values = abi_decode(types, payload) if types else ()
+                return f"{item['name']}({', '.join(str(value) for value in values)})"
+    except Exception as decode_error:
+        logger.debug(f"回滚原因解析失败: {decode_error}")
+    return message
+
+def min_gas_price(network: str) -> int:
+    """Gas价格下限：L1为2 Gwei；L2的Gas价格通常远低于1 Gwei，使用2 Gwei下限会多付上千倍费用"""
+    if NETWORKS[network].get("layer") == 2 or NETWORKS[network].get("type") == "layer2":
+        return Web3.to_wei(0.001, 'gwei')
+    return Web3.to_wei(2, 'gwei')
+
+
+def preflight_transaction(network: str, tx: Dict[str, Any], abi: Optional[list] = None,
+                          gas_price_multiplier: float = 1.0, default_gas: int = 3000000,
+                          extra_calls: Optional[Dict[str, Tuple[str, list]]] = None) -> Dict[str, Any]:
+    """交易预检：一次JSON-RPC批量请求完成模拟执行、Gas估算、余额、Gas价格和nonce查询
+    
+    Args:
+        network: 网络名称
+        tx: 待发送的交易（from、to、data、value），不含gas相关字段
+        abi: 合约ABI，用于解析自定义错误
+        gas_price_multiplier: Gas价格倍数（与实际发送时一致），结果不超过当前线程的gas_price_cap
+        default_gas: Gas估算失败时的默认Gas限制
+        extra_calls: 附带在同一批请求中的其他调用，结果按名称放入返回值的extra字段
+    
+    Returns:
+        包含revert_reason、gas_estimate、gas_limit、gas_price、balance、required、sufficient、nonce、extra的字典
+    """
+    call_object = {key: value for key, value in tx.items() if value is not None}
+    sender = call_object["from"]
+    extra_names = list(extra_calls or {})
+    calls = [
+        ("eth_call", [call_object, "pending"]),
+        ("eth_estimateGas", [call_object]),
+        ("eth_getBalance", [sender, "pending"]),
+        ("eth_gasPrice", []),
+        ("eth_getTransactionCount", [sender, "pending"]),
+    ] + [extra_calls[name] for name in extra_names]
+    
+    responses = rpc_batch(NETWORKS[network]["rpc_url"], calls)
+    call_response, estimate_response, balance_response, gas_price_response, nonce_response = responses[:5]
+    for response in (balance_response, gas_price_response, nonce_response):
+        if "error" in response:
+            raise ConnectionError(f"RPC错误: {response['error'].get('message')}")
+    
+    revert_reason = None
+    if "error" in call_response:
+        revert_reason = decode_revert_reason(call_response["error"], abi)
+    elif "error" in estimate_response:
+        revert_reason = decode_revert_reason(estimate_response["error"], abi)
+    
+    gas_estimate = int(estimate_response["result"], 16) if "result" in estimate_response else None
+    gas_limit = int(gas_estimate * 1.2) if gas_estimate else default_gas
+    gas_price = max(min_gas_price(network), int(int(gas_price_response["result"], 16) * gas_price_multiplier))
+    cap = current_gas_price_cap()
+    if cap is not None:
+        gas_price = min(gas_price, cap)
+    balance = int(balance_response["result"], 16)
+    required = gas_limit * gas_price + int(call_object.get("value", "0x0"), 16)
+    
+    return {
+        "revert_reason": revert_reason,
+        "gas_estimate": gas_estimate,
+        "gas_limit": gas_limit,
+        "gas_price": gas_price,
+        "balance": balance,
+        "required": required,
+        "sufficient": balance >= required,
+        "nonce": int(nonce_response["result"], 16),
+        "extra": dict(zip(extra_names, responses[5:])),
+    }
+
+# 代币元数据缓存（decimals/name/symbol部署后不可变）: (network, contract_address) -> metadata
+_token_metadata_cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+def decode_symbol(return_data: bytes) -> str:
+    """解析symbol()，兼容返回bytes32的旧代币"""
+    try:
+        return abi_decode(["string"], return_data)[0]
+    except Exception:
+        return return_data[:32].rstrip(b"\x00").decode("utf-8", errors="replace")
+
+def get_tokens_metadata(network: str, contract_addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+    """一次批量RPC读取多个ERC20的decimals、name、symbol，结果按网络和合约缓存"""
+    missing = [address for address in dict.fromkeys(contract_addresses)
+               if (network, address) not in _token_metadata_cache]
+    fetched: Dict[str, Dict[str, Any]] = {}
+    if missing:
+        fields = [("decimals", "0x313ce567", lambda data: abi_decode(["uint8"], data)[0], 18),
+                  ("name", "0x06fdde03", lambda data: abi_decode(["string"], data)[0], "Unknown Token"),
+                  ("symbol", "0x95d89b41", decode_symbol, "UNK")]
+        responses = rpc_batch(
+            NETWORKS[network]["rpc_url"],
+            [("eth_call", [{"to": address, "data": selector}, "latest"])
+             for address in missing for _, selector, _, _ in fields],
+        )
+        for index, address in enumerate(missing):
+            metadata = {}
+            complete = True
+            for (field, _, decode, default), response in zip(fields, responses[index * len(fields):]):
+                try:
+                    return_data = bytes.fromhex(response["result"][2:])
+                    if not return_data:
+                        raise ValueError("empty return data")
+                    metadata[field] = decode(return_data)
+                except Exception:
+                    metadata[field] = default
+                    complete = False
+            # 读取失败时不缓存，避免把默认值长期保留
+            if complete:
+                _token_metadata_cache[(network, address)] = metadata
+            fetched[address] = metadata
+    return {address: fetched.get(address) or _token_metadata_cache[(network, address)] for address in contract_addresses}
+
+def get_token_metadata(network: str, contract_address: str) -> Dict[str, Any]:
+    """读取单个ERC20的decimals、name、symbol（与get_tokens_metadata共用缓存）"""
+    return get_tokens_metadata(network, [contract_address])[contract_address]
+
 # 创建FastMCP实例
 mcp = FastMCP("web3-ethereum-tools")
 
@@ -269,7 +1256,7 @@ def get_eth_balance(address: str, network: str = "mainnet") -> str:
     
     Args:
         address: 以太坊地址（0x开头的42位十六进制字符串）
-        network: 网络名称，支持：mainnet, sepolia, goerli, polygon, arbitrum, optimism
+        network: 网络名称，支持：mainnet, sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia, polygon, arbitrum, optimism
     """
     try:
         if not is_address(address):
@@ -289,9 +1276,7 @@ def get_eth_balance(address: str, network: str = "mainnet") -> str:
             "id": 1
         }
         
-        response = requests.post(rpc_url, json=payload, timeout=30)
-        response.raise_for_status()
-        data = response.json()
+        data = rpc_post(rpc_url, payload)
         
         if "error" in data:
             return f"❌ RPC错误: {data['error']['message']}"
@@ -318,35 +1303,49 @@ def get_gas_price(network: str = "mainnet") -> str:
     """查询当前网络的Gas价格
     
     Args:
-        network: 网络名称，支持：mainnet, sepolia, goerli, polygon, arbitrum, optimism
+        network: 网络名称，支持：mainnet, sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia, polygon, arbitrum, optimism
     """
     try:
         if network not in NETWORKS:
             return f"❌ 不支持的网络: {network}。支持的网络: {', '.join(NETWORKS.keys())}"
-            
-        rpc_url = NETWORKS[network]["rpc_url"]
-        
-        payload = {
-            "jsonrpc": "2.0",
-            "method": "eth_gasPrice",
-            "params": [],
-            "id": 1
-        }
         
-        response = requests.post(rpc_url, json=payload, timeout=30)
-        response.raise_for_status()
-        data = response.json()
+        subscription = get_head_subscription(network)
+        head_fresh = subscription is not None and subscription.is_fresh()
         
-        if "error" in data:
-            return f"❌ RPC错误: {data['error']['message']}"
+        # 同一区块内重复查询直接使用内存中的Gas价格
+        if head_fresh and subscription.gas_price is not None and subscription.gas_price_block == subscription.block_number:
+            gas_price_wei = hex(subscription.gas_price)
+            source = "内存缓存（newHeads推送，同一区块）"
+        else:
+            rpc_url = NETWORKS[network]["rpc_url"]
+            
+            payload = {
+                "jsonrpc": "2.0",
+                "method": "eth_gasPrice",
+                "params": [],
+                "id": 1
+            }
+            
+            data = rpc_post(rpc_url, payload)
             
-        gas_price_wei = data.get("result")
+            if "error" in data:
+                return f"❌ RPC错误: {data['error']['message']}"
+            
+            gas_price_wei = data.get("result")
+            source = "HTTP RPC查询"
+            if head_fresh:
+                subscription.remember_gas_price(int(gas_price_wei, 16))
+        
         gas_price_gwei = int(gas_price_wei, 16) / 10**9
+        base_fee_line = ""
+        if head_fresh and subscription.base_fee is not None:
+            base_fee_line = f"**基础费用**: {round(subscription.base_fee / 10**9, 2)} Gwei（区块 {subscription.block_number:,}）\n"
         
         result = f"""# Gas价格查询结果
 
 **网络**: {NETWORKS[network]['name']}
 **Gas价格**: {round(gas_price_gwei, 2)} Gwei ({gas_price_wei} wei)
+{base_fee_line}**数据来源**: {source}
 **查询时间**: {datetime.now().isoformat()}
 """
         return result
@@ -359,35 +1358,40 @@ def get_block_number(network: str = "mainnet") -> str:
     """查询最新区块号
     
     Args:
-        network: 网络名称，支持：mainnet, sepolia, goerli, polygon, arbitrum, optimism
+        network: 网络名称，支持：mainnet, sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia, polygon, arbitrum, optimism
     """
     try:
         if network not in NETWORKS:
             return f"❌ 不支持的网络: {network}。支持的网络: {', '.join(NETWORKS.keys())}"
-            
-        rpc_url = NETWORKS[network]["rpc_url"]
-        
-        payload = {
-            "jsonrpc": "2.0",
-            "method": "eth_blockNumber",
-            "params": [],
-            "id": 1
-        }
-        
-        response = requests.post(rpc_url, json=payload, timeout=30)
-        response.raise_for_status()
-        data = response.json()
         
-        if "error" in data:
-            return f"❌ RPC错误: {data['error']['message']}"
+        subscription = get_head_subscription(network)
+        if subscription is not None and subscription.is_fresh():
+            block_number = subscription.block_number
+            source = "内存缓存（newHeads推送）"
+        else:
+            rpc_url = NETWORKS[network]["rpc_url"]
+            
+            payload = {
+                "jsonrpc": "2.0",
+                "method": "eth_blockNumber",
+                "params": [],
+                "id": 1
+            }
+            
+            data = rpc_post(rpc_url, payload)
             
-        block_number_hex = data.get("result")
-        block_number = int(block_number_hex, 16)
+            if "error" in data:
+                return f"❌ RPC错误: {data['error']['message']}"
+            
+            block_number_hex = data.get("result")
+            block_number = int(block_number_hex, 16)
+            source = "HTTP RPC查询"
         
         result = f"""# 最新区块查询结果
 
 **网络**: {NETWORKS[network]['name']}
 **区块号**: {block_number:,} (0x{block_number:x})
+**数据来源**: {source}
 **查询时间**: {datetime.now().isoformat()}
 
 [在区块浏览器中查看]({NETWORKS[network]['explorer']}/block/{block_number})
@@ -428,66 +1432,325 @@ def get_network_info() -> str:
     except Exception as e:
         return f"❌ 查询失败: {str(e)}"
 
-# ==================== ERC20合约部署和管理工具 ====================
-
 @mcp.tool()
-def deploy_erc20_contract(name: str, symbol: str, total_supply: int, network: str = "sepolia") -> str:
-    """在测试网络上部署新的ERC20合约（集成完整编译和部署流程）
-    
-    Args:
-        name: 代币名称 (例如: "My Token")
-        symbol: 代币符号 (例如: "MTK")
-        total_supply: 代币总供应量 (例如: 1000000)
-        network: 网络名称，支持: sepolia, goerli
-    """
+def get_rpc_limiter_stats() -> str:
+    """获取各RPC端点的限流器状态：当前速率、排队深度、429次数等指标"""
     try:
-        if not WALLET_PRIVATE_KEY:
-            return "❌ 缺少WALLET_PRIVATE_KEY环境变量，请在.env文件中设置"
+        with _rate_limiters_lock:
+            limiters = list(_rate_limiters.values())
         
-        if network not in TESTNETWORKS:
-            return f"❌ 不支持的测试网络: {network}。支持的测试网络: {', '.join(TESTNETWORKS.keys())}"
-        
-        logger.info(f"开始部署ERC20合约: {name} ({symbol})，总供应量: {total_supply}")
+        if not limiters:
+            return "# RPC限流器状态\n\n暂无RPC请求记录"
         
-        # 第一步：尝试动态编译合约
-        logger.info("步骤1/4: 尝试动态编译ERC20合约...")
-        compiled_bytecode, compiled_abi = compile_erc20_contract()
+        rows = []
+        for limiter in limiters:
+            stats = limiter.stats()
+            rows.append(
+                f"| `{stats['endpoint'][:60]}` | {stats['rate']:.2f} / {stats['max_rate']:.2f} | "
+                f"{stats['queue_depth']} | {stats['max_queue_depth']} | {stats['total_requests']:,} | "
+                f"{stats['throttled_count']:,} | {stats['avg_wait_ms']:.1f} |"
+            )
         
-        # 选择使用哪个字节码和ABI
-        if compiled_bytecode and compiled_abi:
-            logger.info("✅ 使用动态编译的合约字节码")
-            use_bytecode = compiled_bytecode
-            use_abi = compiled_abi
-            compilation_method = "动态编译"
-        else:
-            logger.info("⚠️ 动态编译失败，使用预编译的字节码")
-            use_bytecode = ERC20_BYTECODE
-            use_abi = ERC20_ABI
-            compilation_method = "预编译字节码"
+        result = f"""# RPC限流器状态
+
+| 端点 | 速率 (当前/上限 req/s) | 排队深度 | 最大排队 | 请求总数 | 限流次数 | 平均等待 (ms) |
+|------|------|------|------|------|------|------|
+{chr(10).join(rows)}
+
+**查询时间**: {datetime.now().isoformat()}
+"""
+        return result
+        
+    except Exception as e:
+        return f"❌ 查询失败: {str(e)}"
+
+@mcp.tool()
+def get_chain_head_status() -> str:
+    """获取各网络newHeads订阅状态：最新区块、基础费用以及待确认交易的确认数"""
+    try:
+        if not HAS_WEBSOCKETS:
+            return "❌ 未安装websockets，链上状态订阅不可用。请运行: pip install websockets"
+        
+        with _head_subscriptions_lock:
+            subscriptions = list(_head_subscriptions.values())
+        
+        if not subscriptions:
+            return "# 链上状态订阅\n\n暂无已启动的订阅（首次访问网络时自动启动）"
+        
+        sections = []
+        for subscription in subscriptions:
+            with subscription.condition:
+                pending = dict(subscription.pending)
+            status = "✅ 已连接" if subscription.is_fresh() else "⚠️ 未连接或数据过期"
+            base_fee = f"{subscription.base_fee / 10**9:.2f} Gwei" if subscription.base_fee is not None else "-"
+            block = f"{subscription.block_number:,}" if subscription.block_number is not None else "-"
+            lines = [
+                f"## {NETWORKS[subscription.network]['name']} ({subscription.network})",
+                f"- 状态: {status}",
+                f"- 最新区块: {block}",
+                f"- 基础费用: {base_fee}",
+                f"- 已接收区块头: {subscription.heads_received:,}",
+            ]
+            if pending:
+                lines.append("")
+                lines.append("| 交易哈希 | 状态 | 确认数 |")
+                lines.append("|------|------|------|")
+                for tx_hash, item in pending.items():
+                    if item["receipt_block"] is None:
+                        tx_status = "⏳ 待打包"
+                    else:
+                        tx_status = "✅ 成功" if item["status"] == 1 else "❌ 失败"
+                    lines.append(f"| `{tx_hash}` | {tx_status} | {subscription.confirmations(tx_hash)} |")
+            sections.append("\n".join(lines))
+        
+        result = f"""# 链上状态订阅
+
+{chr(10).join(sections)}
+
+**查询时间**: {datetime.now().isoformat()}
+"""
+        return result
+        
+    except Exception as e:
+        return f"❌ 查询失败: {str(e)}"
+
+# ==================== 部署网络选择 ====================
+
+# 排名时用于估算部署费用的参考Gas（ERC20模板部署约需此量级）
+REFERENCE_DEPLOY_GAS = int(os.getenv('REFERENCE_DEPLOY_GAS', '900000'))
+# OP Stack链L1数据费估算使用的交易字节数
+REFERENCE_DEPLOY_BYTES = int(os.getenv('REFERENCE_DEPLOY_BYTES', '4500'))
+# 估算出块时间回溯的区块数
+BLOCK_TIME_SAMPLE = 20
+# 网络排名缓存秒数
+NETWORK_RANKING_TTL = float(os.getenv('NETWORK_RANKING_TTL', '60'))
+# OP Stack GasPriceOracle预部署合约
+OP_GAS_PRICE_ORACLE = "0x420000000000000000000000000000000000000F"
+GET_L1_FEE_UPPER_BOUND_SELECTOR = "0xf1c7a58b"
+
+_network_ranking: Dict[str, Any] = {"ranked_at": 0.0, "results": []}
+_network_ranking_lock = threading.Lock()
+
+
+def probe_network(network: str, deployer: Optional[str] = None) -> Dict[str, Any]:
+    """测量单个网络的当前部署费用、近期出块时间和端点健康度，指定deployer时同时查询其余额"""
+    config = NETWORKS[network]
+    result: Dict[str, Any] = {"network": network, "healthy": False, "balance": None}
+    try:
+        calls = [("eth_gasPrice", []), ("eth_getBlockByNumber", ["latest", False])]
+        l1_fee_index = balance_index = None
+        if config.get("op_stack"):
+            l1_fee_index = len(calls)
+            calls.append(("eth_call", [{
+                "to": OP_GAS_PRICE_ORACLE,
+                "data": GET_L1_FEE_UPPER_BOUND_SELECTOR + abi_encode(["uint256"], [REFERENCE_DEPLOY_BYTES]).hex(),
+            }, "latest"]))
+        if deployer:
+            balance_index = len(calls)
+            calls.append(("eth_getBalance", [deployer, "latest"]))
+        started = time.perf_counter()
+        responses = rpc_batch(config["rpc_url"], calls, timeout=10)
+        result["latency_ms"] = (time.perf_counter() - started) * 1000
+        gas_price_response, block_response = responses[:2]
+        if "error" in gas_price_response or "error" in block_response:
+            result["error"] = (gas_price_response.get("error") or block_response.get("error")).get("message")
+            return result
+        
+        latest_block = block_response["result"]
+        latest_number = int(latest_block["number"], 16)
+        latest_timestamp = int(latest_block["timestamp"], 16)
+        gas_price = max(min_gas_price(network), int(gas_price_response["result"], 16))
+        l1_fee = 0
+        if l1_fee_index is not None and "result" in responses[l1_fee_index]:
+            l1_fee = int(responses[l1_fee_index]["result"], 16)
+        if balance_index is not None and "result" in responses[balance_index]:
+            result["balance"] = int(responses[balance_index]["result"], 16)
+        
+        older = rpc_batch(config["rpc_url"], [
+            ("eth_getBlockByNumber", [hex(max(0, latest_number - BLOCK_TIME_SAMPLE)), False])
+        ], timeout=10)[0]
+        block_time = None
+        if "result" in older and older["result"]:
+            older_number = int(older["result"]["number"], 16)
+            if latest_number > older_number:
+                block_time = (latest_timestamp - int(older["result"]["timestamp"], 16)) / (latest_number - older_number)
+        
+        limiter = get_rate_limiter(config["rpc_url"]).stats()
+        head_age = time.time() - latest_timestamp
+        result.update({
+            "gas_price": gas_price,
+            "l1_fee": l1_fee,
+            "deploy_cost": gas_price * REFERENCE_DEPLOY_GAS + l1_fee,
+            "block_time": block_time,
+            "head_age": head_age,
+            "throttled": limiter["throttled_count"],
+            # 最新区块落后过多说明端点不同步
+            "healthy": head_age < HEAD_STALE_SECONDS * 5,
+        })
+        if not result["healthy"]:
+            result["error"] = f"最新区块已落后 {head_age:.0f} 秒"
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def rank_networks(candidates: Optional[List[str]] = None, force: bool = False) -> List[Dict[str, Any]]:
+    """并发探测候选测试网络并按综合得分排序（得分越低越好）
+    
+    得分 = 费用/最低费用 + 0.5 * 出块时间/最短出块时间 + 0.25 * 延迟/最低延迟，被限流过的端点额外加分。
+    配置了钱包时同时查询部署钱包余额，余额不足预估部署费用的网络（funded为False）排在所有可部署网络之后。
+    """
+    candidates = candidates or list(TESTNETWORKS)
+    with _network_ranking_lock:
+        cached = _network_ranking
+        if (not force and time.time() - cached["ranked_at"] < NETWORK_RANKING_TTL
+                and {item["network"] for item in cached["results"]} == set(candidates)):
+            return cached["results"]
+    
+    deployer = Web3().eth.account.from_key(get_private_key()).address if WALLET_PRIVATE_KEY else None
+    with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+        probes = list(executor.map(lambda network: probe_network(network, deployer), candidates))
+    
+    healthy = [probe for probe in probes if probe["healthy"]]
+    for probe in healthy:
+        # 未配置钱包或余额查询失败时不据此排除网络
+        probe["funded"] = probe["balance"] is None or probe["balance"] >= probe["deploy_cost"]
+    if healthy:
+        min_cost = max(1, min(probe["deploy_cost"] for probe in healthy))
+        block_times = [probe["block_time"] for probe in healthy if probe["block_time"]]
+        min_block_time = min(block_times) if block_times else 1.0
+        min_latency = max(1.0, min(probe["latency_ms"] for probe in healthy))
+        for probe in healthy:
+            probe["score"] = (
+                probe["deploy_cost"] / min_cost
+                + 0.5 * (probe["block_time"] or min_block_time * 10) / min_block_time
+                + 0.25 * probe["latency_ms"] / min_latency
+                + (1.0 if probe["throttled"] else 0.0)
+            )
+    ranked = (sorted(healthy, key=lambda probe: (not probe["funded"], probe["score"]))
+              + [probe for probe in probes if not probe["healthy"]])
+    
+    with _network_ranking_lock:
+        _network_ranking.update({"ranked_at": time.time(), "results": ranked})
+    return ranked
+
+
+def select_deployment_network(network: str, deploy_count: int = 1) -> str:
+    """解析部署网络参数：auto时选择排名最高、且部署钱包余额足够部署deploy_count个合约的健康测试网络"""
+    if network != "auto":
+        return network
+    ranked = rank_networks()
+    if not ranked or not ranked[0]["healthy"]:
+        raise ConnectionError("没有可用的测试网络（所有端点探测失败）")
+    funded = [probe for probe in ranked if probe["healthy"] and
+              (probe["balance"] is None or probe["balance"] >= probe["deploy_cost"] * deploy_count)]
+    if not funded:
+        raise ValueError("所有可用测试网络上的部署钱包余额都不足预估部署费用，请先领取测试币")
+    selected = funded[0]["network"]
+    logger.info(f"自动选择部署网络: {selected}")
+    return selected
+
+
+@mcp.tool()
+def rank_deployment_networks() -> str:
+    """按当前部署费用、近期出块时间和端点健康度对可部署的测试网络排名（deploy_erc20_contract 的 network="auto" 使用排名第一的网络）"""
+    try:
+        if not TESTNETWORKS:
+            return "❌ 没有配置可部署的测试网络"
+        
+        ranked = rank_networks(force=True)
+        rows = []
+        for index, probe in enumerate(ranked, 1):
+            name = TESTNETWORKS[probe["network"]]["name"]
+            if not probe["healthy"]:
+                rows.append(f"| - | {name} | - | - | - | - | - | ❌ {probe.get('error', '不可用')} |")
+                continue
+            block_time = f"{probe['block_time']:.2f} 秒" if probe["block_time"] else "-"
+            balance = f"{Web3.from_wei(probe['balance'], 'ether'):.6f} ETH" if probe["balance"] is not None else "-"
+            status = f"✅ 得分 {probe['score']:.2f}" if probe["funded"] else f"⚠️ 余额不足（得分 {probe['score']:.2f}）"
+            rows.append(
+                f"| {index} | {name} | {Web3.from_wei(probe['gas_price'], 'gwei'):.4f} Gwei | "
+                f"{Web3.from_wei(probe['deploy_cost'], 'ether'):.8f} ETH | {balance} | {block_time} | "
+                f"{probe['latency_ms']:.0f} ms | {status} |"
+            )
+        
+        return f"""# 部署网络排名
+
+| 排名 | 网络 | Gas价格 | 预估部署费用 | 钱包余额 | 平均出块时间 | RPC延迟 | 状态 |
+|------|------|------|------|------|------|------|------|
+{chr(10).join(rows)}
+
+**预估部署费用**: 按 {REFERENCE_DEPLOY_GAS:,} Gas计算，OP Stack网络包含L1数据费
+**排名方法**: 费用为主，出块时间和RPC延迟为辅，被限流过的端点降权，钱包余额不足部署费用的网络排在最后（auto不会选择）
+**查询时间**: {datetime.now().isoformat()}
+"""
+        
+    except Exception as e:
+        return f"❌ 网络排名失败: {str(e)}"
+
+# ==================== ERC20合约部署和管理工具 ====================
+
+@mcp.tool()
+def deploy_erc20_contract(name: str, symbol: str, total_supply: int, network: str = "auto",
+                          template: str = DEFAULT_ERC20_TEMPLATE, document_hashes: Optional[list] = None,
+                          max_fee_gwei: Optional[float] = None, deadline_minutes: Optional[float] = None,
+                          confirmation_deadline_seconds: float = CONFIRMATION_DEADLINE_SECONDS) -> str:
+    """在测试网络上部署新的ERC20合约（集成完整编译和部署流程）
+    
+    Args:
+        name: 代币名称 (例如: "My Token")
+        symbol: 代币符号 (例如: "MTK")
+        total_supply: 代币总供应量 (例如: 1000000)
+        network: 网络名称，支持: auto（默认，按费用、出块时间和端点健康度自动选择）, sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia
+        template: 合约模板，支持: standard（默认）, standard_optimizer, lean, optimized（支持batchTransfer）
+        document_hashes: 资产相关文档的SHA-256列表，部署成功后登记到文档指纹库
+        max_fee_gwei: 可选，Gas价格高于该值时延迟部署，直到Gas价格达标
+        deadline_minutes: 可选，延迟部署的最长等待分钟数；只指定截止时间时在Gas低于近期低分位数时部署
+        confirmation_deadline_seconds: 确认截止时间（秒），期间未按时打包会自动加价替换
+    """
+    try:
+        if not WALLET_PRIVATE_KEY:
+            return "❌ 缺少WALLET_PRIVATE_KEY环境变量，请在.env文件中设置"
+        
+        network = select_deployment_network(network)
+        if network not in TESTNETWORKS:
+            return f"❌ 不支持的测试网络: {network}。支持的测试网络: auto, {', '.join(TESTNETWORKS.keys())}"
+        
+        if template not in ERC20_TEMPLATES:
+            return f"❌ 不支持的合约模板: {template}。可选模板: {', '.join(ERC20_TEMPLATES.keys())}"
+        
+        fingerprints = normalize_document_hashes(document_hashes or [])
+        if fingerprints is None:
+            return "❌ 文档哈希无效，需要64位十六进制SHA-256"
+        
+        if max_fee_gwei is not None or deadline_minutes is not None:
+            scheduled = schedule_if_expensive(
+                "deploy_erc20_contract", network,
+                {"name": name, "symbol": symbol, "total_supply": total_supply, "network": network,
+                 "template": template, "document_hashes": fingerprints,
+                 "confirmation_deadline_seconds": confirmation_deadline_seconds},
+                max_fee_gwei, deadline_minutes,
+            )
+            if scheduled:
+                return scheduled
+        
+        logger.info(f"开始部署ERC20合约: {name} ({symbol})，总供应量: {total_supply}")
+        
+        # 第一步：获取合约字节码（动态编译结果会被缓存）
+        logger.info("步骤1/4: 准备ERC20合约字节码...")
+        use_bytecode, use_abi, compilation_method = get_erc20_artifacts(template)
         
         # 第二步：连接Web3
         logger.info("步骤2/4: 连接到区块链网络...")
         w3 = get_web3_instance(network)
         
         # 准备账户
-        if WALLET_PRIVATE_KEY.startswith('0x'):
-            private_key = WALLET_PRIVATE_KEY
-        else:
-            private_key = '0x' + WALLET_PRIVATE_KEY
-        
+        private_key = get_private_key()
         account = w3.eth.account.from_key(private_key)
         logger.info(f"使用部署账户: {account.address}")
         
-        # 检查余额
-        balance = w3.eth.get_balance(account.address)
-        balance_eth = w3.from_wei(balance, 'ether')
-        logger.info(f"账户余额: {balance_eth:.6f} ETH")
-        
-        if balance_eth < 0.01:  # 需要至少0.01 ETH来部署合约
-            return f"❌ 账户余额不足。当前余额: {balance_eth:.6f} ETH，建议至少0.01 ETH"
-        
-        # 第三步：准备部署交易
-        logger.info("步骤3/4: 准备部署交易...")
+        # 第三步：准备部署交易并预检
+        logger.info("步骤3/4: 准备部署交易并预检...")
         
         # 创建合约实例
         contract = w3.eth.contract(abi=use_abi, bytecode=use_bytecode)
@@ -495,48 +1758,56 @@ def deploy_erc20_contract(name: str, symbol: str, total_supply: int, network: st
         # 构建构造函数参数
         constructor_args = (name, symbol, total_supply)
         logger.info(f"合约构造参数: 名称={name}, 符号={symbol}, 总供应量={total_supply}")
+        constructor = contract.constructor(*constructor_args)
         
-        # 估算gas费用
-        try:
-            estimated_gas = contract.constructor(*constructor_args).estimate_gas({
-                'from': account.address
-            })
-            gas_limit = int(estimated_gas * 1.2)
-            logger.info(f"预估Gas: {estimated_gas:,}，设置Gas限制: {gas_limit:,}")
-        except Exception as gas_error:
-            logger.warning(f"Gas估算失败: {gas_error}，使用默认值")
-            gas_limit = 3000000
-        
-        # 构建交易
-        gas_price = max(w3.to_wei('2', 'gwei'), w3.eth.gas_price * 2)
-        transaction = contract.constructor(*constructor_args).build_transaction({
+        # 一次批量RPC完成模拟部署、Gas估算、余额和nonce查询
+        preflight = preflight_transaction(
+            network,
+            {'from': account.address, 'data': constructor.data_in_transaction},
+            abi=use_abi,
+            gas_price_multiplier=2,
+        )
+        if preflight["revert_reason"]:
+            return f"❌ 部署预检失败，交易模拟回滚: {preflight['revert_reason']}"
+        
+        gas_limit = preflight["gas_limit"]
+        gas_price = preflight["gas_price"]
+        logger.info(f"预估Gas: {preflight['gas_estimate']}，设置Gas限制: {gas_limit:,}")
+        logger.info(f"账户余额: {w3.from_wei(preflight['balance'], 'ether'):.6f} ETH")
+        
+        if not preflight["sufficient"]:
+            return (f"❌ 账户余额不足。当前余额: {w3.from_wei(preflight['balance'], 'ether'):.6f} ETH，"
+                    f"部署最多需要: {w3.from_wei(preflight['required'], 'ether'):.6f} ETH")
+        
+        # 构建交易（gas、价格和nonce均来自预检结果，不再额外请求）
+        transaction = constructor.build_transaction({
             'chainId': TESTNETWORKS[network]["chain_id"],
             'gas': gas_limit,
             'gasPrice': gas_price,
-            'nonce': w3.eth.get_transaction_count(account.address),
+            'nonce': preflight["nonce"],
             'from': account.address
         })
         
-        # 第四步：签名、发送并等待确认
+        # 第四步：签名、发送并等待确认（未按时打包时自动加价替换）
         logger.info("步骤4/4: 发送交易并等待确认...")
-        
-        # 签名并发送交易
-        signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        
-        logger.info(f"交易已发送: {tx_hash.hex()}")
-        
-        # 等待交易确认
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=300)
+        sent = send_transaction_with_deadline(w3, network, transaction, private_key, confirmation_deadline_seconds)
+        tx_hash = sent["tx_hash"]
+        tx_receipt = sent["receipt"]
+        if tx_receipt is None:
+            return format_pending_transaction(sent, network)
         
         if tx_receipt.status == 1:
             contract_address = tx_receipt.contractAddress
             logger.info(f"✅ 合约部署成功！地址: {contract_address}")
             
             # 计算实际费用
-            actual_fee = tx_receipt.gasUsed * gas_price
+            actual_fee = receipt_fee(tx_receipt, sent["gas_price"])
             actual_fee_eth = w3.from_wei(actual_fee, 'ether')
             
+            registered = register_document_fingerprints(
+                fingerprints, contract_address, tx_hash, network, asset_id=symbol
+            )
+            
             result = f"""# ERC20合约部署成功 ✅
 
 **合约地址**: `{contract_address}`
@@ -546,13 +1817,14 @@ def deploy_erc20_contract(name: str, symbol: str, total_supply: int, network: st
 **编译方式**: {compilation_method}
 **网络**: {TESTNETWORKS[network]['name']}
 **部署者**: `{account.address}`
-**交易哈希**: `{tx_hash.hex()}`
+**交易哈希**: `{tx_hash}`
 **Gas 使用**: {tx_receipt.gasUsed:,} / {gas_limit:,}
-**部署费用**: {actual_fee_eth:.6f} ETH
+**部署费用**: {actual_fee_eth:.6f} ETH{f"（加价替换 {sent['replacements']} 次）" if sent['replacements'] else ""}
+**登记文档指纹**: {registered} 个
 **部署时间**: {datetime.now().isoformat()}
 
 [在区块浏览器中查看合约]({TESTNETWORKS[network]['explorer']}/address/{contract_address})
-[在区块浏览器中查看交易]({TESTNETWORKS[network]['explorer']}/tx/{tx_hash.hex()})
+[在区块浏览器中查看交易]({TESTNETWORKS[network]['explorer']}/tx/{tx_hash})
 
 **注意**: 请保存合约地址以便后续使用！
 """
@@ -565,6 +1837,190 @@ def deploy_erc20_contract(name: str, symbol: str, total_supply: int, network: st
         logger.error(f"部署过程中发生错误: {str(e)}")
         return f"❌ 部署失败: {str(e)}"
 
+@mcp.tool()
+def deploy_erc20_batch(specs: list, network: str = "auto", template: str = DEFAULT_ERC20_TEMPLATE,
+                       max_fee_gwei: Optional[float] = None, deadline_minutes: Optional[float] = None) -> str:
+    """在测试网络上批量部署多个ERC20合约（一次编译、一次余额检查、连续nonce广播、并发等待确认）
+    
+    适用于组合资产代币化（例如包含多处房产的基金，每个资产一个ERC20代币）。
+    
+    Args:
+        specs: 代币参数列表，每项包含 name、symbol、total_supply，可选 document_hashes（文档SHA-256列表），
+               例如: [{"name": "Property A", "symbol": "PRA", "total_supply": 1000000}]
+        network: 网络名称，支持: auto（默认，自动选择）, sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia
+        template: 合约模板，支持: standard（默认）, standard_optimizer, lean, optimized（支持batchTransfer）
+        max_fee_gwei: 可选，Gas价格高于该值时延迟部署，直到Gas价格达标
+        deadline_minutes: 可选，延迟部署的最长等待分钟数
+    """
+    try:
+        if not WALLET_PRIVATE_KEY:
+            return "❌ 缺少WALLET_PRIVATE_KEY环境变量，请在.env文件中设置"
+        
+        network = select_deployment_network(network, deploy_count=max(1, len(specs)))
+        if network not in TESTNETWORKS:
+            return f"❌ 不支持的测试网络: {network}。支持的测试网络: auto, {', '.join(TESTNETWORKS.keys())}"
+        
+        if template not in ERC20_TEMPLATES:
+            return f"❌ 不支持的合约模板: {template}。可选模板: {', '.join(ERC20_TEMPLATES.keys())}"
+        
+        if not specs:
+            return "❌ 代币参数列表为空"
+        
+        for index, spec in enumerate(specs, 1):
+            if not isinstance(spec, dict) or not all(key in spec for key in ("name", "symbol", "total_supply")):
+                return f"❌ 第{index}项代币参数无效，需要包含 name、symbol、total_supply"
+            if normalize_document_hashes(spec.get("document_hashes") or []) is None:
+                return f"❌ 第{index}项文档哈希无效，需要64位十六进制SHA-256"
+        
+        if max_fee_gwei is not None or deadline_minutes is not None:
+            scheduled = schedule_if_expensive(
+                "deploy_erc20_batch", network, {"specs": specs, "network": network, "template": template},
+                max_fee_gwei, deadline_minutes,
+            )
+            if scheduled:
+                return scheduled
+        
+        logger.info(f"开始批量部署 {len(specs)} 个ERC20合约")
+        
+        # 第一步：只编译一次
+        logger.info("步骤1/4: 准备ERC20合约字节码...")
+        use_bytecode, use_abi, compilation_method = get_erc20_artifacts(template)
+        
+        # 第二步：连接Web3并准备账户
+        logger.info("步骤2/4: 连接到区块链网络...")
+        w3 = get_web3_instance(network)
+        private_key = get_private_key()
+        account = w3.eth.account.from_key(private_key)
+        contract = w3.eth.contract(abi=use_abi, bytecode=use_bytecode)
+        constructors = [
+            contract.constructor(spec["name"], spec["symbol"], int(spec["total_supply"])) for spec in specs
+        ]
+        
+        # 第三步：一次批量RPC完成所有部署的模拟与Gas估算，并用总费用做一次余额检查
+        logger.info("步骤3/4: 预检部署交易并检查余额...")
+        deploy_calls = [{'from': account.address, 'data': constructor.data_in_transaction} for constructor in constructors]
+        preflight = preflight_transaction(
+            network,
+            deploy_calls[0],
+            abi=use_abi,
+            gas_price_multiplier=2,
+            extra_calls={
+                f"estimate_{index}": ("eth_estimateGas", [call]) for index, call in enumerate(deploy_calls[1:], 1)
+            },
+        )
+        if preflight["revert_reason"]:
+            return f"❌ 批量部署预检失败（{specs[0]['symbol']}），交易模拟回滚: {preflight['revert_reason']}"
+        
+        gas_price = preflight["gas_price"]
+        gas_limits = [preflight["gas_limit"]]
+        for index in range(1, len(specs)):
+            response = preflight["extra"][f"estimate_{index}"]
+            if "error" in response:
+                reason = decode_revert_reason(response["error"], use_abi)
+                return f"❌ 批量部署预检失败（{specs[index]['symbol']}），交易模拟回滚: {reason}"
+            gas_limits.append(int(int(response["result"], 16) * 1.2))
+        
+        total_cost = sum(gas_limits) * gas_price
+        balance = preflight["balance"]
+        if balance < total_cost:
+            return (f"❌ 账户余额不足。当前余额: {w3.from_wei(balance, 'ether'):.6f} ETH，"
+                    f"批量部署预计最多需要: {w3.from_wei(total_cost, 'ether'):.6f} ETH")
+        
+        # 第四步：使用连续nonce广播所有部署交易
+        logger.info("步骤4/4: 广播部署交易并并发等待确认...")
+        base_nonce = preflight["nonce"]
+        results = [{"spec": spec, "gas_limit": gas_limit, "transaction": None, "tx_hash": None, "receipt": None,
+                    "gas_price": gas_price, "error": None}
+                   for spec, gas_limit in zip(specs, gas_limits)]
+        
+        for offset, item in enumerate(results):
+            spec = item["spec"]
+            try:
+                transaction = constructors[offset].build_transaction({
+                    'chainId': TESTNETWORKS[network]["chain_id"],
+                    'gas': item["gas_limit"],
+                    'gasPrice': gas_price,
+                    'nonce': base_nonce + offset,
+                    'from': account.address
+                })
+                item["tx_hash"] = sign_and_send(w3, transaction, private_key)
+                item["transaction"] = transaction
+                logger.info(f"交易已发送 ({spec['symbol']}): {item['tx_hash']}")
+            except Exception as send_error:
+                # 后续nonce会出现空缺，停止广播剩余交易
+                item["error"] = f"发送失败: {send_error}"
+                for remaining in results[offset + 1:]:
+                    remaining["error"] = "未发送（前序交易发送失败）"
+                break
+        
+        gas_cap = current_gas_price_cap()
+        
+        def wait_receipt(item):
+            try:
+                confirmed = confirm_with_fee_bumping(w3, network, item["transaction"], private_key, [item["tx_hash"]],
+                                                     max_gas_price=gas_cap)
+                item.update({"tx_hash": confirmed["tx_hash"], "receipt": confirmed["receipt"],
+                             "gas_price": confirmed["gas_price"]})
+                if confirmed["receipt"] is None:
+                    item["pending"] = f"⏳ 截止时间内未打包，仍在等待（已加价替换 {confirmed['replacements']} 次）"
+            except Exception as wait_error:
+                item["error"] = f"等待确认失败: {wait_error}"
+        
+        sent = [item for item in results if item["tx_hash"] is not None]
+        if sent:
+            with ThreadPoolExecutor(max_workers=min(RECEIPT_WAIT_WORKERS, len(sent))) as executor:
+                list(executor.map(wait_receipt, sent))
+        
+        # 汇总结果表格
+        rows = []
+        succeeded = 0
+        total_fee = 0
+        explorer = TESTNETWORKS[network]['explorer']
+        for index, item in enumerate(results, 1):
+            spec = item["spec"]
+            receipt = item["receipt"]
+            tx_link = f"[{item['tx_hash'][:10]}...]({explorer}/tx/{item['tx_hash']})" if item["tx_hash"] else "-"
+            if receipt is not None and receipt.status == 1:
+                succeeded += 1
+                total_fee += receipt_fee(receipt, item["gas_price"])
+                register_document_fingerprints(
+                    normalize_document_hashes(spec.get("document_hashes") or []),
+                    receipt.contractAddress, item["tx_hash"], network, asset_id=spec["symbol"]
+                )
+                address_cell = f"[`{receipt.contractAddress}`]({explorer}/address/{receipt.contractAddress})"
+                status_cell = "✅ 成功"
+                gas_cell = f"{receipt.gasUsed:,}"
+            else:
+                address_cell = "-"
+                if item.get("pending"):
+                    status_cell = item["pending"]
+                else:
+                    status_cell = f"❌ {item['error']}" if item["error"] else f"❌ 交易状态: {receipt.status}"
+                gas_cell = f"{receipt.gasUsed:,}" if receipt is not None else "-"
+            rows.append(f"| {index} | {spec['name']} | {spec['symbol']} | {int(spec['total_supply']):,} | {address_cell} | {tx_link} | {gas_cell} | {status_cell} |")
+        
+        result = f"""# ERC20合约批量部署结果
+
+**成功/总数**: {succeeded} / {len(results)}
+**编译方式**: {compilation_method}
+**网络**: {TESTNETWORKS[network]['name']}
+**部署者**: `{account.address}`
+**Gas价格**: {w3.from_wei(gas_price, 'gwei'):.2f} Gwei
+**总部署费用**: {w3.from_wei(total_fee, 'ether'):.6f} ETH
+**部署时间**: {datetime.now().isoformat()}
+
+| # | 代币名称 | 代币符号 | 总供应量 | 合约地址 | 交易哈希 | Gas 使用 | 状态 |
+|---|------|------|------|------|------|------|------|
+{chr(10).join(rows)}
+
+**注意**: 请保存合约地址以便后续使用！
+"""
+        return result
+        
+    except Exception as e:
+        logger.error(f"批量部署过程中发生错误: {str(e)}")
+        return f"❌ 批量部署失败: {str(e)}"
+
 @mcp.tool()
 def check_erc20_balance(contract_address: str, wallet_address: str, network: str = "sepolia") -> str:
     """查询ERC20代币余额
@@ -572,7 +2028,7 @@ def check_erc20_balance(contract_address: str, wallet_address: str, network: str
     Args:
         contract_address: ERC20合约地址
         wallet_address: 钱包地址
-        network: 网络名称，支持: mainnet, sepolia, goerli, polygon, arbitrum, optimism
+        network: 网络名称，支持: mainnet, sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia, polygon, arbitrum, optimism
     """
     try:
         if not is_address(contract_address):
@@ -632,14 +2088,16 @@ def check_erc20_balance(contract_address: str, wallet_address: str, network: str
         return f"❌ 查询失败: {str(e)}"
 
 @mcp.tool()
-def transfer_erc20_tokens(contract_address: str, to_address: str, amount: float, network: str = "sepolia") -> str:
+def transfer_erc20_tokens(contract_address: str, to_address: str, amount: float, network: str = "sepolia",
+                          confirmation_deadline_seconds: float = CONFIRMATION_DEADLINE_SECONDS) -> str:
     """使用ERC20合约转账代币
     
     Args:
         contract_address: ERC20合约地址
         to_address: 接收者地址
         amount: 转账数量 (代币单位，会自动转换为最小单位)
-        network: 网络名称，支持: sepolia, goerli, mainnet, polygon, arbitrum, optimism
+        network: 网络名称，支持: sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia, mainnet, polygon, arbitrum, optimism
+        confirmation_deadline_seconds: 确认截止时间（秒），期间未按时打包会自动加价替换
     """
     try:
         if not WALLET_PRIVATE_KEY:
@@ -658,62 +2116,68 @@ def transfer_erc20_tokens(contract_address: str, to_address: str, amount: float,
         w3 = get_web3_instance(network)
         
         # 准备账户
-        if WALLET_PRIVATE_KEY.startswith('0x'):
-            private_key = WALLET_PRIVATE_KEY
-        else:
-            private_key = '0x' + WALLET_PRIVATE_KEY
-            
+        private_key = get_private_key()
         account = w3.eth.account.from_key(private_key)
         
         # 创建合约实例
-        contract = w3.eth.contract(
-            address=to_checksum_address(contract_address),
-            abi=ERC20_ABI
-        )
+        contract_address = to_checksum_address(contract_address)
+        contract = w3.eth.contract(address=contract_address, abi=ERC20_ABI)
         
-        # 获取代币信息
-        try:
-            decimals = contract.functions.decimals().call()
-            token_name = contract.functions.name().call()
-            token_symbol = contract.functions.symbol().call()
-        except:
-            decimals = 18
-            token_name = "Unknown Token"
-            token_symbol = "UNK"
+        # 获取代币信息（按合约缓存）
+        metadata = get_token_metadata(network, contract_address)
+        decimals = metadata["decimals"]
+        token_name = metadata["name"]
+        token_symbol = metadata["symbol"]
         
         # 转换为最小单位
         amount_wei = int(amount * (10 ** decimals))
+        transfer_function = contract.functions.transfer(to_checksum_address(to_address), amount_wei)
+        
+        # 一次批量RPC完成转账模拟、Gas估算、代币余额、ETH余额和nonce查询
+        preflight = preflight_transaction(
+            network,
+            {'from': account.address, 'to': contract_address, 'data': transfer_function._encode_transaction_data()},
+            abi=ERC20_ABI,
+            default_gas=100000,
+            extra_calls={
+                "token_balance": ("eth_call", [{
+                    "to": contract_address,
+                    "data": contract.functions.balanceOf(account.address)._encode_transaction_data(),
+                }, "pending"]),
+            },
+        )
         
         # 检查代币余额
-        token_balance = contract.functions.balanceOf(account.address).call()
-        if token_balance < amount_wei:
-            token_balance_readable = token_balance / (10 ** decimals)
-            return f"❌ 代币余额不足。当前余额: {token_balance_readable:.6f} {token_symbol}，尝试转账: {amount} {token_symbol}"
+        token_balance_response = preflight["extra"]["token_balance"]
+        if "result" in token_balance_response:
+            token_balance = int(token_balance_response["result"], 16)
+            if token_balance < amount_wei:
+                token_balance_readable = token_balance / (10 ** decimals)
+                return f"❌ 代币余额不足。当前余额: {token_balance_readable:.6f} {token_symbol}，尝试转账: {amount} {token_symbol}"
+        
+        if preflight["revert_reason"]:
+            return f"❌ 转账预检失败，交易模拟回滚: {preflight['revert_reason']}"
         
         # 检查ETH余额（用于支付gas费）
-        eth_balance = w3.eth.get_balance(account.address)
-        if eth_balance < w3.to_wei('0.001', 'ether'):
-            return f"❌ ETH余额不足支付gas费。当前余额: {w3.from_wei(eth_balance, 'ether'):.6f} ETH"
-        
-        # 构建转账交易
-        transaction = contract.functions.transfer(
-            to_checksum_address(to_address), 
-            amount_wei
-        ).build_transaction({
+        if not preflight["sufficient"]:
+            return (f"❌ ETH余额不足支付gas费。当前余额: {w3.from_wei(preflight['balance'], 'ether'):.6f} ETH，"
+                    f"最多需要: {w3.from_wei(preflight['required'], 'ether'):.6f} ETH")
+        
+        # 构建转账交易（gas、价格和nonce均来自预检结果）
+        transaction = transfer_function.build_transaction({
             'chainId': NETWORKS[network]["chain_id"],
-            'gas': 100000,
-            'gasPrice': max(w3.to_wei('2', 'gwei'), w3.eth.gas_price),
-            'nonce': w3.eth.get_transaction_count(account.address),
+            'gas': preflight["gas_limit"],
+            'gasPrice': preflight["gas_price"],
+            'nonce': preflight["nonce"],
             'from': account.address
         })
         
-        # 签名并发送交易
-        signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        
-        # 等待交易确认
-        logger.info(f"等待转账交易确认: {tx_hash.hex()}")
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=300)
+        # 签名、发送并等待确认（未按时打包时自动加价替换）
+        sent = send_transaction_with_deadline(w3, network, transaction, private_key, confirmation_deadline_seconds)
+        tx_hash = sent["tx_hash"]
+        tx_receipt = sent["receipt"]
+        if tx_receipt is None:
+            return format_pending_transaction(sent, network)
         
         if tx_receipt.status == 1:
             result = f"""# ERC20代币转账成功 ✅
@@ -724,11 +2188,11 @@ def transfer_erc20_tokens(contract_address: str, to_address: str, amount: float,
 **接收者**: `{to_address}`
 **转账数量**: {amount} {token_symbol} ({amount_wei:,} 最小单位)
 **网络**: {NETWORKS[network]['name']}
-**交易哈希**: `{tx_hash.hex()}`
+**交易哈希**: `{tx_hash}`
 **Gas 使用**: {tx_receipt.gasUsed:,}
 **转账时间**: {datetime.now().isoformat()}
 
-[在区块浏览器中查看交易]({NETWORKS[network]['explorer']}/tx/{tx_hash.hex()})
+[在区块浏览器中查看交易]({NETWORKS[network]['explorer']}/tx/{tx_hash})
 """
             return result
         else:
@@ -737,20 +2201,2667 @@ def transfer_erc20_tokens(contract_address: str, to_address: str, amount: float,
     except Exception as e:
         return f"❌ 转账失败: {str(e)}"
 
-# 启动服务器时显示配置信息
-if __name__ == "__main__":
-    if INFURA_API_KEY:
-        logger.info(f"Starting Web3 MCP Server with Infura API (Key: {INFURA_API_KEY[:8]}...)")
-        logger.info(f"Supported networks: {', '.join(NETWORKS.keys())}")
+# ==================== 文档Merkle批量存证 ====================
+
+# 本地登记数据库（存证队列、Merkle证明等），默认位于项目 storage 目录
+REGISTRY_DB_PATH = os.getenv(
+    'REGISTRY_DB_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'storage', 'onchain_registry.db')
+)
+# 队列达到该数量时立即锚定
+NOTARIZATION_BATCH_SIZE = int(os.getenv('NOTARIZATION_BATCH_SIZE', '64'))
+# 最早排队的文档等待超过该秒数时由后台定时器锚定
+NOTARIZATION_MAX_WAIT_SECONDS = float(os.getenv('NOTARIZATION_MAX_WAIT_SECONDS', '3600'))
+# 锚定交易calldata前缀 "RWA1"，其后为32字节Merkle根
+MERKLE_ANCHOR_PREFIX = "0x52574131"
+
+_notarization_lock = threading.Lock()
+_notarization_timer_started = False
+_registry_schema_lock = threading.Lock()
+_registry_schema_ready: Set[str] = set()
+# 早期版本建表后新增的列，打开旧数据库时补齐
+REGISTRY_ADDED_COLUMNS = {
+    "notarization_batches": {"tx_hashes": "TEXT", "nonce": "INTEGER"},
+    "asset_registries": {"status": "TEXT NOT NULL DEFAULT 'deployed'", "tx_hashes": "TEXT", "nonce": "INTEGER"},
+    "distribution_payouts": {"tx_hashes": "TEXT", "nonce": "INTEGER"},
+}
+
+
+def get_registry_connection() -> sqlite3.Connection:
+    """打开本地登记数据库并确保表结构存在"""
+    os.makedirs(os.path.dirname(REGISTRY_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(REGISTRY_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # 表结构每个进程每个数据库文件只建一次，之后的连接直接使用
+    if REGISTRY_DB_PATH in _registry_schema_ready:
+        return conn
+    with _registry_schema_lock:
+        if REGISTRY_DB_PATH not in _registry_schema_ready:
+            create_registry_schema(conn)
+            _registry_schema_ready.add(REGISTRY_DB_PATH)
+    return conn
+
+
+def create_registry_schema(conn: sqlite3.Connection):
+    """创建登记数据库的全部表（已存在则跳过）"""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS notarization_queue (
+            document_hash TEXT PRIMARY KEY,
+            document_name TEXT,
+            asset_id TEXT,
+            network TEXT NOT NULL,
+            queued_at REAL NOT NULL,
+            batch_id INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_notarization_queue_pending ON notarization_queue (batch_id, network, queued_at);
+        CREATE TABLE IF NOT EXISTS notarization_batches (
+            batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            merkle_root TEXT NOT NULL,
+            leaf_count INTEGER NOT NULL,
+            network TEXT NOT NULL,
+            tx_hash TEXT,
+            block_number INTEGER,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            tx_hashes TEXT,
+            nonce INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS notarization_proofs (
+            document_hash TEXT PRIMARY KEY,
+            batch_id INTEGER NOT NULL,
+            leaf_index INTEGER NOT NULL,
+            proof TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS document_fingerprints (
+            document_hash TEXT NOT NULL,
+            contract_address TEXT NOT NULL,
+            tx_hash TEXT NOT NULL,
+            network TEXT NOT NULL,
+            asset_id TEXT,
+            document_name TEXT,
+            registered_at REAL NOT NULL,
+            PRIMARY KEY (document_hash, contract_address, tx_hash)
+        );
+        CREATE INDEX IF NOT EXISTS idx_document_fingerprints_contract ON document_fingerprints (contract_address);
+        CREATE INDEX IF NOT EXISTS idx_document_fingerprints_asset ON document_fingerprints (asset_id);
+        CREATE TABLE IF NOT EXISTS asset_registries (
+            network TEXT PRIMARY KEY,
+            address TEXT NOT NULL,
+            tx_hash TEXT,
+            deployed_at REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'deployed',
+            tx_hashes TEXT,
+            nonce INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS distributions (
+            distribution_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            network TEXT NOT NULL,
+            share_token TEXT NOT NULL,
+            payout_token TEXT NOT NULL,
+            snapshot_block INTEGER NOT NULL,
+            total_amount TEXT NOT NULL,
+            holder_count INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS distribution_payouts (
+            distribution_id INTEGER NOT NULL,
+            holder TEXT NOT NULL,
+            share_balance TEXT NOT NULL,
+            amount TEXT NOT NULL,
+            tx_hash TEXT,
+            status TEXT NOT NULL,
+            tx_hashes TEXT,
+            nonce INTEGER,
+            PRIMARY KEY (distribution_id, holder)
+        );
+        CREATE TABLE IF NOT EXISTS gas_samples (
+            network TEXT NOT NULL,
+            sampled_at INTEGER NOT NULL,
+            base_fee INTEGER,
+            gas_price INTEGER NOT NULL,
+            PRIMARY KEY (network, sampled_at)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS scheduled_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            network TEXT NOT NULL,
+            params TEXT NOT NULL,
+            max_fee INTEGER,
+            deadline REAL,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            executed_at REAL,
+            executed_gas_price INTEGER,
+            result TEXT
+        );
+    """)
+    for table, columns in REGISTRY_ADDED_COLUMNS.items():
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, column_type in columns.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    conn.commit()
+
+
+def normalize_document_hash(value: str) -> Optional[str]:
+    """规范化SHA-256文档哈希为小写0x十六进制，格式无效时返回None"""
+    value = value.strip().lower()
+    if not value.startswith("0x"):
+        value = "0x" + value
+    if len(value) != 66 or any(c not in "0123456789abcdef" for c in value[2:]):
+        return None
+    return value
+
+
+def hash_document_file(path: str) -> str:
+    """分块计算本地文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return "0x" + digest.hexdigest()
+
+
+def merkle_leaf(document_hash: str) -> bytes:
+    return Web3.keccak(hexstr=document_hash)
+
+
+def merkle_parent(left: bytes, right: bytes) -> bytes:
+    # 排序后拼接，与OpenZeppelin MerkleProof.verify兼容
+    return Web3.keccak(min(left, right) + max(left, right))
+
+
+def build_merkle_tree(document_hashes: List[str]) -> Tuple[str, Dict[str, List[str]]]:
+    """构建Merkle树，返回根哈希和每个文档的证明路径"""
+    leaves = sorted(set(document_hashes))
+    level = [merkle_leaf(document_hash) for document_hash in leaves]
+    positions = list(range(len(leaves)))
+    proofs: Dict[str, List[str]] = {document_hash: [] for document_hash in leaves}
+    while len(level) > 1:
+        for leaf_index, document_hash in enumerate(leaves):
+            position = positions[leaf_index]
+            sibling = position ^ 1
+            if sibling < len(level):
+                proofs[document_hash].append("0x" + level[sibling].hex().removeprefix("0x"))
+            positions[leaf_index] = position // 2
+        # 奇数个节点时最后一个直接上移
+        level = [merkle_parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    root = "0x" + level[0].hex().removeprefix("0x")
+    return root, proofs
+
+
+def verify_merkle_proof(document_hash: str, proof: List[str], root: str) -> bool:
+    node = merkle_leaf(document_hash)
+    for sibling in proof:
+        node = merkle_parent(node, bytes.fromhex(sibling[2:]))
+    return "0x" + node.hex().removeprefix("0x") == root.lower()
+
+
+def settle_anchor_batch(conn: sqlite3.Connection, batch_id: int, network: str, tx_hash: str, receipt: Any) -> str:
+    """按锚定交易回执结算pending批次：成功时登记文档指纹，回滚时文档重新排队；返回批次状态"""
+    status = "anchored" if receipt.status == 1 else "failed"
+    settled = conn.execute(
+        "UPDATE notarization_batches SET status = ?, block_number = ?, tx_hash = ? WHERE batch_id = ? AND status = 'pending'",
+        (status, receipt.blockNumber, tx_hash, batch_id),
+    ).rowcount
+    if not settled:
+        # 已由核对流程结算
+        return conn.execute("SELECT status FROM notarization_batches WHERE batch_id = ?", (batch_id,)).fetchone()["status"]
+    if status == "failed":
+        requeue_anchor_batch(conn, batch_id)
     else:
-        logger.warning("Starting Web3 MCP Server with public endpoints")
+        # 资产标识为合约地址时，锚定交易同时登记为该合约的文档指纹
+        rows = conn.execute(
+            "SELECT document_hash, document_name, asset_id FROM notarization_queue WHERE batch_id = ?", (batch_id,)
+        ).fetchall()
+        conn.executemany(
+            "INSERT OR IGNORE INTO document_fingerprints "
+            "(document_hash, contract_address, tx_hash, network, asset_id, document_name, registered_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(row["document_hash"],
+              Web3.to_checksum_address(row["asset_id"]) if Web3.is_address(row["asset_id"] or "") else "",
+              tx_hash, network, row["asset_id"], row["document_name"], time.time())
+             for row in rows],
+        )
+    return status
+
+
+def requeue_anchor_batch(conn: sqlite3.Connection, batch_id: int) -> None:
+    """批次交易回滚或被丢弃时，文档重新回到队列"""
+    conn.execute("UPDATE notarization_queue SET batch_id = NULL WHERE batch_id = ?", (batch_id,))
+    conn.execute("DELETE FROM notarization_proofs WHERE batch_id = ?", (batch_id,))
+
+
+def reconcile_anchor_batches(network: str) -> int:
+    """核对之前截止时间内未打包的锚定批次，返回本次结算或重新排队的批次数
     
-    if WALLET_PRIVATE_KEY:
-        account_address = Web3().eth.account.from_key('0x' + WALLET_PRIVATE_KEY if not WALLET_PRIVATE_KEY.startswith('0x') else WALLET_PRIVATE_KEY).address
-        logger.info(f"Wallet Address: {account_address}")
-        logger.info(f"Testnet deployment networks: {', '.join(TESTNETWORKS.keys())}")
-    else:
-        logger.warning("No wallet private key configured. Contract deployment disabled.")
+    已打包的按回执结算；nonce已被其他交易使用的标记为dropped并把文档重新排队；仍可能打包的保持pending。
+    """
+    conn = get_registry_connection()
+    try:
+        batches = conn.execute(
+            "SELECT batch_id, tx_hash, tx_hashes, nonce FROM notarization_batches WHERE status = 'pending' AND network = ?",
+            (network,),
+        ).fetchall()
+        if not batches:
+            return 0
+        w3 = get_web3_instance(network)
+        sender = w3.eth.account.from_key(get_private_key()).address
+        reconciled = 0
+        for batch in batches:
+            tx_hashes = json.loads(batch["tx_hashes"]) if batch["tx_hashes"] else [batch["tx_hash"]]
+            state, tx_hash, receipt = reconcile_broadcast(w3, network, sender, tx_hashes, batch["nonce"])
+            if state == "mined":
+                status = settle_anchor_batch(conn, batch["batch_id"], network, tx_hash, receipt)
+                logger.info(f"锚定批次 {batch['batch_id']} 已打包: {status}")
+            elif state == "released":
+                conn.execute("UPDATE notarization_batches SET status = 'dropped' WHERE batch_id = ?", (batch["batch_id"],))
+                requeue_anchor_batch(conn, batch["batch_id"])
+                logger.warning(f"锚定批次 {batch['batch_id']} 的交易未被打包且nonce已被使用，文档已重新排队")
+            else:
+                continue
+            conn.commit()
+            reconciled += 1
+        return reconciled
+    finally:
+        conn.close()
+
+
+def anchor_pending_documents(network: str) -> Dict[str, Any]:
+    """为指定网络的所有排队文档构建Merkle树，并用一笔交易锚定根哈希（先核对之前未打包的批次）"""
+    conn = get_registry_connection()
+    try:
+        # 锁只覆盖核对、选取队列、发送交易和标记批次；等待回执在锁外进行，不阻塞其他存证调用
+        with _notarization_lock:
+            reconciled = reconcile_anchor_batches(network)
+            rows = conn.execute(
+                "SELECT document_hash FROM notarization_queue WHERE batch_id IS NULL AND network = ?", (network,)
+            ).fetchall()
+            if not rows:
+                return {"anchored": 0, "reconciled": reconciled}
+            document_hashes = [row["document_hash"] for row in rows]
+            root, proofs = build_merkle_tree(document_hashes)
+            
+            w3 = get_web3_instance(network)
+            private_key = get_private_key()
+            account = w3.eth.account.from_key(private_key)
+            
+            # 0 ETH自转账，calldata携带根哈希
+            data = MERKLE_ANCHOR_PREFIX + root[2:]
+            preflight = preflight_transaction(network, {'from': account.address, 'to': account.address, 'data': data},
+                                              default_gas=30000)
+            if preflight["revert_reason"]:
+                raise RuntimeError(f"锚定交易预检失败: {preflight['revert_reason']}")
+            if not preflight["sufficient"]:
+                raise RuntimeError(f"ETH余额不足支付锚定交易: {w3.from_wei(preflight['balance'], 'ether'):.6f} ETH")
+            
+            transaction = {
+                'chainId': NETWORKS[network]["chain_id"],
+                'to': account.address,
+                'value': 0,
+                'data': data,
+                'gas': preflight["gas_limit"],
+                'gasPrice': preflight["gas_price"],
+                'nonce': preflight["nonce"],
+            }
+            tx_hash_hex = sign_and_send(w3, transaction, private_key)
+            logger.info(f"Merkle根锚定交易已发送: {tx_hash_hex}（{len(document_hashes)} 个文档）")
+            
+            cursor = conn.execute(
+                "INSERT INTO notarization_batches (merkle_root, leaf_count, network, tx_hash, status, created_at, "
+                "tx_hashes, nonce) VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)",
+                (root, len(proofs), network, tx_hash_hex, time.time(), json.dumps([tx_hash_hex]), transaction["nonce"]),
+            )
+            batch_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT OR REPLACE INTO notarization_proofs (document_hash, batch_id, leaf_index, proof) VALUES (?, ?, ?, ?)",
+                [(document_hash, batch_id, leaf_index, json.dumps(proofs[document_hash]))
+                 for leaf_index, document_hash in enumerate(sorted(proofs))],
+            )
+            conn.executemany(
+                "UPDATE notarization_queue SET batch_id = ? WHERE document_hash = ?",
+                [(batch_id, document_hash) for document_hash in document_hashes],
+            )
+            conn.commit()
+        
+        def record_replacement(hashes):
+            # 记录加价替换的哈希，超时后的核对据此查找回执
+            conn.execute("UPDATE notarization_batches SET tx_hash = ?, tx_hashes = ? WHERE batch_id = ?",
+                         (hashes[-1], json.dumps(hashes), batch_id))
+            conn.commit()
+        
+        sent = confirm_with_fee_bumping(w3, network, transaction, private_key, [tx_hash_hex],
+                                        on_broadcast=record_replacement)
+        tx_hash_hex = sent["tx_hash"]
+        tx_receipt = sent["receipt"]
+        if tx_receipt is None:
+            # 仍在等待打包，批次保持pending，下次锚定或定时器运行时核对
+            raise TimeoutError(f"锚定交易在截止时间内未打包，仍在等待: {', '.join(sent['hashes'])}")
+        status = settle_anchor_batch(conn, batch_id, network, tx_hash_hex, tx_receipt)
+        conn.commit()
+        
+        return {
+            "anchored": len(document_hashes) if status == "anchored" else 0,
+            "reconciled": reconciled,
+            "batch_id": batch_id,
+            "merkle_root": root,
+            "tx_hash": tx_hash_hex,
+            "block_number": tx_receipt.blockNumber,
+            "gas_used": tx_receipt.gasUsed,
+            "gas_price": tx_receipt.get("effectiveGasPrice", sent["gas_price"]),
+            "status": status,
+        }
+    finally:
+        conn.close()
+
+
+def _notarization_timer_loop() -> None:
+    """后台定时器：最早排队的文档超过最长等待时间后自动锚定，并核对未打包的锚定批次"""
+    while True:
+        time.sleep(min(60.0, max(1.0, NOTARIZATION_MAX_WAIT_SECONDS / 10)))
+        try:
+            conn = get_registry_connection()
+            try:
+                due = {row["network"] for row in conn.execute(
+                    "SELECT network FROM notarization_queue WHERE batch_id IS NULL "
+                    "GROUP BY network HAVING MIN(queued_at) <= ?",
+                    (time.time() - NOTARIZATION_MAX_WAIT_SECONDS,),
+                )}
+                unconfirmed = {row["network"] for row in conn.execute(
+                    "SELECT DISTINCT network FROM notarization_batches WHERE status = 'pending'"
+                )}
+            finally:
+                conn.close()
+            for network in sorted(due):
+                result = anchor_pending_documents(network)
+                logger.info(f"定时锚定完成: {network} {result}")
+            for network in sorted(unconfirmed - due):
+                with _notarization_lock:
+                    reconciled = reconcile_anchor_batches(network)
+                if reconciled:
+                    logger.info(f"已核对 {network} 上 {reconciled} 个未确认的锚定批次")
+        except Exception as e:
+            logger.warning(f"定时锚定失败: {e}")
+
+
+def start_notarization_timer() -> None:
+    global _notarization_timer_started
+    with _notarization_lock:
+        if not _notarization_timer_started:
+            threading.Thread(target=_notarization_timer_loop, name="notarization-timer", daemon=True).start()
+            _notarization_timer_started = True
+
+
+def format_anchor_result(result: Dict[str, Any], network: str) -> str:
+    explorer = NETWORKS[network]['explorer']
+    fee = result["gas_used"] * result["gas_price"]
+    per_document = fee / max(result["anchored"], 1)
+    return f"""**批次编号**: {result['batch_id']}
+**Merkle根**: `{result['merkle_root']}`
+**锚定文档数**: {result['anchored']}
+**状态**: {'✅ 已锚定' if result['status'] == 'anchored' else '❌ 交易失败，文档已重新排队'}
+**交易哈希**: `{result['tx_hash']}`
+**区块号**: {result['block_number']:,}
+**Gas 使用**: {result['gas_used']:,}
+**锚定费用**: {Web3.from_wei(fee, 'ether'):.8f} ETH（每个文档约 {Web3.from_wei(int(per_document), 'ether'):.8f} ETH）
+
+[在区块浏览器中查看交易]({explorer}/tx/{result['tx_hash']})
+"""
+
+
+@mcp.tool()
+def notarize_documents(documents: list, asset_id: str = "", network: str = "sepolia") -> str:
+    """将文档哈希加入存证队列，队列满或等待超时后批量构建Merkle树并用一笔交易锚定
+    
+    Args:
+        documents: 文档列表，每项可以是SHA-256哈希字符串，或包含 sha256/name 的字典，
+                   或包含本地文件 path 的字典（由服务器计算哈希）
+        asset_id: 文档所属资产标识（例如资产名称或代币合约地址）
+        network: 锚定网络，支持: sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia
+    """
+    try:
+        if not WALLET_PRIVATE_KEY:
+            return "❌ 缺少WALLET_PRIVATE_KEY环境变量，请在.env文件中设置"
+        
+        if network not in TESTNETWORKS:
+            return f"❌ 不支持的测试网络: {network}。支持的测试网络: {', '.join(TESTNETWORKS.keys())}"
+        
+        if not documents:
+            return "❌ 文档列表为空"
+        
+        entries = []
+        for index, document in enumerate(documents, 1):
+            if isinstance(document, str):
+                document = {"sha256": document}
+            if not isinstance(document, dict):
+                return f"❌ 第{index}项文档格式无效"
+            if document.get("path"):
+                if not os.path.isfile(document["path"]):
+                    return f"❌ 文件不存在: {document['path']}"
+                document_hash = hash_document_file(document["path"])
+                document_name = document.get("name") or os.path.basename(document["path"])
+            else:
+                document_hash = normalize_document_hash(str(document.get("sha256", "")))
+                document_name = document.get("name", "")
+            if not document_hash:
+                return f"❌ 第{index}项文档哈希无效，需要64位十六进制SHA-256"
+            entries.append((document_hash, document_name, asset_id, network, time.time()))
+        
+        conn = get_registry_connection()
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO notarization_queue (document_hash, document_name, asset_id, network, queued_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                entries,
+            )
+            conn.commit()
+            added = conn.total_changes - before
+            queued = conn.execute(
+                "SELECT COUNT(*) FROM notarization_queue WHERE batch_id IS NULL AND network = ?", (network,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        
+        start_notarization_timer()
+        
+        header = f"""# 文档存证排队结果
+
+**新增文档**: {added}（重复 {len(entries) - added} 个已忽略）
+**当前排队**: {queued} / {NOTARIZATION_BATCH_SIZE}
+**网络**: {TESTNETWORKS[network]['name']}
+"""
+        if queued >= NOTARIZATION_BATCH_SIZE:
+            result = anchor_pending_documents(network)
+            return header + "\n## 已达到批量阈值，立即锚定\n\n" + format_anchor_result(result, network)
+        
+        return header + f"""
+文档将在队列达到 {NOTARIZATION_BATCH_SIZE} 个或最早文档等待 {NOTARIZATION_MAX_WAIT_SECONDS / 60:.0f} 分钟后自动锚定，
+也可以调用 `anchor_notarization_batch` 立即锚定。
+**排队时间**: {datetime.now().isoformat()}
+"""
+        
+    except Exception as e:
+        return f"❌ 存证失败: {str(e)}"
+
+
+@mcp.tool()
+def anchor_notarization_batch(network: str = "sepolia") -> str:
+    """立即为排队中的文档构建Merkle树，并用一笔交易将根哈希锚定到链上
+    
+    Args:
+        network: 锚定网络，支持: sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia
+    """
+    try:
+        if not WALLET_PRIVATE_KEY:
+            return "❌ 缺少WALLET_PRIVATE_KEY环境变量，请在.env文件中设置"
+        
+        if network not in TESTNETWORKS:
+            return f"❌ 不支持的测试网络: {network}。支持的测试网络: {', '.join(TESTNETWORKS.keys())}"
+        
+        result = anchor_pending_documents(network)
+        if not result["anchored"] and "batch_id" not in result:
+            reconciled = f"（已核对 {result['reconciled']} 个之前未确认的批次）" if result.get("reconciled") else ""
+            return f"# Merkle根锚定结果\n\n{TESTNETWORKS[network]['name']} 上没有排队中的文档{reconciled}"
+        
+        return f"""# Merkle根锚定结果
+
+**网络**: {TESTNETWORKS[network]['name']}
+{format_anchor_result(result, network)}
+**锚定时间**: {datetime.now().isoformat()}
+"""
+        
+    except Exception as e:
+        return f"❌ 锚定失败: {str(e)}"
+
+
+@mcp.tool()
+def get_notarization_proof(document_hash: str) -> str:
+    """查询文档的存证状态和Merkle证明，并在本地验证证明与链上锚定的根哈希一致
+    
+    Args:
+        document_hash: 文档的SHA-256哈希
+    """
+    try:
+        normalized = normalize_document_hash(document_hash)
+        if not normalized:
+            return "❌ 文档哈希无效，需要64位十六进制SHA-256"
+        
+        conn = get_registry_connection()
+        try:
+            queued = conn.execute(
+                "SELECT * FROM notarization_queue WHERE document_hash = ?", (normalized,)
+            ).fetchone()
+            proof_row = conn.execute(
+                "SELECT p.leaf_index, p.proof, b.* FROM notarization_proofs p "
+                "JOIN notarization_batches b ON b.batch_id = p.batch_id WHERE p.document_hash = ?",
+                (normalized,),
+            ).fetchone()
+        finally:
+            conn.close()
+        
+        if queued is None:
+            return f"❌ 未找到文档 `{normalized}` 的存证记录"
+        
+        if proof_row is None:
+            return f"""# 文档存证状态
+
+**文档哈希**: `{normalized}`
+**文档名称**: {queued['document_name'] or '-'}
+**状态**: ⏳ 排队中，等待锚定
+**排队时间**: {datetime.fromtimestamp(queued['queued_at']).isoformat()}
+"""
+        
+        proof = json.loads(proof_row["proof"])
+        valid = verify_merkle_proof(normalized, proof, proof_row["merkle_root"])
+        explorer = NETWORKS.get(proof_row["network"], {}).get("explorer", "")
+        proof_lines = "\n".join(f"{i}. `{node}`" for i, node in enumerate(proof, 1)) or "（单文档批次，证明为空）"
+        return f"""# 文档存证证明
+
+**文档哈希**: `{normalized}`
+**文档名称**: {queued['document_name'] or '-'}
+**资产标识**: {queued['asset_id'] or '-'}
+**状态**: {'✅ 已锚定' if proof_row['status'] == 'anchored' else '⏳ 锚定交易确认中'}
+**Merkle根**: `{proof_row['merkle_root']}`
+**叶子序号**: {proof_row['leaf_index']} / {proof_row['leaf_count']}
+**本地验证**: {'✅ 证明有效' if valid else '❌ 证明无效'}
+**锚定交易**: `{proof_row['tx_hash']}`（calldata = `{MERKLE_ANCHOR_PREFIX}` + Merkle根）
+
+## Merkle证明（叶子 = keccak256(文档哈希)，节点按字节序排序后拼接哈希）
+
+{proof_lines}
+
+[在区块浏览器中查看锚定交易]({explorer}/tx/{proof_row['tx_hash']})
+"""
+        
+    except Exception as e:
+        return f"❌ 查询失败: {str(e)}"
+
+# ==================== 文档指纹登记 ====================
+
+# SQLite单条语句的参数上限为999，批量查询按此分块
+FINGERPRINT_QUERY_CHUNK = 900
+
+
+def normalize_document_hashes(document_hashes: List[Any]) -> Optional[List[str]]:
+    """批量规范化文档哈希（保持顺序并去重），任一无效时返回None"""
+    normalized = [normalize_document_hash(str(document_hash)) for document_hash in document_hashes]
+    if None in normalized:
+        return None
+    return list(dict.fromkeys(normalized))
+
+
+def register_document_fingerprints(document_hashes: List[str], contract_address: str, tx_hash: str,
+                                   network: str, asset_id: str = "",
+                                   document_names: Optional[Dict[str, str]] = None) -> int:
+    """将文档指纹与合约地址、交易哈希关联写入登记库，返回新增记录数"""
+    if not document_hashes:
+        return 0
+    document_names = document_names or {}
+    contract_address = Web3.to_checksum_address(contract_address) if contract_address else ""
+    conn = get_registry_connection()
+    try:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO document_fingerprints "
+            "(document_hash, contract_address, tx_hash, network, asset_id, document_name, registered_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(document_hash, contract_address, tx_hash, network, asset_id, document_names.get(document_hash, ""), time.time())
+             for document_hash in document_hashes],
+        )
+        conn.commit()
+        return conn.total_changes - before
+    finally:
+        conn.close()
+
+
+def find_document_fingerprints(document_hashes: List[str]) -> Dict[str, List[sqlite3.Row]]:
+    """按主键索引批量查询文档指纹，同时带出Merkle存证状态"""
+    found: Dict[str, List[sqlite3.Row]] = {document_hash: [] for document_hash in document_hashes}
+    conn = get_registry_connection()
+    try:
+        for start in range(0, len(document_hashes), FINGERPRINT_QUERY_CHUNK):
+            chunk = document_hashes[start:start + FINGERPRINT_QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT f.*, b.merkle_root, b.status AS anchor_status FROM document_fingerprints f "
+                f"LEFT JOIN notarization_proofs p ON p.document_hash = f.document_hash "
+                f"LEFT JOIN notarization_batches b ON b.batch_id = p.batch_id "
+                f"WHERE f.document_hash IN ({placeholders}) ORDER BY f.registered_at",
+                chunk,
+            ).fetchall()
+            for row in rows:
+                found[row["document_hash"]].append(row)
+    finally:
+        conn.close()
+    return found
+
+
+@mcp.tool()
+def link_document_fingerprints(document_hashes: list, contract_address: str, tx_hash: str = "",
+                               network: str = "sepolia", asset_id: str = "") -> str:
+    """将文档SHA-256指纹登记到已部署的代币合约（用于补登记部署时未附带的文档）
+    
+    Args:
+        document_hashes: 文档SHA-256列表
+        contract_address: 文档所属资产的代币合约地址
+        tx_hash: 关联交易哈希（例如合约部署交易），可选
+        network: 网络名称
+        asset_id: 资产标识（例如代币符号或资产名称），可选
+    """
+    try:
+        if network not in NETWORKS:
+            return f"❌ 不支持的网络: {network}。支持的网络: {', '.join(NETWORKS.keys())}"
+        
+        if not Web3.is_address(contract_address):
+            return f"❌ 无效的合约地址: {contract_address}"
+        
+        fingerprints = normalize_document_hashes(document_hashes)
+        if not fingerprints:
+            return "❌ 文档哈希无效，需要64位十六进制SHA-256"
+        
+        registered = register_document_fingerprints(fingerprints, contract_address, tx_hash, network, asset_id)
+        
+        return f"""# 文档指纹登记结果
+
+**合约地址**: `{Web3.to_checksum_address(contract_address)}`
+**网络**: {NETWORKS[network]['name']}
+**新增登记**: {registered} 个（已存在 {len(fingerprints) - registered} 个）
+**登记时间**: {datetime.now().isoformat()}
+"""
+        
+    except Exception as e:
+        return f"❌ 登记失败: {str(e)}"
+
+
+@mcp.tool()
+def lookup_document_fingerprints(hashes: list, contract_address: str = "") -> str:
+    """批量查询文档指纹属于哪些代币化资产（合约地址、交易哈希和存证状态），一次调用可解析整个文件夹
+    
+    Args:
+        hashes: 文档SHA-256列表
+        contract_address: 可选，指定后额外判断每个文档是否属于该合约对应的资产
+    """
+    try:
+        fingerprints = normalize_document_hashes(hashes)
+        if not fingerprints:
+            return "❌ 文档哈希无效，需要64位十六进制SHA-256"
+        
+        if contract_address and not Web3.is_address(contract_address):
+            return f"❌ 无效的合约地址: {contract_address}"
+        expected = Web3.to_checksum_address(contract_address) if contract_address else ""
+        
+        started = time.perf_counter()
+        found = find_document_fingerprints(fingerprints)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        rows = []
+        matched = 0
+        for document_hash in fingerprints:
+            records = found[document_hash]
+            if records:
+                matched += 1
+            belongs = any(record["contract_address"] == expected for record in records) if expected else None
+            if not records:
+                rows.append(f"| `{document_hash[:18]}...` | - | - | - | - | ❌ 未登记 |"
+                            + (" ❌ |" if expected else ""))
+                continue
+            for record in records:
+                explorer = NETWORKS.get(record["network"], {}).get("explorer", "")
+                contract_cell = f"`{record['contract_address']}`" if record["contract_address"] else "-"
+                tx_cell = f"[{record['tx_hash'][:10]}...]({explorer}/tx/{record['tx_hash']})" if record["tx_hash"] else "-"
+                anchor_cell = "✅ Merkle已锚定" if record["anchor_status"] == "anchored" else "✅ 已登记"
+                rows.append(
+                    f"| `{document_hash[:18]}...` | {record['document_name'] or '-'} | {record['asset_id'] or '-'} | "
+                    f"{contract_cell} | {tx_cell} | {anchor_cell} |" + ((" ✅ |" if belongs else " ❌ |") if expected else "")
+                )
+        
+        belongs_header = " 属于指定资产 |" if expected else ""
+        belongs_divider = "------|" if expected else ""
+        return f"""# 文档指纹查询结果
+
+**查询文档数**: {len(fingerprints)}
+**已登记**: {matched} / {len(fingerprints)}
+{f"**指定合约**: `{expected}`" + chr(10) if expected else ""}**查询耗时**: {elapsed_ms:.2f} ms
+
+| 文档哈希 | 文档名称 | 资产标识 | 合约地址 | 交易哈希 | 状态 |{belongs_header}
+|------|------|------|------|------|------|{belongs_divider}
+{chr(10).join(rows)}
+"""
+        
+    except Exception as e:
+        return f"❌ 查询失败: {str(e)}"
+
+# ==================== ERC-1155多资产登记合约 ====================
+
+# 每个网络只部署一次的多资产登记合约，新资产通过mint发行而不是单独部署ERC20
+ASSET_REGISTRY_SOURCE_CODE = '''
+pragma solidity ^0.8.19;
+
+interface IERC1155Receiver {
+    function onERC1155Received(address operator, address from, uint256 id, uint256 value, bytes calldata data) external returns (bytes4);
+    function onERC1155BatchReceived(address operator, address from, uint256[] calldata ids, uint256[] calldata values, bytes calldata data) external returns (bytes4);
+}
+
+contract RWAAssetRegistry {
+    address public immutable owner;
+    
+    mapping(uint256 => mapping(address => uint256)) private _balances;
+    mapping(address => mapping(address => bool)) private _operatorApprovals;
+    mapping(uint256 => uint256) public totalSupply;
+    mapping(uint256 => string) private _uris;
+    
+    event TransferSingle(address indexed operator, address indexed from, address indexed to, uint256 id, uint256 value);
+    event TransferBatch(address indexed operator, address indexed from, address indexed to, uint256[] ids, uint256[] values);
+    event ApprovalForAll(address indexed account, address indexed operator, bool approved);
+    event URI(string value, uint256 indexed id);
+    event AssetRegistered(uint256 indexed id, string assetId, uint256 supply);
+    
+    error NotOwner();
+    error AssetExists(uint256 id);
+    error ZeroSupply();
+    error ZeroAddress();
+    error LengthMismatch();
+    error NotAuthorized();
+    error InsufficientBalance(uint256 available, uint256 required);
+    error UnsafeRecipient(address to);
+    
+    constructor() {
+        owner = msg.sender;
+    }
+    
+    // 资产ID由资产标识字符串确定性生成，链下可用keccak256(assetId)直接计算
+    function assetTokenId(string calldata assetId) public pure returns (uint256) {
+        return uint256(keccak256(bytes(assetId)));
+    }
+    
+    function mint(string calldata assetId, uint256 supply, string calldata metadataUri, address to) external returns (uint256 id) {
+        if (msg.sender != owner) revert NotOwner();
+        if (to == address(0)) revert ZeroAddress();
+        if (supply == 0) revert ZeroSupply();
+        id = assetTokenId(assetId);
+        if (totalSupply[id] != 0) revert AssetExists(id);
+        totalSupply[id] = supply;
+        _balances[id][to] = supply;
+        _uris[id] = metadataUri;
+        emit TransferSingle(msg.sender, address(0), to, id, supply);
+        emit URI(metadataUri, id);
+        emit AssetRegistered(id, assetId, supply);
+        _checkReceived(msg.sender, address(0), to, id, supply, "");
+    }
+    
+    function uri(uint256 id) external view returns (string memory) {
+        return _uris[id];
+    }
+    
+    function balanceOf(address account, uint256 id) external view returns (uint256) {
+        return _balances[id][account];
+    }
+    
+    function balanceOfBatch(address[] calldata accounts, uint256[] calldata ids) external view returns (uint256[] memory balances) {
+        if (accounts.length != ids.length) revert LengthMismatch();
+        balances = new uint256[](accounts.length);
+        for (uint256 i = 0; i < accounts.length; ) {
+            balances[i] = _balances[ids[i]][accounts[i]];
+            unchecked { ++i; }
+        }
+    }
+    
+    function setApprovalForAll(address operator, bool approved) external {
+        _operatorApprovals[msg.sender][operator] = approved;
+        emit ApprovalForAll(msg.sender, operator, approved);
+    }
+    
+    function isApprovedForAll(address account, address operator) external view returns (bool) {
+        return _operatorApprovals[account][operator];
+    }
+    
+    function safeTransferFrom(address from, address to, uint256 id, uint256 value, bytes calldata data) external {
+        if (from != msg.sender && !_operatorApprovals[from][msg.sender]) revert NotAuthorized();
+        _move(from, to, id, value);
+        emit TransferSingle(msg.sender, from, to, id, value);
+        _checkReceived(msg.sender, from, to, id, value, data);
+    }
+    
+    function safeBatchTransferFrom(address from, address to, uint256[] calldata ids, uint256[] calldata values, bytes calldata data) external {
+        if (from != msg.sender && !_operatorApprovals[from][msg.sender]) revert NotAuthorized();
+        if (ids.length != values.length) revert LengthMismatch();
+        for (uint256 i = 0; i < ids.length; ) {
+            _move(from, to, ids[i], values[i]);
+            unchecked { ++i; }
+        }
+        emit TransferBatch(msg.sender, from, to, ids, values);
+        if (to.code.length > 0) {
+            if (IERC1155Receiver(to).onERC1155BatchReceived(msg.sender, from, ids, values, data) != IERC1155Receiver.onERC1155BatchReceived.selector) {
+                revert UnsafeRecipient(to);
+            }
+        }
+    }
+    
+    function supportsInterface(bytes4 interfaceId) external pure returns (bool) {
+        // ERC165, ERC1155, ERC1155MetadataURI
+        return interfaceId == 0x01ffc9a7 || interfaceId == 0xd9b67a26 || interfaceId == 0x0e89341c;
+    }
+    
+    function _move(address from, address to, uint256 id, uint256 value) internal {
+        if (to == address(0)) revert ZeroAddress();
+        uint256 fromBalance = _balances[id][from];
+        if (fromBalance < value) revert InsufficientBalance(fromBalance, value);
+        unchecked {
+            // 同一资产的余额之和不超过totalSupply，不会溢出
+            _balances[id][from] = fromBalance - value;
+            _balances[id][to] += value;
+        }
+    }
+    
+    function _checkReceived(address operator, address from, address to, uint256 id, uint256 value, bytes memory data) internal {
+        if (to.code.length > 0) {
+            if (IERC1155Receiver(to).onERC1155Received(operator, from, id, value, data) != IERC1155Receiver.onERC1155Received.selector) {
+                revert UnsafeRecipient(to);
+            }
+        }
+    }
+}
+'''
+
+# 铸造和查询所需的ABI子集（已部署的登记合约无需solc即可调用）
+ASSET_REGISTRY_ABI = [
+    {"inputs": [{"internalType": "string", "name": "assetId", "type": "string"}, {"internalType": "uint256", "name": "supply", "type": "uint256"}, {"internalType": "string", "name": "metadataUri", "type": "string"}, {"internalType": "address", "name": "to", "type": "address"}], "name": "mint", "outputs": [{"internalType": "uint256", "name": "id", "type": "uint256"}], "stateMutability": "nonpayable", "type": "function"},
+    {"inputs": [{"internalType": "address[]", "name": "accounts", "type": "address[]"}, {"internalType": "uint256[]", "name": "ids", "type": "uint256[]"}], "name": "balanceOfBatch", "outputs": [{"internalType": "uint256[]", "name": "balances", "type": "uint256[]"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"internalType": "uint256", "name": "", "type": "uint256"}], "name": "totalSupply", "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"internalType": "uint256", "name": "id", "type": "uint256"}], "name": "uri", "outputs": [{"internalType": "string", "name": "", "type": "string"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [], "name": "NotOwner", "type": "error"},
+    {"inputs": [{"internalType": "uint256", "name": "id", "type": "uint256"}], "name": "AssetExists", "type": "error"},
+    {"inputs": [], "name": "ZeroSupply", "type": "error"},
+    {"inputs": [], "name": "ZeroAddress", "type": "error"},
+    {"inputs": [], "name": "LengthMismatch", "type": "error"},
+]
+
+_asset_registry_lock = threading.Lock()
+
+
+def asset_token_id(asset_id: str) -> int:
+    """与合约assetTokenId一致：uint256(keccak256(bytes(assetId)))"""
+    return int.from_bytes(Web3.keccak(text=asset_id), "big")
+
+
+def compile_asset_registry() -> Tuple[Optional[str], Optional[list]]:
+    """编译ERC-1155多资产登记合约，返回字节码和ABI"""
+    if not HAS_SOLCX:
+        logger.warning("没有安装py-solc-x，无法编译多资产登记合约")
+        return None, None
+    
+    try:
+        install_solc(SOLC_VERSION)
+        set_solc_version(SOLC_VERSION)
+        logger.info("正在编译多资产登记合约...")
+        compiled_sol = compile_source(ASSET_REGISTRY_SOURCE_CODE, optimize=True, optimize_runs=SOLC_OPTIMIZE_RUNS)
+        contract_interface = compiled_sol["<stdin>:RWAAssetRegistry"]
+        return '0x' + contract_interface['bin'], contract_interface['abi']
+    except Exception as e:
+        logger.error(f"多资产登记合约编译失败: {e}")
+        return None, None
+
+
+def get_asset_registry_address(network: str) -> Optional[str]:
+    """返回本地登记库中记录的、已部署成功的多资产登记合约地址"""
+    conn = get_registry_connection()
+    try:
+        row = conn.execute(
+            "SELECT address FROM asset_registries WHERE network = ? AND status = 'deployed'", (network,)
+        ).fetchone()
+        return row["address"] if row else None
+    finally:
+        conn.close()
+
+
+def record_asset_registry(network: str, address: str, tx_hashes: List[str], status: str,
+                          nonce: Optional[int] = None) -> None:
+    conn = get_registry_connection()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO asset_registries (network, address, tx_hash, deployed_at, status, tx_hashes, nonce) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (network, address, tx_hashes[-1], time.time(), status, json.dumps(tx_hashes), nonce),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def forget_asset_registry(network: str) -> None:
+    conn = get_registry_connection()
+    try:
+        conn.execute("DELETE FROM asset_registries WHERE network = ? AND status = 'pending'", (network,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def asset_registry_result(network: str, tx_hash: str, receipt: Any, hashes: List[str], gas_price: int) -> Dict[str, Any]:
+    """登记合约部署交易已打包：成功时记录地址，回滚时删除pending记录并报错"""
+    if receipt.status != 1:
+        forget_asset_registry(network)
+        raise RuntimeError(f"登记合约部署失败，交易状态: {receipt.status}")
+    record_asset_registry(network, receipt.contractAddress, hashes, "deployed")
+    return {
+        "address": receipt.contractAddress,
+        "deployed": True,
+        "tx_hash": tx_hash,
+        "gas_used": receipt.gasUsed,
+        "gas_price": receipt.get("effectiveGasPrice", gas_price),
+    }
+
+
+def ensure_asset_registry(network: str) -> Dict[str, Any]:
+    """获取指定网络的多资产登记合约，不存在时部署一次并记录地址
+    
+    部署交易广播后立即记录为pending（包括全部哈希和nonce）；截止时间内未打包时，下次调用先继续等待这笔部署，
+    只有确认它回滚或nonce已被其他交易使用后才重新部署，避免部署出第二个登记合约。
+    """
+    with _asset_registry_lock:
+        conn = get_registry_connection()
+        try:
+            row = conn.execute("SELECT * FROM asset_registries WHERE network = ?", (network,)).fetchone()
+        finally:
+            conn.close()
+        if row is not None and row["status"] == "deployed":
+            return {"address": row["address"], "deployed": False}
+        
+        w3 = get_web3_instance(network)
+        private_key = get_private_key()
+        account = w3.eth.account.from_key(private_key)
+        
+        if row is not None:
+            tx_hashes = json.loads(row["tx_hashes"]) if row["tx_hashes"] else [row["tx_hash"]]
+            state, tx_hash, receipt = reconcile_broadcast(w3, network, account.address, tx_hashes, row["nonce"])
+            if state == "pending":
+                logger.info(f"继续等待之前的登记合约部署交易: {', '.join(tx_hashes)}")
+                mined = wait_for_any_receipt(w3, network, tx_hashes, CONFIRMATION_DEADLINE_SECONDS)
+                if mined is None:
+                    raise TimeoutError(f"之前的登记合约部署交易仍未打包: {', '.join(tx_hashes)}，稍后重试")
+                state, (tx_hash, receipt) = "mined", mined
+            if state == "mined":
+                return asset_registry_result(network, tx_hash, receipt, tx_hashes, 0)
+            # nonce已被其他交易使用，之前的部署不会再打包
+            forget_asset_registry(network)
+        
+        bytecode, abi = compile_asset_registry()
+        if not bytecode:
+            raise RuntimeError("多资产登记合约编译失败，需要py-solc-x及可用的solc编译器")
+        
+        constructor = w3.eth.contract(abi=abi, bytecode=bytecode).constructor()
+        
+        preflight = preflight_transaction(
+            network, {'from': account.address, 'data': constructor.data_in_transaction}, abi=abi, gas_price_multiplier=2
+        )
+        if preflight["revert_reason"]:
+            raise RuntimeError(f"登记合约部署预检失败: {preflight['revert_reason']}")
+        if not preflight["sufficient"]:
+            raise RuntimeError(f"ETH余额不足部署登记合约: {w3.from_wei(preflight['balance'], 'ether'):.6f} ETH")
+        
+        transaction = constructor.build_transaction({
+            'chainId': NETWORKS[network]["chain_id"],
+            'gas': preflight["gas_limit"],
+            'gasPrice': preflight["gas_price"],
+            'nonce': preflight["nonce"],
+            'from': account.address
+        })
+        tx_hash = sign_and_send(w3, transaction, private_key)
+        logger.info(f"登记合约部署交易已发送: {tx_hash}")
+        # 合约地址由部署者和nonce决定，未打包时即可记录
+        expected_address = get_create_address(account.address, transaction["nonce"])
+        record_asset_registry(network, expected_address, [tx_hash], "pending", transaction["nonce"])
+        
+        sent = confirm_with_fee_bumping(
+            w3, network, transaction, private_key, [tx_hash],
+            on_broadcast=lambda hashes: record_asset_registry(network, expected_address, hashes, "pending",
+                                                              transaction["nonce"]),
+        )
+        if sent["receipt"] is None:
+            raise TimeoutError(f"登记合约部署交易在截止时间内未打包，仍在等待: {', '.join(sent['hashes'])}")
+        return asset_registry_result(network, sent["tx_hash"], sent["receipt"], sent["hashes"], sent["gas_price"])
+
+
+@mcp.tool()
+def mint_asset_tokens(asset_id: str, supply: int, metadata_uri: str, network: str = "sepolia",
+                      document_hashes: Optional[list] = None) -> str:
+    """在多资产登记合约（ERC-1155）中为新资产铸造代币，替代为每个资产单独部署ERC20合约
+    
+    登记合约在每个网络上只部署一次（首次铸造时自动部署），之后每个新资产只需一笔mint交易。
+    
+    Args:
+        asset_id: 资产唯一标识（例如 "beijing-chaoyang-apt-1201"），代币ID = keccak256(asset_id)
+        supply: 发行份额数量（ERC-1155份额为整数，无小数位）
+        metadata_uri: 资产元数据URI（例如 ipfs://... 或 https://...）
+        network: 网络名称，支持: sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia
+        document_hashes: 资产相关文档的SHA-256列表，铸造成功后登记到文档指纹库
+    """
+    try:
+        if not WALLET_PRIVATE_KEY:
+            return "❌ 缺少WALLET_PRIVATE_KEY环境变量，请在.env文件中设置"
+        
+        if network not in TESTNETWORKS:
+            return f"❌ 不支持的测试网络: {network}。支持的测试网络: {', '.join(TESTNETWORKS.keys())}"
+        
+        if not asset_id:
+            return "❌ 资产标识不能为空"
+        
+        if supply <= 0:
+            return "❌ 发行份额必须大于0"
+        
+        fingerprints = normalize_document_hashes(document_hashes or [])
+        if fingerprints is None:
+            return "❌ 文档哈希无效，需要64位十六进制SHA-256"
+        
+        registry = ensure_asset_registry(network)
+        registry_address = registry["address"]
+        
+        w3 = get_web3_instance(network)
+        private_key = get_private_key()
+        account = w3.eth.account.from_key(private_key)
+        contract = w3.eth.contract(address=registry_address, abi=ASSET_REGISTRY_ABI)
+        token_id = asset_token_id(asset_id)
+        
+        data = contract.functions.mint(asset_id, int(supply), metadata_uri, account.address)._encode_transaction_data()
+        preflight = preflight_transaction(
+            network, {'from': account.address, 'to': registry_address, 'data': data},
+            abi=ASSET_REGISTRY_ABI, default_gas=200000,
+        )
+        if preflight["revert_reason"]:
+            return f"❌ 铸造预检失败，交易模拟回滚: {preflight['revert_reason']}"
+        if not preflight["sufficient"]:
+            return (f"❌ 账户余额不足。当前余额: {w3.from_wei(preflight['balance'], 'ether'):.6f} ETH，"
+                    f"铸造最多需要: {w3.from_wei(preflight['required'], 'ether'):.6f} ETH")
+        
+        transaction = {
+            'chainId': TESTNETWORKS[network]["chain_id"],
+            'to': registry_address,
+            'value': 0,
+            'data': data,
+            'gas': preflight["gas_limit"],
+            'gasPrice': preflight["gas_price"],
+            'nonce': preflight["nonce"],
+        }
+        sent = send_transaction_with_deadline(w3, network, transaction, private_key)
+        tx_hash_hex = sent["tx_hash"]
+        tx_receipt = sent["receipt"]
+        if tx_receipt is None:
+            return format_pending_transaction(sent, network)
+        if tx_receipt.status != 1:
+            return f"❌ 资产铸造失败，交易状态: {tx_receipt.status}"
+        
+        registered = register_document_fingerprints(fingerprints, registry_address, tx_hash_hex, network, asset_id=asset_id)
+        
+        explorer = TESTNETWORKS[network]['explorer']
+        mint_fee = receipt_fee(tx_receipt, sent["gas_price"])
+        registry_line = f"`{registry_address}`"
+        if registry["deployed"]:
+            registry_line += (f"（本次首次部署，Gas {registry['gas_used']:,}，"
+                              f"费用 {w3.from_wei(registry['gas_used'] * registry['gas_price'], 'ether'):.6f} ETH）")
+        
+        return f"""# 资产代币铸造成功 ✅
+
+**资产标识**: {asset_id}
+**代币ID**: `{token_id}`
+**发行份额**: {int(supply):,}
+**元数据URI**: {metadata_uri}
+**登记合约**: {registry_line}
+**网络**: {TESTNETWORKS[network]['name']}
+**持有者**: `{account.address}`
+**交易哈希**: `{tx_hash_hex}`
+**Gas 使用**: {tx_receipt.gasUsed:,} / {preflight['gas_limit']:,}
+**铸造费用**: {w3.from_wei(mint_fee, 'ether'):.6f} ETH
+**登记文档指纹**: {registered} 个
+**铸造时间**: {datetime.now().isoformat()}
+
+[在区块浏览器中查看登记合约]({explorer}/address/{registry_address})
+[在区块浏览器中查看交易]({explorer}/tx/{tx_hash_hex})
+"""
+        
+    except Exception as e:
+        logger.error(f"资产铸造过程中发生错误: {str(e)}")
+        return f"❌ 铸造失败: {str(e)}"
+
+
+@mcp.tool()
+def check_asset_token_balances(wallet_addresses: list, asset_ids: list, network: str = "sepolia") -> str:
+    """通过一次balanceOfBatch调用查询多个钱包在多个资产上的份额余额（投资组合视图）
+    
+    Args:
+        wallet_addresses: 钱包地址列表
+        asset_ids: 资产标识列表（mint_asset_tokens 中使用的 asset_id）
+        network: 网络名称，支持: sepolia, arbitrum-sepolia, optimism-sepolia, base-sepolia
+    """
+    try:
+        if network not in TESTNETWORKS:
+            return f"❌ 不支持的测试网络: {network}。支持的测试网络: {', '.join(TESTNETWORKS.keys())}"
+        
+        if not wallet_addresses or not asset_ids:
+            return "❌ 钱包地址和资产标识列表不能为空"
+        
+        for address in wallet_addresses:
+            if not Web3.is_address(address):
+                return f"❌ 无效的钱包地址: {address}"
+        
+        registry_address = get_asset_registry_address(network)
+        if not registry_address:
+            return f"❌ {TESTNETWORKS[network]['name']} 上尚未部署多资产登记合约，请先使用 mint_asset_tokens 发行资产"
+        
+        w3 = get_web3_instance(network)
+        contract = w3.eth.contract(address=registry_address, abi=ASSET_REGISTRY_ABI)
+        
+        # 钱包×资产的所有组合合并为一次balanceOfBatch
+        wallets = [Web3.to_checksum_address(address) for address in wallet_addresses]
+        pairs = [(wallet, asset_id) for wallet in wallets for asset_id in asset_ids]
+        balances = contract.functions.balanceOfBatch(
+            [wallet for wallet, _ in pairs], [asset_token_id(asset_id) for _, asset_id in pairs]
+        ).call()
+        
+        holdings = dict(zip(pairs, balances))
+        header = " | ".join(str(asset_id) for asset_id in asset_ids)
+        rows = [
+            f"| `{wallet}` | " + " | ".join(f"{holdings[(wallet, asset_id)]:,}" for asset_id in asset_ids) + " |"
+            for wallet in wallets
+        ]
+        
+        return f"""# 多资产份额余额
+
+**登记合约**: `{registry_address}`
+**网络**: {TESTNETWORKS[network]['name']}
+**查询组合数**: {len(pairs)}（1次balanceOfBatch调用）
+
+| 钱包地址 | {header} |
+|------|{"------|" * len(asset_ids)}
+{chr(10).join(rows)}
+
+**查询时间**: {datetime.now().isoformat()}
+"""
+        
+    except Exception as e:
+        return f"❌ 查询失败: {str(e)}"
+
+# ==================== 收益分配 ====================
+
+TRANSFER_EVENT_TOPIC = "0x" + Web3.keccak(text="Transfer(address,address,uint256)").hex().removeprefix("0x")
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+# 单次eth_getLogs查询的区块跨度，端点拒绝时自动二分
+LOG_CHUNK_BLOCKS = int(os.getenv('LOG_CHUNK_BLOCKS', '5000'))
+# 每次JSON-RPC批量请求包含的eth_getLogs区间数
+LOG_BATCH_RANGES = int(os.getenv('LOG_BATCH_RANGES', '10'))
+# 支持batchTransfer的代币每笔交易包含的收款人数量
+DISTRIBUTION_BATCH_CHUNK = int(os.getenv('DISTRIBUTION_BATCH_CHUNK', '200'))
+
+# 持有人快照缓存（指定区块的快照不可变）: (network, token, block) -> {holder: balance}
+_holder_snapshots: Dict[Tuple[str, str, int], Dict[str, int]] = {}
+
+
+def fetch_transfer_logs(network: str, token_address: str, from_block: int, to_block: int) -> List[Dict[str, Any]]:
+    """分区间批量拉取Transfer事件日志，区间过大被拒绝时二分重试"""
+    pending = [(start, min(start + LOG_CHUNK_BLOCKS - 1, to_block))
+               for start in range(from_block, to_block + 1, LOG_CHUNK_BLOCKS)]
+    logs = []
+    while pending:
+        group, pending = pending[:LOG_BATCH_RANGES], pending[LOG_BATCH_RANGES:]
+        responses = rpc_batch(NETWORKS[network]["rpc_url"], [
+            ("eth_getLogs", [{"address": token_address, "topics": [TRANSFER_EVENT_TOPIC],
+                              "fromBlock": hex(start), "toBlock": hex(end)}])
+            for start, end in group
+        ])
+        for (start, end), response in zip(group, responses):
+            if "error" in response:
+                if end > start:
+                    middle = (start + end) // 2
+                    pending.extend([(start, middle), (middle + 1, end)])
+                    continue
+                raise ConnectionError(f"获取区块 {start} 的Transfer日志失败: {response['error'].get('message')}")
+            logs.extend(response["result"])
+    return logs
+
+
+def snapshot_holders(network: str, token_address: str, block_number: int, from_block: int = 0) -> Dict[str, int]:
+    """根据Transfer日志重建指定区块的持有人余额快照"""
+    cache_key = (network, token_address, block_number)
+    if cache_key in _holder_snapshots:
+        return _holder_snapshots[cache_key]
+    
+    balances: Dict[str, int] = {}
+    for log in fetch_transfer_logs(network, token_address, from_block, block_number):
+        # 只处理标准ERC20 Transfer（from、to为indexed，金额在data中）
+        if len(log["topics"]) != 3:
+            continue
+        sender = to_checksum_address("0x" + log["topics"][1][-40:])
+        receiver = to_checksum_address("0x" + log["topics"][2][-40:])
+        value = int(log["data"], 16)
+        balances[sender] = balances.get(sender, 0) - value
+        balances[receiver] = balances.get(receiver, 0) + value
+    
+    holders = {holder: balance for holder, balance in balances.items() if balance > 0 and holder != ZERO_ADDRESS}
+    _holder_snapshots[cache_key] = holders
+    return holders
+
+
+def allocate_pro_rata(total_amount: int, balances: Dict[str, int]) -> Dict[str, int]:
+    """按持有比例分配整数金额（最大余数法），分配总和严格等于total_amount"""
+    total_shares = sum(balances.values())
+    if total_shares <= 0:
+        return {}
+    holders = list(balances)
+    quotients = [divmod(total_amount * balances[holder], total_shares) for holder in holders]
+    allocation = {holder: quotient for holder, (quotient, _) in zip(holders, quotients)}
+    leftover = total_amount - sum(allocation.values())
+    # 余数最大的持有人各多分1个最小单位，余数相同时按地址排序保证结果确定
+    ranked = sorted(range(len(holders)), key=lambda index: (-quotients[index][1], holders[index]))
+    for index in ranked[:leftover]:
+        allocation[holders[index]] += 1
+    return allocation
+
+
+def create_distribution(network: str, share_token: str, payout_token: str, block_number: int,
+                        total_amount: int, allocation: Dict[str, int], balances: Dict[str, int]) -> int:
+    """保存分配方案，返回分配编号"""
+    conn = get_registry_connection()
+    try:
+        cursor = conn.execute(
+            "INSERT INTO distributions (network, share_token, payout_token, snapshot_block, total_amount, "
+            "holder_count, status, created_at) VALUES (?, ?, ?, ?, ?, ?, 'planned', ?)",
+            (network, share_token, payout_token, block_number, str(total_amount), len(allocation), time.time()),
+        )
+        distribution_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO distribution_payouts (distribution_id, holder, share_balance, amount, status) "
+            "VALUES (?, ?, ?, ?, 'pending')",
+            [(distribution_id, holder, str(balances[holder]), str(amount))
+             for holder, amount in allocation.items() if amount > 0],
+        )
+        conn.commit()
+        return distribution_id
+    finally:
+        conn.close()
+
+
+@mcp.tool()
+def snapshot_token_holders(contract_address: str, block_number: Optional[int] = None, network: str = "sepolia",
+                           from_block: int = 0) -> str:
+    """根据Transfer事件日志生成代币在指定区块的持有人快照
+    
+    Args:
+        contract_address: 代币合约地址（ERC20）
+        block_number: 快照区块号，默认最新区块
+        network: 网络名称
+        from_block: 开始扫描的区块（通常为合约部署区块，可大幅减少日志查询量）
+    """
+    try:
+        if network not in NETWORKS:
+            return f"❌ 不支持的网络: {network}。支持的网络: {', '.join(NETWORKS.keys())}"
+        
+        if not is_address(contract_address):
+            return "❌ 无效的合约地址格式"
+        
+        w3 = get_web3_instance(network)
+        contract_address = to_checksum_address(contract_address)
+        block_number = w3.eth.block_number if block_number is None else int(block_number)
+        
+        started = time.perf_counter()
+        holders = snapshot_holders(network, contract_address, block_number, from_block)
+        elapsed = time.perf_counter() - started
+        
+        metadata = get_token_metadata(network, contract_address)
+        decimals = metadata["decimals"]
+        total = sum(holders.values())
+        top = sorted(holders.items(), key=lambda item: -item[1])[:20]
+        rows = [
+            f"| {index} | `{holder}` | {balance / 10 ** decimals:,.6f} | {balance * 100 / total:.4f}% |"
+            for index, (holder, balance) in enumerate(top, 1)
+        ]
+        
+        return f"""# 持有人快照
+
+**代币**: {metadata['name']} ({metadata['symbol']})
+**合约地址**: `{contract_address}`
+**网络**: {NETWORKS[network]['name']}
+**快照区块**: {block_number:,}
+**持有人数**: {len(holders):,}
+**流通总量**: {total / 10 ** decimals:,.6f} {metadata['symbol']}
+**生成耗时**: {elapsed:.2f} 秒
+
+## 前 {len(top)} 名持有人
+
+| # | 地址 | 余额 | 占比 |
+|---|------|------|------|
+{chr(10).join(rows)}
+"""
+        
+    except Exception as e:
+        return f"❌ 快照生成失败: {str(e)}"
+
+
+@mcp.tool()
+def plan_income_distribution(contract_address: str, total_amount: float, payout_token: str = "",
+                             block_number: Optional[int] = None, network: str = "sepolia", from_block: int = 0,
+                             exclude_addresses: Optional[list] = None, include_issuer: bool = False) -> str:
+    """生成收益分配方案：在快照区块按持有比例计算每个持有人的应得金额（整数精确分配）
+    
+    方案保存在本地登记库中，确认后使用 execute_income_distribution 执行。
+    
+    Args:
+        contract_address: 份额代币合约地址（按其持有比例分配）
+        total_amount: 本次分配总额（支付代币单位，例如 10000 USDC）
+        payout_token: 支付代币合约地址，默认与份额代币相同
+        block_number: 快照区块号，默认最新区块
+        network: 网络名称
+        from_block: 开始扫描Transfer日志的区块（通常为合约部署区块）
+        exclude_addresses: 不参与分配的地址列表（例如流动性池、托管地址）
+        include_issuer: 发行钱包是否参与分配，默认不参与
+    """
+    try:
+        if network not in NETWORKS:
+            return f"❌ 不支持的网络: {network}。支持的网络: {', '.join(NETWORKS.keys())}"
+        
+        if not is_address(contract_address):
+            return "❌ 无效的合约地址格式"
+        
+        if payout_token and not is_address(payout_token):
+            return "❌ 无效的支付代币地址格式"
+        
+        if total_amount <= 0:
+            return "❌ 分配总额必须大于0"
+        
+        w3 = get_web3_instance(network)
+        share_token = to_checksum_address(contract_address)
+        payout_token = to_checksum_address(payout_token) if payout_token else share_token
+        block_number = w3.eth.block_number if block_number is None else int(block_number)
+        
+        excluded = {to_checksum_address(address) for address in (exclude_addresses or []) if is_address(address)}
+        if not include_issuer and WALLET_PRIVATE_KEY:
+            excluded.add(w3.eth.account.from_key(get_private_key()).address)
+        
+        holders = snapshot_holders(network, share_token, block_number, from_block)
+        eligible = {holder: balance for holder, balance in holders.items() if holder not in excluded}
+        if not eligible:
+            return "❌ 快照中没有符合条件的持有人"
+        
+        share_metadata = get_token_metadata(network, share_token)
+        payout_metadata = get_token_metadata(network, payout_token)
+        payout_decimals = payout_metadata["decimals"]
+        # 通过字符串转换避免浮点误差
+        total_units = int(Decimal(str(total_amount)) * (10 ** payout_decimals))
+        
+        allocation = allocate_pro_rata(total_units, eligible)
+        distribution_id = create_distribution(network, share_token, payout_token, block_number,
+                                              total_units, allocation, eligible)
+        
+        total_shares = sum(eligible.values())
+        top = sorted(allocation.items(), key=lambda item: -item[1])[:20]
+        rows = [
+            f"| {index} | `{holder}` | {eligible[holder] * 100 / total_shares:.4f}% | "
+            f"{amount / 10 ** payout_decimals:,.6f} |"
+            for index, (holder, amount) in enumerate(top, 1)
+        ]
+        payees = sum(1 for amount in allocation.values() if amount > 0)
+        
+        return f"""# 收益分配方案
+
+**分配编号**: {distribution_id}
+**份额代币**: {share_metadata['name']} ({share_metadata['symbol']}) `{share_token}`
+**支付代币**: {payout_metadata['name']} ({payout_metadata['symbol']}) `{payout_token}`
+**网络**: {NETWORKS[network]['name']}
+**快照区块**: {block_number:,}
+**参与持有人**: {len(eligible):,}（排除 {len(holders) - len(eligible)} 个地址）
+**实际收款人**: {payees:,}（金额不足1个最小单位的持有人不产生转账）
+**分配总额**: {total_units / 10 ** payout_decimals:,.6f} {payout_metadata['symbol']}（按最大余数法精确分配，无舍入损失）
+
+## 前 {len(top)} 名收款人
+
+| # | 地址 | 持有比例 | 应得金额 |
+|---|------|------|------|
+{chr(10).join(rows)}
+
+确认无误后调用 `execute_income_distribution({distribution_id})` 执行分配。
+"""
+        
+    except Exception as e:
+        return f"❌ 分配方案生成失败: {str(e)}"
+
+
+def reconcile_distribution_payouts(w3: Web3, network: str, distribution_id: int, sender: str) -> int:
+    """核对上次执行中已广播但未确认的转账，返回仍在等待打包的收款人数
+    
+    已打包的按回执状态标记为paid或failed（回滚，可重试）；nonce已被其他交易使用的清除哈希以便重新发送；
+    仍可能被打包的保持pending并在本次执行中跳过，避免重复付款。
+    """
+    conn = get_registry_connection()
+    try:
+        rows = conn.execute(
+            "SELECT holder, tx_hashes, nonce FROM distribution_payouts "
+            "WHERE distribution_id = ? AND status = 'pending' AND tx_hashes IS NOT NULL", (distribution_id,)
+        ).fetchall()
+        # batchTransfer的一笔交易对应多个收款人
+        groups: Dict[Tuple[str, Optional[int]], List[str]] = {}
+        for row in rows:
+            groups.setdefault((row["tx_hashes"], row["nonce"]), []).append(row["holder"])
+        
+        in_flight = 0
+        for (tx_hashes, nonce), holders in groups.items():
+            state, tx_hash, receipt = reconcile_broadcast(w3, network, sender, json.loads(tx_hashes), nonce)
+            if state == "mined":
+                status = "paid" if receipt.status == 1 else "failed"
+                updates = [(tx_hash, status, distribution_id, holder) for holder in holders]
+            elif state == "released":
+                updates = [(None, "pending", distribution_id, holder) for holder in holders]
+            else:
+                in_flight += len(holders)
+                continue
+            conn.executemany(
+                "UPDATE distribution_payouts SET tx_hash = ?, status = ?, tx_hashes = NULL, nonce = NULL "
+                "WHERE distribution_id = ? AND holder = ?", updates,
+            )
+        conn.commit()
+        return in_flight
+    finally:
+        conn.close()
+
+
+@mcp.tool()
+def execute_income_distribution(distribution_id: int, max_fee_gwei: Optional[float] = None,
+                                deadline_minutes: Optional[float] = None) -> str:
+    """执行收益分配方案：支持batchTransfer的代币按批次打包转账，否则以连续nonce流水线广播逐笔转账
+    
+    只处理尚未成功的收款人，中断后可重复调用继续执行。截止时间内未打包的转账保存为pending及其全部交易哈希，
+    再次调用时先核对这些哈希的回执和账户nonce，仍可能打包的收款人不会重复付款。
+    
+    Args:
+        distribution_id: plan_income_distribution 返回的分配编号
+        max_fee_gwei: 可选，Gas价格高于该值时延迟执行，直到Gas价格达标
+        deadline_minutes: 可选，延迟执行的最长等待分钟数
+    """
+    try:
+        if not WALLET_PRIVATE_KEY:
+            return "❌ 缺少WALLET_PRIVATE_KEY环境变量，请在.env文件中设置"
+        
+        conn = get_registry_connection()
+        try:
+            plan = conn.execute("SELECT * FROM distributions WHERE distribution_id = ?", (distribution_id,)).fetchone()
+        finally:
+            conn.close()
+        
+        if plan is None:
+            return f"❌ 未找到分配方案: {distribution_id}"
+        
+        network = plan["network"]
+        w3 = get_web3_instance(network)
+        private_key = get_private_key()
+        account = w3.eth.account.from_key(private_key)
+        in_flight = reconcile_distribution_payouts(w3, network, distribution_id, account.address)
+        
+        conn = get_registry_connection()
+        try:
+            payouts = conn.execute(
+                "SELECT holder, amount FROM distribution_payouts WHERE distribution_id = ? AND status != 'paid' "
+                "AND tx_hashes IS NULL ORDER BY CAST(amount AS REAL) DESC", (distribution_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        
+        if not payouts:
+            if in_flight:
+                return (f"⏳ 分配方案 {distribution_id} 还有 {in_flight} 个收款人的转账已广播、等待打包，"
+                        f"稍后再次调用 `execute_income_distribution({distribution_id})` 核对")
+            return f"✅ 分配方案 {distribution_id} 已全部执行完毕"
+        
+        if max_fee_gwei is not None or deadline_minutes is not None:
+            scheduled = schedule_if_expensive(
+                "execute_income_distribution", network, {"distribution_id": distribution_id},
+                max_fee_gwei, deadline_minutes,
+            )
+            if scheduled:
+                return scheduled
+        
+        payout_token = plan["payout_token"]
+        contract = w3.eth.contract(address=payout_token, abi=ERC20_ABI + ERC20_BATCH_TRANSFER_ABI)
+        metadata = get_token_metadata(network, payout_token)
+        
+        recipients = [(payout["holder"], int(payout["amount"])) for payout in payouts]
+        remaining_total = sum(amount for _, amount in recipients)
+        
+        # 一次批量RPC：预检首笔转账，同时查询支付代币余额并探测batchTransfer支持
+        first_transfer = contract.functions.transfer(recipients[0][0], recipients[0][1])._encode_transaction_data()
+        preflight = preflight_transaction(
+            network,
+            {'from': account.address, 'to': payout_token, 'data': first_transfer},
+            abi=ERC20_ABI,
+            default_gas=100000,
+            extra_calls={
+                "token_balance": ("eth_call", [{
+                    "to": payout_token, "data": contract.functions.balanceOf(account.address)._encode_transaction_data(),
+                }, "pending"]),
+                "batch_probe": ("eth_call", [{
+                    "from": account.address, "to": payout_token,
+                    "data": contract.functions.batchTransfer([], [])._encode_transaction_data(),
+                }, "pending"]),
+            },
+        )
+        
+        token_balance_response = preflight["extra"]["token_balance"]
+        token_balance = int(token_balance_response["result"], 16) if "result" in token_balance_response else 0
+        if token_balance < remaining_total:
+            return (f"❌ 支付代币余额不足。当前余额: {token_balance / 10 ** metadata['decimals']:,.6f} {metadata['symbol']}，"
+                    f"待分配: {remaining_total / 10 ** metadata['decimals']:,.6f} {metadata['symbol']}")
+        if preflight["revert_reason"]:
+            return f"❌ 转账预检失败，交易模拟回滚: {preflight['revert_reason']}"
+        
+        gas_price = preflight["gas_price"]
+        # 空数组batchTransfer返回true才视为支持，避免把fallback函数误判为支持
+        batch_probe = preflight["extra"]["batch_probe"].get("result") or "0x"
+        use_batch = len(batch_probe) == 66 and int(batch_probe, 16) == 1
+        if use_batch:
+            chunks = [recipients[start:start + DISTRIBUTION_BATCH_CHUNK]
+                      for start in range(0, len(recipients), DISTRIBUTION_BATCH_CHUNK)]
+            jobs = [{
+                "recipients": chunk,
+                "data": contract.functions.batchTransfer(
+                    [holder for holder, _ in chunk], [amount for _, amount in chunk]
+                )._encode_transaction_data(),
+            } for chunk in chunks]
+            # 所有批次的Gas估算合并为一次批量RPC
+            estimates = rpc_batch(NETWORKS[network]["rpc_url"], [
+                ("eth_estimateGas", [{'from': account.address, 'to': payout_token, 'data': job["data"]}]) for job in jobs
+            ])
+            for job, estimate in zip(jobs, estimates):
+                if "error" in estimate:
+                    return f"❌ batchTransfer预检失败: {decode_revert_reason(estimate['error'], ERC20_BATCH_TRANSFER_ABI)}"
+                job["gas_limit"] = int(int(estimate["result"], 16) * 1.2)
+        else:
+            # 首笔转账的估算作为所有逐笔转账的Gas限制（收款人都是新的存储槽时开销相同）
+            jobs = [{
+                "recipients": [(holder, amount)],
+                "data": contract.functions.transfer(holder, amount)._encode_transaction_data(),
+                "gas_limit": preflight["gas_limit"],
+            } for holder, amount in recipients]
+        
+        total_gas_cost = sum(job["gas_limit"] for job in jobs) * gas_price
+        if preflight["balance"] < total_gas_cost:
+            return (f"❌ ETH余额不足支付gas费。当前余额: {w3.from_wei(preflight['balance'], 'ether'):.6f} ETH，"
+                    f"{len(jobs)} 笔交易最多需要: {w3.from_wei(total_gas_cost, 'ether'):.6f} ETH")
+        
+        # 连续nonce流水线广播，不等待前一笔确认
+        base_nonce = preflight["nonce"]
+        for offset, job in enumerate(jobs):
+            job.update({"tx_hash": None, "hashes": [], "receipt": None, "error": None, "gas_price": gas_price})
+            try:
+                job["transaction"] = {
+                    'chainId': NETWORKS[network]["chain_id"],
+                    'to': payout_token,
+                    'value': 0,
+                    'data': job["data"],
+                    'gas': job["gas_limit"],
+                    'gasPrice': gas_price,
+                    'nonce': base_nonce + offset,
+                }
+                job["tx_hash"] = sign_and_send(w3, job["transaction"], private_key)
+                job["hashes"] = [job["tx_hash"]]
+            except Exception as send_error:
+                # 后续nonce会出现空缺，停止广播剩余交易
+                job["error"] = f"发送失败: {send_error}"
+                for remaining in jobs[offset + 1:]:
+                    remaining.update({"tx_hash": None, "hashes": [], "receipt": None, "error": "未发送（前序交易发送失败）"})
+                break
+        sent = [job for job in jobs if job["tx_hash"] is not None]
+        logger.info(f"分配 {distribution_id}: 已广播 {len(sent)} / {len(jobs)} 笔交易")
+        
+        def record_broadcast(job_batch):
+            # 等待回执前先保存哈希和nonce，进程中断后再次执行时据此核对而不是重新付款
+            conn = get_registry_connection()
+            try:
+                conn.executemany(
+                    "UPDATE distribution_payouts SET tx_hash = ?, tx_hashes = ?, nonce = ? "
+                    "WHERE distribution_id = ? AND holder = ?",
+                    [(job["hashes"][-1], json.dumps(job["hashes"]), job["transaction"]["nonce"], distribution_id, holder)
+                     for job in job_batch for holder, _ in job["recipients"]],
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        
+        record_broadcast(sent)
+        gas_cap = current_gas_price_cap()
+        
+        def wait_receipt(job):
+            def on_broadcast(hashes):
+                job["hashes"] = hashes
+                record_broadcast([job])
+            
+            try:
+                confirmed = confirm_with_fee_bumping(w3, network, job["transaction"], private_key, list(job["hashes"]),
+                                                     deadline_seconds=CONFIRMATION_DEADLINE_SECONDS * 2,
+                                                     on_broadcast=on_broadcast, max_gas_price=gas_cap)
+                job.update({"tx_hash": confirmed["tx_hash"], "hashes": confirmed["hashes"],
+                            "receipt": confirmed["receipt"], "gas_price": confirmed["gas_price"]})
+                if confirmed["receipt"] is None:
+                    job["error"] = f"截止时间内未打包，仍在等待: {', '.join(confirmed['hashes'])}"
+            except Exception as wait_error:
+                job["error"] = f"等待确认失败: {wait_error}"
+        
+        if sent:
+            with ThreadPoolExecutor(max_workers=min(RECEIPT_WAIT_WORKERS, len(sent))) as executor:
+                list(executor.map(wait_receipt, sent))
+        
+        # 按交易结果更新每个收款人的状态：只有回执status为0才是failed，已广播未打包的保持pending和全部哈希
+        updates = []
+        paid_amount = 0
+        paid_count = 0
+        total_fee = 0
+        reverted_jobs = 0
+        pending_jobs = 0
+        for job in jobs:
+            receipt = job["receipt"]
+            if receipt is not None:
+                total_fee += receipt_fee(receipt, job["gas_price"])
+                if receipt.status == 1:
+                    status = "paid"
+                    paid_count += len(job["recipients"])
+                    paid_amount += sum(amount for _, amount in job["recipients"])
+                else:
+                    status = "failed"
+                    reverted_jobs += 1
+                row = (job["tx_hash"], status, None, None)
+            elif job["tx_hash"] is not None:
+                pending_jobs += 1
+                row = (job["hashes"][-1], "pending", json.dumps(job["hashes"]), job["transaction"]["nonce"])
+            else:
+                # 未广播的交易不会被打包，保持pending（无哈希），下次执行重新发送
+                continue
+            updates.extend(row + (distribution_id, holder) for holder, _ in job["recipients"])
+        
+        conn = get_registry_connection()
+        try:
+            conn.executemany(
+                "UPDATE distribution_payouts SET tx_hash = ?, status = ?, tx_hashes = ?, nonce = ? "
+                "WHERE distribution_id = ? AND holder = ?",
+                updates,
+            )
+            unpaid = conn.execute(
+                "SELECT COUNT(*) FROM distribution_payouts WHERE distribution_id = ? AND status != 'paid'",
+                (distribution_id,),
+            ).fetchone()[0]
+            conn.execute(
+                "UPDATE distributions SET status = ? WHERE distribution_id = ?",
+                ("completed" if unpaid == 0 else "partial", distribution_id),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        
+        decimals = metadata["decimals"]
+        first_error = next((job["error"] for job in jobs if job["error"]), None)
+        return f"""# 收益分配执行结果 {'✅' if unpaid == 0 else '⚠️'}
+
+**分配编号**: {distribution_id}
+**支付代币**: {metadata['name']} ({metadata['symbol']}) `{payout_token}`
+**网络**: {NETWORKS[network]['name']}
+**执行方式**: {f'batchTransfer（每笔最多 {DISTRIBUTION_BATCH_CHUNK} 个收款人）' if use_batch else '逐笔转账（连续nonce流水线广播）'}
+**交易数**: {len(jobs)}（回滚 {reverted_jobs}，待打包 {pending_jobs}，未发送 {len(jobs) - len(sent)}）
+**本次到账**: {paid_count:,} 个收款人，{paid_amount / 10 ** decimals:,.6f} {metadata['symbol']}
+**剩余未完成**: {unpaid:,} 个收款人{f"（其中 {in_flight:,} 个为之前已广播、仍在等待打包的转账）" if in_flight else ""}
+**Gas价格**: {w3.from_wei(gas_price, 'gwei'):.2f} Gwei
+**总Gas费用**: {w3.from_wei(total_fee, 'ether'):.6f} ETH
+{f"**首个错误**: {first_error}" + chr(10) if first_error else ""}**执行时间**: {datetime.now().isoformat()}
+{"" if unpaid == 0 else chr(10) + f"可再次调用 `execute_income_distribution({distribution_id})` 核对待打包交易并重试未完成的收款人。" + chr(10)}"""
+        
+    except Exception as e:
+        logger.error(f"收益分配执行过程中发生错误: {str(e)}")
+        return f"❌ 分配执行失败: {str(e)}"
+
+# ==================== 预言机价格源 ====================
+
+# Multicall3在主流EVM网络上的统一部署地址
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+AGGREGATE3_SELECTOR = bytes.fromhex("82ad56cb")
+# 单次aggregate3调用包含的子调用数量上限
+MULTICALL_CHUNK = int(os.getenv('MULTICALL_CHUNK', '200'))
+# 未启用newHeads订阅时，最新价格的缓存秒数
+PRICE_FEED_CACHE_SECONDS = float(os.getenv('PRICE_FEED_CACHE_SECONDS', '12'))
+
+LATEST_ROUND_DATA_SELECTOR = bytes.fromhex("feaf968c")
+GET_ROUND_DATA_SELECTOR = bytes.fromhex("9a6fc8f5")
+DECIMALS_SELECTOR = bytes.fromhex("313ce567")
+DESCRIPTION_SELECTOR = bytes.fromhex("7284e416")
+ROUND_DATA_TYPES = ["uint80", "int256", "uint256", "uint256", "uint80"]
+
+# 常用Chainlink价格源（也可以直接传入聚合器合约地址）
+PRICE_FEEDS = {
+    "mainnet": {
+        "ETH/USD": "0x5f4eC3Df9cbd43714FE2740f5E3616155c5b8419",
+        "BTC/USD": "0xF4030086522a5bEEa4988F8cA5B36dbC97BeE88c",
+        "XAU/USD": "0x214eD9Da11D2fbe465a6fc601a91E62EbEc1a0D6",
+        "EUR/USD": "0xb49f677943BC038e9857d61E7d053CaA2C1734C1",
+        "GBP/USD": "0x5c0Ab2d9b5a7ed9f470386e82BB36A3613cDd4b5",
+        "JPY/USD": "0xBcE206caE7f0ec07b545EddE332A47C2F75bbeb3",
+        "USDC/USD": "0x8fFfFfd4AfB6115b954Bd326cbe7B4BA576818f6",
+    },
+    "sepolia": {
+        "ETH/USD": "0x694AA1769357215DE4FAC081bf1f309aDC325306",
+        "BTC/USD": "0x1b44F3514812d835EB1BDB0acB33d3fA3351Ee43",
+        "EUR/USD": "0x1a81afB8146aeFfCFc5E50e8479e826E7D55b910",
+        "XAU/USD": "0xC5981F461d74c46eB4b0CF3f4Ec79f025573B0Ea",
+        "LINK/USD": "0xc59E3633BAAC79493d908e63626716e204A45EdF",
+    },
+}
+
+# decimals/description不可变: (network, feed) -> {"decimals", "description"}
+_feed_static_cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+# 历史轮次不可变，按轮次ID缓存: (network, feed) -> {round_id: round}
+_feed_round_cache: Dict[Tuple[str, str], Dict[int, Dict[str, int]]] = {}
+# 最新轮次ID，按区块（或时间窗口）缓存: (network, feed) -> (freshness_key, round_id)
+_feed_latest_cache: Dict[Tuple[str, str], Tuple[int, int]] = {}
+_feed_cache_lock = threading.Lock()
+
+
+def multicall(network: str, calls: List[Tuple[str, bytes]]) -> List[Tuple[bool, bytes]]:
+    """通过Multicall3.aggregate3批量执行只读调用（允许单个调用失败），超过上限的部分分块后放入同一个JSON-RPC批量请求"""
+    if not calls:
+        return []
+    chunks = [calls[start:start + MULTICALL_CHUNK] for start in range(0, len(calls), MULTICALL_CHUNK)]
+    payloads = [
+        "0x" + (AGGREGATE3_SELECTOR + abi_encode(
+            ["(address,bool,bytes)[]"], [[(to_checksum_address(target), True, call_data) for target, call_data in chunk]]
+        )).hex()
+        for chunk in chunks
+    ]
+    responses = rpc_batch(NETWORKS[network]["rpc_url"], [
+        ("eth_call", [{"to": MULTICALL3_ADDRESS, "data": payload}, "latest"]) for payload in payloads
+    ])
+    results = []
+    for response in responses:
+        if "error" in response:
+            raise ConnectionError(f"Multicall3调用失败: {response['error'].get('message')}")
+        results.extend(abi_decode(["(bool,bytes)[]"], bytes.fromhex(response["result"][2:]))[0])
+    return results
+
+
+def resolve_price_feed(network: str, feed: str) -> Optional[Tuple[str, str]]:
+    """将交易对名称或聚合器地址解析为 (标签, 校验和地址)"""
+    known = PRICE_FEEDS.get(network, {})
+    if feed.upper() in known:
+        return feed.upper(), to_checksum_address(known[feed.upper()])
+    if is_address(feed):
+        address = to_checksum_address(feed)
+        label = next((pair for pair, known_address in known.items() if known_address.lower() == address.lower()), address)
+        return label, address
+    return None
+
+
+def decode_round(return_data: bytes) -> Dict[str, int]:
+    round_id, answer, started_at, updated_at, answered_in_round = abi_decode(ROUND_DATA_TYPES, return_data)
+    return {"round_id": round_id, "answer": answer, "started_at": started_at,
+            "updated_at": updated_at, "answered_in_round": answered_in_round}
+
+
+def price_freshness_key(network: str) -> int:
+    """最新价格的缓存键：有新鲜的newHeads推送时按区块，否则按时间窗口"""
+    subscription = get_head_subscription(network)
+    if subscription is not None and subscription.is_fresh():
+        return subscription.block_number
+    return -int(time.time() // PRICE_FEED_CACHE_SECONDS)
+
+
+def read_latest_rounds(network: str, feeds: List[str]) -> Dict[str, Dict[str, Any]]:
+    """一次multicall读取多个价格源的最新轮次（以及首次读取时的decimals和description）"""
+    freshness = price_freshness_key(network)
+    results: Dict[str, Dict[str, Any]] = {}
+    calls: List[Tuple[str, bytes]] = []
+    plan: List[Tuple[str, str]] = []
+    
+    with _feed_cache_lock:
+        for feed in feeds:
+            key = (network, feed)
+            latest = _feed_latest_cache.get(key)
+            if latest and latest[0] == freshness and key in _feed_static_cache:
+                # 本区块内已读取过，直接使用按轮次缓存的数据
+                results[feed] = {**_feed_static_cache[key], **_feed_round_cache[key][latest[1]], "cached": True}
+                continue
+            calls.append((feed, LATEST_ROUND_DATA_SELECTOR))
+            plan.append((feed, "latest"))
+            if key not in _feed_static_cache:
+                calls.extend([(feed, DECIMALS_SELECTOR), (feed, DESCRIPTION_SELECTOR)])
+                plan.extend([(feed, "decimals"), (feed, "description")])
+    
+    responses = multicall(network, calls)
+    fetched: Dict[str, Dict[str, Any]] = {}
+    for (feed, field), (success, return_data) in zip(plan, responses):
+        entry = fetched.setdefault(feed, {})
+        if not success or not return_data:
+            entry["error"] = f"{field} 调用失败"
+            continue
+        if field == "latest":
+            entry["round"] = decode_round(return_data)
+        elif field == "decimals":
+            entry["decimals"] = abi_decode(["uint8"], return_data)[0]
+        else:
+            entry["description"] = abi_decode(["string"], return_data)[0]
+    
+    with _feed_cache_lock:
+        for feed, entry in fetched.items():
+            key = (network, feed)
+            if "error" in entry:
+                results[feed] = {"error": entry["error"]}
+                continue
+            if key not in _feed_static_cache:
+                _feed_static_cache[key] = {"decimals": entry["decimals"], "description": entry["description"]}
+            round_data = entry["round"]
+            _feed_round_cache.setdefault(key, {})[round_data["round_id"]] = round_data
+            _feed_latest_cache[key] = (freshness, round_data["round_id"])
+            results[feed] = {**_feed_static_cache[key], **round_data, "cached": False}
+    return results
+
+
+def read_round_history(network: str, feed: str, rounds: int) -> Tuple[Dict[str, Any], List[Dict[str, int]]]:
+    """读取价格源最近若干轮次，已缓存的轮次不再请求，其余轮次合并为一次multicall"""
+    latest = read_latest_rounds(network, [feed])[feed]
+    if "error" in latest:
+        raise ConnectionError(f"价格源 {feed} 读取失败: {latest['error']}")
+    
+    # Chainlink轮次ID = phaseId << 64 | aggregatorRoundId，只在当前phase内回溯
+    latest_round_id = latest["round_id"]
+    phase_base = latest_round_id & ~((1 << 64) - 1)
+    wanted = [round_id for round_id in range(latest_round_id, latest_round_id - rounds, -1) if round_id > phase_base]
+    
+    key = (network, feed)
+    with _feed_cache_lock:
+        cached = _feed_round_cache.setdefault(key, {})
+        missing = [round_id for round_id in wanted if round_id not in cached]
+    
+    responses = multicall(network, [
+        (feed, GET_ROUND_DATA_SELECTOR + abi_encode(["uint80"], [round_id])) for round_id in missing
+    ])
+    with _feed_cache_lock:
+        for success, return_data in responses:
+            if success and return_data:
+                round_data = decode_round(return_data)
+                # 未完成的轮次（updatedAt为0）不缓存
+                if round_data["updated_at"]:
+                    cached[round_data["round_id"]] = round_data
+        history = [cached[round_id] for round_id in wanted if round_id in cached]
+    return latest, history
+
+
+@mcp.tool()
+def get_price_feeds(feeds: list, network: str = "mainnet") -> str:
+    """通过一次Multicall3调用批量读取Chainlink价格源的最新价格（latestRoundData）
+    
+    Args:
+        feeds: 价格源列表，可以是交易对名称（mainnet: ETH/USD, BTC/USD, XAU/USD, EUR/USD, GBP/USD, JPY/USD, USDC/USD；
+               sepolia: ETH/USD, BTC/USD, EUR/USD, XAU/USD, LINK/USD）或聚合器合约地址
+        network: 网络名称
+    """
+    try:
+        if network not in NETWORKS:
+            return f"❌ 不支持的网络: {network}。支持的网络: {', '.join(NETWORKS.keys())}"
+        
+        if not feeds:
+            return "❌ 价格源列表为空"
+        
+        resolved = []
+        for feed in feeds:
+            item = resolve_price_feed(network, str(feed))
+            if item is None:
+                return f"❌ 未知的价格源: {feed}。{network} 上的已知价格源: {', '.join(PRICE_FEEDS.get(network, {})) or '无'}"
+            resolved.append(item)
+        
+        started = time.perf_counter()
+        latest = read_latest_rounds(network, [address for _, address in resolved])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        now = time.time()
+        rows = []
+        for label, address in resolved:
+            data = latest[address]
+            if "error" in data:
+                rows.append(f"| {label} | - | - | - | - | ❌ {data['error']} |")
+                continue
+            price = data["answer"] / 10 ** data["decimals"]
+            age_minutes = (now - data["updated_at"]) / 60
+            rows.append(
+                f"| {label} | {data['description']} | {price:,.{min(data['decimals'], 8)}f} | "
+                f"{datetime.fromtimestamp(data['updated_at']).isoformat()} | {age_minutes:.1f} 分钟 | `{data['round_id']}` |"
+            )
+        
+        return f"""# 链上预言机价格
+
+**网络**: {NETWORKS[network]['name']}
+**价格源数量**: {len(resolved)}（一次Multicall3调用）
+**查询耗时**: {elapsed_ms:.0f} ms
+
+| 价格源 | 描述 | 价格 | 更新时间 | 距今 | 轮次ID |
+|------|------|------|------|------|------|
+{chr(10).join(rows)}
+
+**数据来源**: Chainlink聚合器合约 latestRoundData
+**查询时间**: {datetime.now().isoformat()}
+"""
+        
+    except Exception as e:
+        return f"❌ 查询失败: {str(e)}"
+
+
+@mcp.tool()
+def get_price_feed_history(feed: str, rounds: int = 24, network: str = "mainnet") -> str:
+    """读取Chainlink价格源最近若干轮次的价格时间序列（已读取的轮次在进程内缓存）
+    
+    Args:
+        feed: 交易对名称（例如 "XAU/USD"）或聚合器合约地址
+        rounds: 回溯的轮次数量（最多500）
+        network: 网络名称
+    """
+    try:
+        if network not in NETWORKS:
+            return f"❌ 不支持的网络: {network}。支持的网络: {', '.join(NETWORKS.keys())}"
+        
+        resolved = resolve_price_feed(network, feed)
+        if resolved is None:
+            return f"❌ 未知的价格源: {feed}。{network} 上的已知价格源: {', '.join(PRICE_FEEDS.get(network, {})) or '无'}"
+        label, address = resolved
+        rounds = max(1, min(int(rounds), 500))
+        
+        latest, history = read_round_history(network, address, rounds)
+        decimals = latest["decimals"]
+        if not history:
+            return f"❌ 价格源 {label} 没有可用的历史轮次"
+        
+        prices = [round_data["answer"] / 10 ** decimals for round_data in history]
+        rows = [
+            f"| `{round_data['round_id']}` | {datetime.fromtimestamp(round_data['updated_at']).isoformat()} | "
+            f"{price:,.{min(decimals, 8)}f} |"
+            for round_data, price in zip(history, prices)
+        ]
+        oldest, newest = prices[-1], prices[0]
+        change = (newest - oldest) / oldest * 100 if oldest else 0
+        
+        return f"""# 预言机价格时间序列
+
+**价格源**: {label}（{latest['description']}）
+**聚合器地址**: `{address}`
+**网络**: {NETWORKS[network]['name']}
+**轮次数**: {len(history)}
+**时间范围**: {datetime.fromtimestamp(history[-1]['updated_at']).isoformat()} ~ {datetime.fromtimestamp(history[0]['updated_at']).isoformat()}
+**区间涨跌**: {change:+.2f}%
+**最高 / 最低**: {max(prices):,.{min(decimals, 8)}f} / {min(prices):,.{min(decimals, 8)}f}
+
+| 轮次ID | 更新时间 | 价格 |
+|------|------|------|
+{chr(10).join(rows)}
+"""
+        
+    except Exception as e:
+        return f"❌ 查询失败: {str(e)}"
+
+# ==================== DEX流动性与滑点 ====================
+
+TOKEN0_SELECTOR = bytes.fromhex("0dfe1681")
+TOKEN1_SELECTOR = bytes.fromhex("d21220a7")
+GET_RESERVES_SELECTOR = bytes.fromhex("0902f1ac")
+SLOT0_SELECTOR = bytes.fromhex("3850c7bd")
+LIQUIDITY_SELECTOR = bytes.fromhex("1a686502")
+FEE_SELECTOR = bytes.fromhex("ddca3f43")
+# Uniswap v2类交易对的固定手续费
+V2_SWAP_FEE = float(os.getenv('DEX_V2_SWAP_FEE', '0.003'))
+# 未指定交易规模时，按基础代币（虚拟）储备的比例生成滑点曲线
+DEFAULT_TRADE_FRACTIONS = [0.001, 0.005, 0.01, 0.02, 0.05, 0.1]
+# 汇总表中报告的价格影响深度
+DEPTH_IMPACT_LEVELS = [0.01, 0.02, 0.05]
+
+# 池子的版本、代币和手续费不可变: (network, pool) -> dict
+_pool_static_cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+# 池子状态按区块（或时间窗口）缓存: (network, pool) -> (freshness_key, state)
+_pool_state_cache: Dict[Tuple[str, str], Tuple[int, Dict[str, int]]] = {}
+_pool_cache_lock = threading.Lock()
+
+
+def decode_pool_state(version: str, fields: Dict[str, bytes]) -> Dict[str, int]:
+    if version == "v2":
+        reserve0, reserve1 = abi_decode(["uint112", "uint112"], fields["reserves"][:64])
+        return {"reserve0": reserve0, "reserve1": reserve1}
+    # slot0的其余字段在不同分叉中类型不同，只解析前两个
+    sqrt_price_x96, tick = abi_decode(["uint160", "int24"], fields["slot0"][:64])
+    return {"sqrt_price_x96": sqrt_price_x96, "tick": tick,
+            "liquidity": abi_decode(["uint128"], fields["liquidity"])[0]}
+
+
+def read_pool_states(network: str, pools: List[str]) -> Dict[str, Dict[str, Any]]:
+    """一次multicall读取多个v2/v3池子的状态（首次读取时同时识别版本、代币和手续费），状态按区块缓存"""
+    freshness = price_freshness_key(network)
+    results: Dict[str, Dict[str, Any]] = {}
+    calls: List[Tuple[str, bytes]] = []
+    plan: List[Tuple[str, str]] = []
+    
+    with _pool_cache_lock:
+        for pool in pools:
+            key = (network, pool)
+            cached = _pool_state_cache.get(key)
+            if cached and cached[0] == freshness:
+                results[pool] = {**_pool_static_cache[key], **cached[1], "cached": True}
+                continue
+            static = _pool_static_cache.get(key)
+            if static is None:
+                # 未知版本：v2和v3的只读方法一起调用，按成功的方法识别
+                fields = [("token0", TOKEN0_SELECTOR), ("token1", TOKEN1_SELECTOR), ("reserves", GET_RESERVES_SELECTOR),
+                          ("slot0", SLOT0_SELECTOR), ("liquidity", LIQUIDITY_SELECTOR), ("fee", FEE_SELECTOR)]
+            elif static["version"] == "v2":
+                fields = [("reserves", GET_RESERVES_SELECTOR)]
+            else:
+                fields = [("slot0", SLOT0_SELECTOR), ("liquidity", LIQUIDITY_SELECTOR)]
+            for field, selector in fields:
+                calls.append((pool, selector))
+                plan.append((pool, field))
+    
+    fetched: Dict[str, Dict[str, bytes]] = {}
+    for (pool, field), (success, return_data) in zip(plan, multicall(network, calls)):
+        if success and return_data:
+            fetched.setdefault(pool, {})[field] = return_data
+        else:
+            fetched.setdefault(pool, {})
+    
+    # 新识别的池子需要补充代币的symbol/decimals（与代币工具共用元数据缓存，缺失的合并为一次批量RPC）
+    new_static: Dict[str, Dict[str, Any]] = {}
+    for pool, fields in fetched.items():
+        if (network, pool) in _pool_static_cache:
+            continue
+        if "token0" not in fields or "token1" not in fields:
+            results[pool] = {"error": "不是Uniswap v2/v3类池子（token0/token1调用失败）"}
+            continue
+        if "reserves" in fields:
+            version, fee = "v2", V2_SWAP_FEE
+        elif {"slot0", "liquidity", "fee"} <= fields.keys():
+            version, fee = "v3", abi_decode(["uint24"], fields["fee"])[0] / 1_000_000
+        else:
+            results[pool] = {"error": "无法识别池子版本（getReserves与slot0均调用失败）"}
+            continue
+        new_static[pool] = {"version": version, "fee": fee,
+                            "token0": to_checksum_address(abi_decode(["address"], fields["token0"])[0]),
+                            "token1": to_checksum_address(abi_decode(["address"], fields["token1"])[0])}
+    
+    tokens = sorted({static[side] for static in new_static.values() for side in ("token0", "token1")})
+    token_metadata = get_tokens_metadata(network, tokens) if tokens else {}
+    
+    with _pool_cache_lock:
+        for pool, static in new_static.items():
+            for side in ("0", "1"):
+                meta = token_metadata[static["token" + side]]
+                static["decimals" + side], static["symbol" + side] = meta["decimals"], meta["symbol"]
+            _pool_static_cache[(network, pool)] = static
+        
+        for pool, fields in fetched.items():
+            key = (network, pool)
+            if pool in results or key not in _pool_static_cache:
+                continue
+            static = _pool_static_cache[key]
+            try:
+                state = decode_pool_state(static["version"], fields)
+            except Exception:
+                results[pool] = {"error": "池子状态读取失败"}
+                continue
+            _pool_state_cache[key] = (freshness, state)
+            results[pool] = {**static, **state, "cached": False}
+    return results
+
+
+def pool_virtual_reserves(pool: Dict[str, Any], base_side: str) -> Tuple[float, float]:
+    """返回 (基础代币储备, 计价代币储备)，单位为代币数量；v3使用当前价格区间活跃流动性对应的虚拟储备"""
+    if pool["version"] == "v2":
+        reserve0, reserve1 = pool["reserve0"], pool["reserve1"]
+    else:
+        sqrt_price = pool["sqrt_price_x96"] / 2 ** 96
+        reserve0 = pool["liquidity"] / sqrt_price if sqrt_price else 0.0
+        reserve1 = pool["liquidity"] * sqrt_price
+    reserve0 /= 10 ** pool["decimals0"]
+    reserve1 /= 10 ** pool["decimals1"]
+    return (reserve0, reserve1) if base_side == "0" else (reserve1, reserve0)
+
+
+def slippage_curve(base_reserve: float, quote_reserve: float, fee: float, sizes: List[float]) -> List[Dict[str, float]]:
+    """恒定乘积公式下卖出不同数量基础代币的报价，所有规模基于同一个池子状态一次算出"""
+    spot = quote_reserve / base_reserve
+    curve = []
+    for size in sizes:
+        amount_in = size * (1 - fee)
+        amount_out = quote_reserve * amount_in / (base_reserve + amount_in)
+        execution_price = amount_out / size if size else spot
+        curve.append({
+            "size": size,
+            "amount_out": amount_out,
+            "execution_price": execution_price,
+            # 价格影响不含手续费，滑点为相对现价的总成本
+            "price_impact": amount_in / (base_reserve + amount_in),
+            "slippage": 1 - execution_price / spot,
+        })
+    return curve
+
+
+def impact_depth(base_reserve: float, fee: float, impact: float) -> float:
+    """价格影响恰好达到impact时的卖出数量（恒定乘积闭式解）"""
+    return impact * base_reserve / (1 - impact) / (1 - fee)
+
+
+@mcp.tool()
+def get_dex_liquidity(pools: list, base_tokens: Optional[list] = None, trade_sizes: Optional[list] = None,
+                      network: str = "mainnet") -> str:
+    """通过一次Multicall3调用批量读取Uniswap v2/v3类池子的储备或slot0/liquidity，计算每个代币的滑点曲线和流动性深度
+    
+    Args:
+        pools: 池子合约地址列表（自动识别v2交易对或v3池子）
+        base_tokens: RWA代币地址列表（卖出方向）；池子包含其中某个代币时以它为基础代币，否则使用token0
+        trade_sizes: 卖出的基础代币数量列表；默认按基础代币储备的0.1%、0.5%、1%、2%、5%、10%
+        network: 网络名称
+    """
+    try:
+        if network not in NETWORKS:
+            return f"❌ 不支持的网络: {network}。支持的网络: {', '.join(NETWORKS.keys())}"
+        
+        if not pools:
+            return "❌ 池子列表为空"
+        
+        invalid = [pool for pool in list(pools) + list(base_tokens or []) if not is_address(str(pool))]
+        if invalid:
+            return f"❌ 无效的地址: {', '.join(map(str, invalid))}"
+        pool_addresses = list(dict.fromkeys(to_checksum_address(str(pool)) for pool in pools))
+        base_set = {to_checksum_address(str(token)) for token in base_tokens or []}
+        sizes = sorted(float(size) for size in trade_sizes or [] if float(size) > 0)
+        
+        started = time.perf_counter()
+        states = read_pool_states(network, pool_addresses)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        summary_rows = []
+        sections = []
+        for address in pool_addresses:
+            pool = states[address]
+            if "error" in pool:
+                summary_rows.append(f"| `{address}` | - | - | - | - | " + " | ".join("-" for _ in DEPTH_IMPACT_LEVELS) + f" | ❌ {pool['error']} |")
+                continue
+            base_side = "1" if pool["token1"] in base_set and pool["token0"] not in base_set else "0"
+            quote_side = "1" if base_side == "0" else "0"
+            base_symbol, quote_symbol = pool["symbol" + base_side], pool["symbol" + quote_side]
+            base_reserve, quote_reserve = pool_virtual_reserves(pool, base_side)
+            if base_reserve <= 0 or quote_reserve <= 0:
+                summary_rows.append(f"| `{address}` | {pool['version']} | {base_symbol}/{quote_symbol} | - | - | "
+                                    + " | ".join("-" for _ in DEPTH_IMPACT_LEVELS) + " | ❌ 池子没有流动性 |")
+                continue
+            
+            curve = slippage_curve(base_reserve, quote_reserve, pool["fee"],
+                                   sizes or [base_reserve * fraction for fraction in DEFAULT_TRADE_FRACTIONS])
+            spot = quote_reserve / base_reserve
+            depths = " | ".join(f"{impact_depth(base_reserve, pool['fee'], level):,.4f}" for level in DEPTH_IMPACT_LEVELS)
+            summary_rows.append(
+                f"| `{address}` | {pool['version']} | {base_symbol}/{quote_symbol} | {pool['fee'] * 100:.2f}% | "
+                f"{spot:,.6g} | {depths} | {'缓存' if pool['cached'] else '链上'} |"
+            )
+            curve_rows = [
+                f"| {point['size']:,.4f} | {point['amount_out']:,.4f} | {point['execution_price']:,.6g} | "
+                f"{point['price_impact'] * 100:.3f}% | {point['slippage'] * 100:.3f}% |"
+                for point in curve
+            ]
+            sections.append(f"""### {base_symbol}/{quote_symbol}（`{address}`）
+
+| 卖出 {base_symbol} | 获得 {quote_symbol} | 成交均价 | 价格影响 | 总滑点（含手续费） |
+|------|------|------|------|------|
+{chr(10).join(curve_rows)}
+""")
+        
+        depth_headers = " | ".join(f"{level * 100:g}%影响深度" for level in DEPTH_IMPACT_LEVELS)
+        return f"""# DEX流动性与滑点曲线
+
+**网络**: {NETWORKS[network]['name']}
+**池子数量**: {len(pool_addresses)}（Multicall3批量读取）
+**查询耗时**: {elapsed_ms:.0f} ms
+
+| 池子 | 版本 | 交易对（基础/计价） | 手续费 | 现价 | {depth_headers} | 数据 |
+|------|------|------|------|------|{"------|" * len(DEPTH_IMPACT_LEVELS)}------|
+{chr(10).join(summary_rows)}
+
+## 滑点曲线
+
+{chr(10).join(sections) if sections else '无可用的池子数据'}
+**说明**:
+- 影响深度为价格影响达到该比例时可卖出的基础代币数量
+- v3池子按当前价格区间的活跃流动性估算，大额交易跨越tick后实际滑点可能更高
+- 池子状态按区块缓存，同一区块内重复查询不再请求链上数据
+
+**查询时间**: {datetime.now().isoformat()}
+"""
+        
+    except Exception as e:
+        return f"❌ 查询失败: {str(e)}"
+
+
+# ==================== Gas历史与延迟执行 ====================
+
+# Gas采样间隔（秒）和历史保留天数；没有延迟任务排队时以较低频率持续采样，为“便宜”阈值积累历史
+GAS_SAMPLE_INTERVAL = float(os.getenv('GAS_SAMPLE_INTERVAL', '60'))
+GAS_IDLE_SAMPLE_INTERVAL = float(os.getenv('GAS_IDLE_SAMPLE_INTERVAL', '300'))
+GAS_HISTORY_DAYS = float(os.getenv('GAS_HISTORY_DAYS', '14'))
+# 采样网络，默认所有测试网络和以太坊主网
+GAS_SAMPLE_NETWORKS = [
+    network.strip() for network in os.getenv('GAS_SAMPLE_NETWORKS', '').split(',') if network.strip()
+] or [network for network in NETWORKS if network in TESTNETWORKS or network == "mainnet"]
+# 只给截止时间时，低于最近24小时该分位数的Gas价格视为“便宜”
+GAS_CHEAP_PERCENTILE = float(os.getenv('GAS_CHEAP_PERCENTILE', '25'))
+# 调度器检查间隔（秒）
+SCHEDULER_INTERVAL = float(os.getenv('SCHEDULER_INTERVAL', '30'))
+
+_background_lock = threading.Lock()
+_gas_sampler_started = False
+_scheduler_started = False
+
+
+def sample_gas_prices(networks: List[str]) -> Dict[str, Dict[str, int]]:
+    """采集各网络当前的基础费用和Gas价格并写入时间序列"""
+    samples = {}
+    for network in networks:
+        try:
+            responses = rpc_batch(NETWORKS[network]["rpc_url"], [
+                ("eth_gasPrice", []), ("eth_getBlockByNumber", ["latest", False])
+            ], timeout=10)
+            if "error" in responses[0]:
+                continue
+            block = responses[1].get("result") or {}
+            base_fee = int(block["baseFeePerGas"], 16) if block.get("baseFeePerGas") else None
+            samples[network] = {"gas_price": int(responses[0]["result"], 16), "base_fee": base_fee}
+        except Exception as e:
+            logger.debug(f"Gas采样失败 ({network}): {e}")
+    
+    if samples:
+        now = int(time.time())
+        conn = get_registry_connection()
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO gas_samples (network, sampled_at, base_fee, gas_price) VALUES (?, ?, ?, ?)",
+                [(network, now, sample["base_fee"], sample["gas_price"]) for network, sample in samples.items()],
+            )
+            conn.execute("DELETE FROM gas_samples WHERE sampled_at < ?", (now - int(GAS_HISTORY_DAYS * 86400),))
+            conn.commit()
+        finally:
+            conn.close()
+    return samples
+
+
+def load_gas_history(network: str, since: float) -> List[sqlite3.Row]:
+    conn = get_registry_connection()
+    try:
+        return conn.execute(
+            "SELECT sampled_at, base_fee, gas_price FROM gas_samples WHERE network = ? AND sampled_at >= ? "
+            "ORDER BY sampled_at", (network, int(since))
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def percentile(values: List[int], pct: float) -> int:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def cheap_gas_threshold(network: str) -> Optional[int]:
+    """最近24小时Gas价格的低分位数，样本不足时返回None"""
+    history = load_gas_history(network, time.time() - 86400)
+    if len(history) < 10:
+        return None
+    return percentile([row["gas_price"] for row in history], GAS_CHEAP_PERCENTILE)
+
+
+def current_gas_price(network: str) -> int:
+    """最近一次采样的Gas价格（不超过一个采样周期），否则实时查询"""
+    history = load_gas_history(network, time.time() - GAS_SAMPLE_INTERVAL)
+    if history:
+        return history[-1]["gas_price"]
+    samples = sample_gas_prices([network])
+    if network not in samples:
+        raise ConnectionError(f"无法获取{network}网络的Gas价格")
+    return samples[network]["gas_price"]
+
+
+def has_scheduled_jobs() -> bool:
+    conn = get_registry_connection()
+    try:
+        return conn.execute(
+            "SELECT 1 FROM scheduled_jobs WHERE status IN ('pending', 'running') LIMIT 1"
+        ).fetchone() is not None
+    finally:
+        conn.close()
+
+
+def _gas_sampler_loop() -> None:
+    while True:
+        sample_gas_prices(GAS_SAMPLE_NETWORKS)
+        # 有待执行的延迟任务时提高采样频率
+        try:
+            active = has_scheduled_jobs()
+        except Exception as e:
+            logger.warning(f"Gas采样器查询延迟任务失败: {e}")
+            active = True
+        time.sleep(GAS_SAMPLE_INTERVAL if active else GAS_IDLE_SAMPLE_INTERVAL)
+
+
+def start_gas_sampler() -> None:
+    """启动后台Gas采样（配置钱包时随服务启动并持续运行）"""
+    global _gas_sampler_started
+    with _background_lock:
+        if not _gas_sampler_started:
+            threading.Thread(target=_gas_sampler_loop, name="gas-sampler", daemon=True).start()
+            _gas_sampler_started = True
+
+
+def schedule_if_expensive(kind: str, network: str, params: Dict[str, Any],
+                          max_fee_gwei: Optional[float], deadline_minutes: Optional[float]) -> Optional[str]:
+    """当前Gas价格高于阈值时把操作放入延迟执行队列并返回说明，否则返回None表示立即执行
+    
+    阈值为max_fee_gwei；未指定时使用最近24小时的低分位数。样本不足时无法判断是否便宜，
+    任务排队等待历史积累，最迟在截止时间执行。
+    """
+    max_fee = Web3.to_wei(Decimal(str(max_fee_gwei)), 'gwei') if max_fee_gwei is not None else None
+    threshold = max_fee if max_fee is not None else cheap_gas_threshold(network)
+    gas_price = current_gas_price(network)
+    if threshold is not None and gas_price <= threshold:
+        return None
+    
+    deadline = time.time() + deadline_minutes * 60 if deadline_minutes is not None else None
+    conn = get_registry_connection()
+    try:
+        cursor = conn.execute(
+            "INSERT INTO scheduled_jobs (kind, network, params, max_fee, deadline, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 'pending', ?)",
+            (kind, network, json.dumps(params), max_fee, deadline, time.time()),
+        )
+        job_id = cursor.lastrowid
+        conn.commit()
+    finally:
+        conn.close()
+    start_gas_sampler()
+    start_scheduler()
+    
+    deadline_text = (f"{datetime.fromtimestamp(deadline).isoformat()}（到期后无论Gas价格立即执行）"
+                     if deadline else "无（直到Gas价格达标）")
+    if threshold is None:
+        condition = f"Gas价格 ≤ 最近24小时第{GAS_CHEAP_PERCENTILE:.0f}百分位（采样历史不足，积累后再判断）"
+    elif max_fee is not None:
+        condition = f"Gas价格 ≤ {Web3.from_wei(threshold, 'gwei'):.4f} Gwei"
+    else:
+        condition = f"Gas价格 ≤ {Web3.from_wei(threshold, 'gwei'):.4f} Gwei（最近24小时第{GAS_CHEAP_PERCENTILE:.0f}百分位）"
+    return f"""# 已加入延迟执行队列 ⏳
+
+**任务编号**: {job_id}
+**操作**: {kind}
+**网络**: {NETWORKS[network]['name']}
+**当前Gas价格**: {Web3.from_wei(gas_price, 'gwei'):.4f} Gwei
+**执行条件**: {condition}
+**截止时间**: {deadline_text}
+
+可使用 `get_scheduled_jobs` 查看执行结果，或 `cancel_scheduled_job({job_id})` 取消。
+"""
+
+
+def _scheduled_tools() -> Dict[str, Any]:
+    # 兼容不同fastmcp版本：装饰器可能返回原函数，也可能返回带fn属性的Tool对象
+    tools = {
+        "deploy_erc20_contract": deploy_erc20_contract,
+        "deploy_erc20_batch": deploy_erc20_batch,
+        "execute_income_distribution": execute_income_distribution,
+    }
+    return {kind: getattr(tool, "fn", tool) for kind, tool in tools.items()}
+
+
+def run_due_jobs() -> int:
+    """执行所有满足Gas条件或已到截止时间的延迟任务（按创建顺序逐个执行，避免nonce冲突）
+    
+    因Gas价格达标而执行的任务，发送的Gas价格（包括加价替换）不超过任务的max_fee。
+    """
+    conn = get_registry_connection()
+    try:
+        jobs = conn.execute("SELECT * FROM scheduled_jobs WHERE status = 'pending' ORDER BY job_id").fetchall()
+    finally:
+        conn.close()
+    if jobs:
+        start_gas_sampler()
+    
+    executed = 0
+    gas_prices: Dict[str, Optional[int]] = {}
+    thresholds: Dict[str, Optional[int]] = {}
+    for job in jobs:
+        network = job["network"]
+        try:
+            if network not in gas_prices:
+                gas_prices[network] = current_gas_price(network)
+                thresholds[network] = cheap_gas_threshold(network)
+        except Exception as e:
+            logger.warning(f"调度器获取Gas价格失败 ({network}): {e}")
+            gas_prices[network] = None
+        
+        threshold = job["max_fee"] if job["max_fee"] is not None else thresholds.get(network)
+        gas_price = gas_prices[network]
+        expired = job["deadline"] is not None and time.time() >= job["deadline"]
+        # 没有阈值（采样历史不足）时不视为便宜，等到截止时间
+        cheap = gas_price is not None and threshold is not None and gas_price <= threshold
+        if not (cheap or expired):
+            continue
+        
+        conn = get_registry_connection()
+        try:
+            # 抢占任务，避免重复执行（例如被取消后）
+            claimed = conn.execute(
+                "UPDATE scheduled_jobs SET status = 'running' WHERE job_id = ? AND status = 'pending'", (job["job_id"],)
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        if not claimed:
+            continue
+        
+        logger.info(f"执行延迟任务 {job['job_id']} ({job['kind']})，原因: {'Gas价格达标' if cheap else '已到截止时间'}")
+        try:
+            # 已到截止时间的任务按当时价格执行，不限制Gas价格
+            with gas_price_cap(job["max_fee"] if cheap else None):
+                result = _scheduled_tools()[job["kind"]](**json.loads(job["params"]))
+        except Exception as e:
+            result = f"❌ 执行失败: {e}"
+        status = "failed" if result.startswith("❌") else "done"
+        
+        conn = get_registry_connection()
+        try:
+            conn.execute(
+                "UPDATE scheduled_jobs SET status = ?, executed_at = ?, executed_gas_price = ?, result = ? WHERE job_id = ?",
+                (status, time.time(), gas_price, result, job["job_id"]),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        executed += 1
+    return executed
+
+
+def recover_interrupted_jobs() -> int:
+    """处理上次进程退出时仍为running的延迟任务，返回处理数量
+    
+    收益分配会先核对已广播的转账，可以安全地重新排队；部署任务可能已经广播，标记为failed并提示人工核对，避免重复部署。
+    """
+    conn = get_registry_connection()
+    try:
+        jobs = conn.execute("SELECT job_id, kind FROM scheduled_jobs WHERE status = 'running'").fetchall()
+        for job in jobs:
+            if job["kind"] == "execute_income_distribution":
+                conn.execute("UPDATE scheduled_jobs SET status = 'pending' WHERE job_id = ?", (job["job_id"],))
+            else:
+                conn.execute(
+                    "UPDATE scheduled_jobs SET status = 'failed', executed_at = ?, result = ? WHERE job_id = ?",
+                    (time.time(), "❌ 执行过程中服务进程退出，结果未知，请在区块浏览器核对钱包交易后再决定是否重新提交",
+                     job["job_id"]),
+                )
+        conn.commit()
+    finally:
+        conn.close()
+    if jobs:
+        logger.warning(f"已处理 {len(jobs)} 个上次运行中断的延迟任务")
+    return len(jobs)
+
+
+def _scheduler_loop() -> None:
+    while True:
+        time.sleep(SCHEDULER_INTERVAL)
+        try:
+            run_due_jobs()
+        except Exception as e:
+            logger.warning(f"调度器运行失败: {e}")
+
+
+def start_scheduler() -> None:
+    global _scheduler_started
+    with _background_lock:
+        if not _scheduler_started:
+            threading.Thread(target=_scheduler_loop, name="tx-scheduler", daemon=True).start()
+            _scheduler_started = True
+
+
+@mcp.tool()
+def get_gas_history(network: str = "sepolia", hours: float = 24) -> str:
+    """查看本地采样的Gas价格历史（统计分位数和按小时聚合），用于判断何时执行非紧急交易
+    
+    Args:
+        network: 网络名称
+        hours: 回溯小时数
+    """
+    try:
+        if network not in NETWORKS:
+            return f"❌ 不支持的网络: {network}。支持的网络: {', '.join(NETWORKS.keys())}"
+        
+        history = load_gas_history(network, time.time() - hours * 3600)
+        if not history:
+            return (f"# Gas价格历史\n\n{NETWORKS[network]['name']} 暂无采样数据"
+                    f"（配置钱包后采样器每 {GAS_IDLE_SAMPLE_INTERVAL:.0f} 秒采样一次，"
+                    f"有延迟任务排队时每 {GAS_SAMPLE_INTERVAL:.0f} 秒一次）")
+        
+        gas_prices = [row["gas_price"] for row in history]
+        buckets: Dict[int, List[int]] = {}
+        for row in history:
+            buckets.setdefault(row["sampled_at"] // 3600, []).append(row["gas_price"])
+        rows = [
+            f"| {datetime.fromtimestamp(hour * 3600).strftime('%m-%d %H:00')} | "
+            f"{Web3.from_wei(min(values), 'gwei'):.4f} | {Web3.from_wei(sum(values) // len(values), 'gwei'):.4f} | "
+            f"{Web3.from_wei(max(values), 'gwei'):.4f} |"
+            for hour, values in sorted(buckets.items())[-48:]
+        ]
+        
+        def gwei(value: int) -> str:
+            return f"{Web3.from_wei(value, 'gwei'):.4f} Gwei"
+        
+        return f"""# Gas价格历史
+
+**网络**: {NETWORKS[network]['name']}
+**样本数**: {len(history):,}（最近 {hours:g} 小时）
+**最新**: {gwei(gas_prices[-1])}
+**最低 / 中位数 / 最高**: {gwei(min(gas_prices))} / {gwei(percentile(gas_prices, 50))} / {gwei(max(gas_prices))}
+**第{GAS_CHEAP_PERCENTILE:.0f}百分位（延迟执行默认阈值）**: {gwei(percentile(gas_prices, GAS_CHEAP_PERCENTILE))}
+
+| 小时 | 最低 (Gwei) | 平均 (Gwei) | 最高 (Gwei) |
+|------|------|------|------|
+{chr(10).join(rows)}
+"""
+        
+    except Exception as e:
+        return f"❌ 查询失败: {str(e)}"
+
+
+@mcp.tool()
+def get_scheduled_jobs(limit: int = 20) -> str:
+    """查看延迟执行队列中的任务及其执行结果
+    
+    Args:
+        limit: 显示的最近任务数量
+    """
+    try:
+        conn = get_registry_connection()
+        try:
+            jobs = conn.execute("SELECT * FROM scheduled_jobs ORDER BY job_id DESC LIMIT ?", (int(limit),)).fetchall()
+        finally:
+            conn.close()
+        
+        if not jobs:
+            return "# 延迟执行队列\n\n暂无任务"
+        
+        status_labels = {"pending": "⏳ 等待中", "running": "🔄 执行中", "done": "✅ 已执行",
+                         "failed": "❌ 执行失败", "cancelled": "🚫 已取消"}
+        rows = []
+        details = []
+        for job in jobs:
+            threshold = f"{Web3.from_wei(job['max_fee'], 'gwei'):.4f} Gwei" if job["max_fee"] is not None else "24小时低分位"
+            deadline = datetime.fromtimestamp(job["deadline"]).strftime('%m-%d %H:%M') if job["deadline"] else "-"
+            executed_price = (f"{Web3.from_wei(job['executed_gas_price'], 'gwei'):.4f} Gwei"
+                              if job["executed_gas_price"] is not None else "-")
+            rows.append(f"| {job['job_id']} | {job['kind']} | {job['network']} | {threshold} | {deadline} | "
+                        f"{executed_price} | {status_labels.get(job['status'], job['status'])} |")
+            if job["result"]:
+                details.append(f"### 任务 {job['job_id']}\n\n{job['result']}")
+        
+        return f"""# 延迟执行队列
+
+| 编号 | 操作 | 网络 | Gas阈值 | 截止时间 | 执行时Gas价格 | 状态 |
+|------|------|------|------|------|------|------|
+{chr(10).join(rows)}
+
+{chr(10).join(details)}
+"""
+        
+    except Exception as e:
+        return f"❌ 查询失败: {str(e)}"
+
+
+@mcp.tool()
+def cancel_scheduled_job(job_id: int) -> str:
+    """取消尚未执行的延迟任务
+    
+    Args:
+        job_id: 任务编号
+    """
+    try:
+        conn = get_registry_connection()
+        try:
+            cancelled = conn.execute(
+                "UPDATE scheduled_jobs SET status = 'cancelled' WHERE job_id = ? AND status = 'pending'", (job_id,)
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        
+        if not cancelled:
+            return f"❌ 任务 {job_id} 不存在或已开始执行"
+        return f"✅ 已取消延迟任务 {job_id}"
+        
+    except Exception as e:
+        return f"❌ 取消失败: {str(e)}"
+
+# 启动服务器时显示配置信息
+if __name__ == "__main__":
+    if INFURA_API_KEY:
+        logger.info(f"Starting Web3 MCP Server with Infura API (Key: {INFURA_API_KEY[:8]}...)")
+        logger.info(f"Supported networks: {', '.join(NETWORKS.keys())}")
+    else:
+        logger.warning("Starting Web3 MCP Server with public endpoints")
+    
+    if WALLET_PRIVATE_KEY:
+        account_address = Web3().eth.account.from_key('0x' + WALLET_PRIVATE_KEY if not WALLET_PRIVATE_KEY.startswith('0x') else WALLET_PRIVATE_KEY).address
+        logger.info(f"Wallet Address: {account_address}")
+        logger.info(f"Testnet deployment networks: {', '.join(TESTNETWORKS.keys())}")
+    elif WEB3_MCP_READ_ONLY:
+        logger.info("Read-only mode: wallet key and background tasks disabled")
+    else:
+        logger.warning("No wallet private key configured. Contract deployment disabled.")
+    
+    # 恢复上次运行遗留的存证队列和延迟任务，并持续采样Gas价格
+    if WALLET_PRIVATE_KEY:
+        recover_interrupted_jobs()
+        start_notarization_timer()
+        start_gas_sampler()
+        start_scheduler()
     
     # 配置使用streamable-http模式
     mcp.run(transport="stdio")
\ No newline at end of file